@@ -1,10 +1,15 @@
 from typing import List, Dict, Any, Optional
 import os
-from starlette.background import BackgroundTask
 from fastapi import Request, Depends, Response, HTTPException, Query
 from fastapi.routing import APIRouter
-from fastapi.responses import PlainTextResponse, StreamingResponse
-from schemas.document import QueryRequest, KnowledgeBaseRegistration, KnowledgeBaseStatus
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from schemas.document import QueryRequest, KnowledgeBaseRegistration, KnowledgeBaseStatus, RetrievalFilters
+from utils.streaming import TokenCoalescer
+from utils.telemetry import metrics_payload, trace_request
+from utils.admission import AdmissionController, AdmissionRejected
+from utils.uploads import UploadError
+from utils.metadata_filters import build_qdrant_filter
 from loguru import logger
 from pydantic import BaseModel
 import json
@@ -15,6 +20,65 @@ router = APIRouter()
 def get_kb_manager(request: Request):
     return request.app.state.kb_manager
   
+# Poll interval and idle timeout (seconds) when tailing a resumed stream
+RESUME_POLL_INTERVAL = 0.25
+RESUME_IDLE_TIMEOUT = 60.0
+
+# Tokens are coalesced into SSE frames of up to this many characters, or whatever
+# arrived within this many milliseconds of the first buffered token
+STREAM_FRAME_MAX_CHARS = int(os.getenv("KB_STREAM_FRAME_MAX_CHARS", "32"))
+STREAM_FRAME_MAX_DELAY = int(os.getenv("KB_STREAM_FRAME_MAX_DELAY_MS", "50")) / 1000
+
+# Upper bound on the number of queries in one /api/retrieve_batch call
+RETRIEVE_BATCH_MAX_QUERIES = int(os.getenv("KB_RETRIEVE_BATCH_MAX_QUERIES", "64"))
+
+# Admission control: requests beyond the concurrency limit wait in a bounded queue
+# for up to the timeout (seconds), anything more is rejected with Retry-After.
+# Each workspace may hold at most its quota of running or waiting requests
+query_admission = AdmissionController(
+    "query",
+    max_concurrency=int(os.getenv("KB_QUERY_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("KB_QUERY_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("KB_QUERY_QUEUE_TIMEOUT", "10")),
+    workspace_quota=int(os.getenv("KB_QUERY_WORKSPACE_QUOTA", "8")) or None
+)
+retrieve_admission = AdmissionController(
+    "retrieve",
+    max_concurrency=int(os.getenv("KB_RETRIEVE_MAX_CONCURRENCY", "16")),
+    max_queue=int(os.getenv("KB_RETRIEVE_MAX_QUEUE", "128")),
+    queue_timeout=float(os.getenv("KB_RETRIEVE_QUEUE_TIMEOUT", "5")),
+    workspace_quota=int(os.getenv("KB_RETRIEVE_WORKSPACE_QUOTA", "32")) or None
+)
+
+async def admit(controller: AdmissionController, workspace_id: Optional[str]) -> float:
+    """Take an admission slot or fail fast with 429/503 and Retry-After"""
+    try:
+        return await controller.acquire(workspace_id)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected {controller.endpoint} request for workspace {workspace_id}: {e.reason}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Knowledge base service is busy ({e.reason}), retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def validate_filters(filters: Optional[RetrievalFilters]) -> None:
+    """Reject filters that cannot be applied with a 400, rather than searching unfiltered"""
+    try:
+        build_qdrant_filter(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filters: {str(e)}")
+
+def parse_filters(filters: Optional[dict]) -> Optional[RetrievalFilters]:
+    if not filters:
+        return None
+    try:
+        parsed = RetrievalFilters(**filters)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filters: {str(e)}")
+    validate_filters(parsed)
+    return parsed
+
 @router.post("/api/register")
 async def register(request: Request, registration: KnowledgeBaseRegistration) -> Dict[str, Any]:
     kb_manager = request.app.state.kb_manager
@@ -56,6 +120,24 @@ async def view(request: Request, workspace_id: str, kb_id: Optional[str] = Query
     
     return response
 
+@router.get("/api/folders/{workspace_id}/{kb_id}")
+async def folder_subtree(
+    request: Request,
+    workspace_id: str,
+    kb_id: str,
+    path: str = Query("", description="Folder id, the KB root when empty"),
+    depth: Optional[int] = Query(None, ge=0, description="Levels of subfolders to expand")
+) -> Dict[str, Any]:
+    kb_manager = request.app.state.kb_manager
+    
+    if not path.strip("/"):
+        return {"id": "", "folders": kb_manager.get_folder_structure(kb_id, workspace_id, depth)}
+    
+    folder = kb_manager.get_folder_subtree(workspace_id, kb_id, path, depth)
+    if folder is None:
+        raise HTTPException(status_code=404, detail=f"Folder {path} not found")
+    return folder
+
 @router.get("/api/kb_status/{workspace_id}/{kb_id}")
 async def kb_status(request: Request, workspace_id: str, kb_id: str) -> KnowledgeBaseStatus:
     kb_manager = request.app.state.kb_manager
@@ -88,45 +170,140 @@ async def kb_sync(request: Request) -> Dict[str, Any]:
     
     return {"status": "success", "message": "Knowledge base synchronized"}
 
-async def cleanup_session(kb_manager, session_id):
-    kb_manager.remove_message(session_id)
+# Strong references to running generation tasks so they are not garbage collected
+_generation_tasks = set()
 
-async def stream_tokens(kb_manager, query, session_id):
-    accumulated_content = ""
-    
-    yield "event: start\ndata: {}\n\n"
-    gen = await kb_manager.stream_answer_with_context(query)
+def _token_text(chunk) -> str:
+    if hasattr(chunk, 'delta'):
+        return chunk.delta
+    elif hasattr(chunk, 'text'):
+        return chunk.text
+    elif isinstance(chunk, dict) and 'text' in chunk:
+        return chunk['text']
+    elif isinstance(chunk, str):
+        return chunk
+    logger.warning(f"Unexpected token type: {type(chunk)}, value: {chunk}")
+    return str(chunk)
+
+async def generate_tokens(kb_manager, query, session_id, frames: asyncio.Queue):
+    """Run retrieval and generation for a streaming session
     
-    try:
-        async for chunk in gen:
-            logger.info(f"Chunk received: {chunk}")
-            if hasattr(chunk, 'delta'):
-                token = chunk.delta
-            elif hasattr(chunk, 'text'):
-                token = chunk.text
-            elif isinstance(chunk, dict) and 'text' in chunk:
-                token = chunk['text']
-            elif isinstance(chunk, str):
-                token = chunk
-            else:
-                logger.warning(f"Unexpected token type: {type(chunk)}, value: {chunk}")
-                token = str(chunk)
+    Runs as its own task and records every chunk in the session store, so the
+    answer is still completed and resumable if the client disconnects.
+    """
+    with trace_request("query.stream", workspace_id=query.workspace_id):
+        try:
+            # Send retrieval hits per knowledge base as they arrive, then start generating
+            # as soon as the retrieval quorum or deadline is reached
+            query_text = query.query[-1] if isinstance(query.query, list) else query.query
+            results = []
+            async for source, source_results in kb_manager.iter_retrieval(
+                query.workspace_id,
+                query_text,
+                query.knowledge_bases,
+                query.top_k,
+                query.filters,
+                query.hierarchical
+            ):
+                results.extend(source_results)
+                data = json.dumps({"source": source, "results": source_results}, default=str)
+                await frames.put(f"event: retrieval\ndata: {data}\n\n")
+        
+            gen = await kb_manager.stream_answer_from_results(query, results)
+        
+            coalescer = TokenCoalescer(STREAM_FRAME_MAX_CHARS, STREAM_FRAME_MAX_DELAY)
+        
+            async def emit(frame):
+                # Each frame is one chunk of the session, so resume offsets match frames
+                if frame:
+                    index = kb_manager.append_message_content(session_id, frame)
+                    data = json.dumps({"token": frame, "index": index})
+                    await frames.put(f"event: token\ndata: {data}\n\n")
+        
+            chunks = gen.__aiter__()
+            next_chunk = asyncio.ensure_future(chunks.__anext__())
+            try:
+                while True:
+                    # Wake up when the buffered frame is due even if no token arrives
+                    done, _ = await asyncio.wait({next_chunk}, timeout=coalescer.time_left())
+                    if not done:
+                        await emit(coalescer.flush())
+                        continue
                 
-            accumulated_content += token
-            
-            kb_manager.update_message_content(session_id, accumulated_content)
-            
-            data = json.dumps({"token": token})
+                    try:
+                        chunk = next_chunk.result()
+                    except StopAsyncIteration:
+                        break
+                    logger.debug(f"Chunk received: {chunk}")
+                    await emit(coalescer.add(_token_text(chunk)))
+                    next_chunk = asyncio.ensure_future(chunks.__anext__())
+            finally:
+                next_chunk.cancel()
+                await emit(coalescer.flush())
+        except Exception as e:
+            logger.error(f"Streaming error: {str(e)}")
+        finally:
+            kb_manager.complete_message(session_id)
+            await frames.put(None)
+
+def start_generation(kb_manager, query, session_id, on_done=None) -> asyncio.Queue:
+    """Start generating a session in the background, returns the queue its frames arrive on"""
+    frames = asyncio.Queue()
+    task = asyncio.create_task(generate_tokens(kb_manager, query, session_id, frames))
+    _generation_tasks.add(task)
+    task.add_done_callback(_generation_tasks.discard)
+    if on_done is not None:
+        task.add_done_callback(lambda _: on_done())
+    return frames
+
+async def stream_tokens(session_id, frames: asyncio.Queue):
+    data = json.dumps({"message_id": session_id})
+    yield f"event: start\ndata: {data}\n\n"
+    
+    while True:
+        frame = await frames.get()
+        if frame is None:
+            break
+        yield frame
+    
+    yield "event: end\ndata: {}\n\n"
+
+async def replay_tokens(kb_manager, message_id: str, offset: int):
+    """Replay a stored session from a chunk offset, then follow it until complete"""
+    data = json.dumps({"message_id": message_id})
+    yield f"event: start\ndata: {data}\n\n"
+    
+    idle = 0.0
+    while True:
+        message = kb_manager.get_message_by_id(message_id, offset)
+        if message is None:
+            break
+        
+        if message["current_content"]:
+            offset = message["chunk_count"]
+            idle = 0.0
+            data = json.dumps({"token": message["current_content"], "index": offset})
             yield f"event: token\ndata: {data}\n\n"
-            
-            await asyncio.sleep(0.01)
-    except Exception as e:
-        logger.error(f"Streaming error: {str(e)}")
-    finally:
-        if session_id in kb_manager._message_store:
-            kb_manager._message_store[session_id]["is_complete"] = True
         
-        yield "event: end\ndata: {}\n\n"
+        if message["is_complete"] or idle >= RESUME_IDLE_TIMEOUT:
+            break
+        
+        await asyncio.sleep(RESUME_POLL_INTERVAL)
+        idle += RESUME_POLL_INTERVAL
+    
+    yield "event: end\ndata: {}\n\n"
+
+@router.get("/api/stream/{message_id}")
+async def resume_stream(request: Request, message_id: str, offset: int = Query(0, ge=0)):
+    """Resume a streaming answer by message id, starting after `offset` received chunks"""
+    kb_manager = request.app.state.kb_manager
+    if kb_manager.get_message_by_id(message_id) is None:
+        raise HTTPException(status_code=404, detail="Stream session not found")
+    
+    return StreamingResponse(
+        replay_tokens(kb_manager, message_id, offset),
+        media_type="text/event-stream"
+    )
 
 @router.post("/api/update_kb_status")
 async def update_kb_status(request: Request, kb_data: dict) -> Dict[str, Any]:
@@ -150,29 +327,204 @@ async def delete_kb(request: Request, kb_data: dict) -> Dict[str, Any]:
     if not kb_id:
         return {"status": "error", "message": "Knowledge base ID is required"}
     
-    result = kb_manager.delete_knowledge_base(kb_id, workspace_id)
+    result = await kb_manager.delete_knowledge_base(kb_id, workspace_id)
     return result
 
+@router.post("/api/warm_up")
+async def warm_up(request: Request, data: dict) -> Dict[str, Any]:
+    """Warm up the given running knowledge bases, or all running ones in the workspace"""
+    kb_manager = request.app.state.kb_manager
+    workspace_id = data.get("workspace_id")
+    if not workspace_id:
+        return {"status": "error", "message": "Workspace ID is required"}
+    
+    kb_ids = kb_manager._resolve_sources(workspace_id, data.get("knowledge_bases"))
+    await kb_manager.warm_up([(workspace_id, kb_id) for kb_id in kb_ids])
+    return {"status": "success", "knowledge_bases": kb_ids}
+
+@router.post("/api/kb_snapshot/export")
+async def export_kb_snapshot(request: Request, data: dict):
+    """Export a KB snapshot into the snapshot directory, or download it with download=true"""
+    kb_manager = request.app.state.kb_manager
+    download = bool(data.get("download"))
+    path = None
+    if download:
+        path = os.path.join(kb_manager.snapshot_dir, f"download_{os.urandom(8).hex()}.kbsnap")
+    
+    result = await asyncio.to_thread(kb_manager.export_knowledge_base, data.get("workspace_id"), data.get("kb_id"), path)
+    if result["status"] != "success" or not download:
+        return result
+    
+    return FileResponse(
+        result["path"],
+        media_type="application/octet-stream",
+        filename=f"{data.get('kb_id')}.kbsnap",
+        background=BackgroundTask(os.remove, result["path"])
+    )
+
+@router.post("/api/kb_export/parquet")
+async def export_kb_parquet(request: Request, data: dict):
+    """Export a KB's chunks and vectors as Parquet into the snapshot directory, or download it with download=true"""
+    kb_manager = request.app.state.kb_manager
+    download = bool(data.get("download"))
+    path = None
+    if download:
+        path = os.path.join(kb_manager.snapshot_dir, f"download_{os.urandom(8).hex()}.parquet")
+    
+    result = await asyncio.to_thread(kb_manager.export_knowledge_base_parquet, data.get("workspace_id"), data.get("kb_id"), path)
+    if result["status"] != "success" or not download:
+        return result
+    
+    return FileResponse(
+        result["path"],
+        media_type="application/vnd.apache.parquet",
+        filename=f"{data.get('kb_id')}.parquet",
+        background=BackgroundTask(os.remove, result["path"])
+    )
+
+@router.post("/api/kb_snapshot/import")
+async def import_kb_snapshot(
+    request: Request,
+    workspace_id: Optional[str] = Query(None),
+    kb_id: Optional[str] = Query(None),
+    name: Optional[str] = Query(None),
+    url: Optional[str] = Query(None, description="Source directory of the imported KB, required when kb_id or workspace_id differ from the snapshot's"),
+    snapshot: Optional[str] = Query(None, description="Snapshot file name in the snapshot directory, instead of a request body")
+) -> Dict[str, Any]:
+    """Import a KB from a snapshot in the snapshot directory or streamed as the raw request body
+    
+    KB ids are global across workspaces, import next to the source KB under a new kb_id.
+    """
+    kb_manager = request.app.state.kb_manager
+    
+    uploaded = None
+    if snapshot:
+        path = os.path.join(kb_manager.snapshot_dir, os.path.basename(snapshot))
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail=f"Snapshot {snapshot} not found")
+    else:
+        os.makedirs(kb_manager.snapshot_dir, exist_ok=True)
+        uploaded = path = os.path.join(kb_manager.snapshot_dir, f"upload_{os.urandom(8).hex()}.kbsnap")
+        with open(path, "wb") as f:
+            async for chunk in request.stream():
+                f.write(chunk)
+    
+    try:
+        return await asyncio.to_thread(kb_manager.import_knowledge_base, path, workspace_id, kb_id, name, url)
+    finally:
+        if uploaded:
+            os.remove(uploaded)
+
+def _upload_http_error(e: UploadError) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.message)
+
+@router.post("/api/uploads")
+async def create_upload(request: Request, data: dict) -> Dict[str, Any]:
+    """Start a resumable upload of a file into a KB
+    
+    Send the bytes with PATCH /api/uploads/{upload_id}?offset=N, in one or
+    many requests, then POST .../complete to index the file into the KB
+    without rebuilding it. After a dropped connection GET the upload for the
+    offset to continue from.
+    """
+    kb_manager = request.app.state.kb_manager
+    try:
+        upload = kb_manager.create_upload(
+            data.get("workspace_id"),
+            data.get("kb_id"),
+            data.get("filename"),
+            data.get("folder"),
+            data.get("size")
+        )
+    except UploadError as e:
+        raise _upload_http_error(e)
+    return {"status": "success", "upload": upload}
+
+@router.get("/api/uploads/{upload_id}")
+async def get_upload(request: Request, upload_id: str) -> Dict[str, Any]:
+    upload = request.app.state.kb_manager.upload_store.get(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return {"status": "success", "upload": upload}
+
+@router.patch("/api/uploads/{upload_id}")
+async def append_upload(request: Request, upload_id: str, offset: int = Query(..., ge=0)) -> Dict[str, Any]:
+    """Append the raw request body to an upload at offset"""
+    upload_store = request.app.state.kb_manager.upload_store
+    try:
+        offset = await upload_store.append(upload_id, offset, request.stream())
+    except UploadError as e:
+        raise _upload_http_error(e)
+    return {"status": "success", "offset": offset}
+
+@router.post("/api/uploads/{upload_id}/complete")
+async def complete_upload(request: Request, upload_id: str) -> Dict[str, Any]:
+    """Index a fully sent upload into its KB, poll the upload for the result"""
+    try:
+        upload = await request.app.state.kb_manager.complete_upload(upload_id)
+    except UploadError as e:
+        raise _upload_http_error(e)
+    return {"status": "success", "upload": upload}
+
+@router.delete("/api/uploads/{upload_id}")
+async def delete_upload(request: Request, upload_id: str) -> Dict[str, Any]:
+    upload_store = request.app.state.kb_manager.upload_store
+    upload = upload_store.get(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload["status"] == "ingesting":
+        raise HTTPException(status_code=409, detail="Upload is being indexed")
+    upload_store.delete(upload_id)
+    return {"status": "success"}
+
+@router.post("/api/llm_cache")
+async def update_llm_cache(request: Request, cache_data: dict) -> Dict[str, Any]:
+    kb_manager = request.app.state.kb_manager
+    workspace_id = cache_data.get("workspace_id")
+    enabled = cache_data.get("enabled", True)
+    
+    if not workspace_id:
+        return {"status": "error", "message": "Workspace ID is required"}
+    
+    return kb_manager.set_response_cache_enabled(workspace_id, bool(enabled))
+
 @router.post("/api/query")
 async def query_knowledge_base(request: Request, query: QueryRequest):
     kb_manager = request.app.state.kb_manager
     logger.info(f"Query received: {query}")
+    validate_filters(query.filters)
+    admitted = await admit(query_admission, query.workspace_id)
     if query.streaming:
-        session_id = f"stream_{os.urandom(8).hex()}"
-        
-        kb_manager.store_message(session_id, {
-            "query": query.dict(),
-            "current_content": "",
-            "is_complete": False
-        })
+        try:
+            session_id = query.message_id or f"stream_{os.urandom(8).hex()}"
+            
+            kb_manager.store_message(session_id, {
+                "query": query.dict(),
+                "current_content": "",
+                "is_complete": False
+            })
+            
+            # The slot is held until generation finishes, even if the client disconnects
+            frames = start_generation(
+                kb_manager,
+                query,
+                session_id,
+                on_done=lambda: query_admission.release(query.workspace_id, admitted)
+            )
+        except Exception:
+            query_admission.release(query.workspace_id, admitted)
+            raise
         
         return StreamingResponse(
-            stream_tokens(kb_manager, query, session_id),
-            media_type="text/event-stream",
-            background=BackgroundTask(cleanup_session, kb_manager, session_id)
+            stream_tokens(session_id, frames),
+            media_type="text/event-stream"
         )
     else:
-        answer = kb_manager.answer_with_context(query)
+        try:
+            with trace_request("query", workspace_id=query.workspace_id):
+                answer = await asyncio.to_thread(kb_manager.answer_with_context, query)
+        finally:
+            query_admission.release(query.workspace_id, admitted)
         return {"status": "success", "results": answer}
 
 @router.post("/api/retrieve")
@@ -183,20 +535,25 @@ async def retrieve_from_knowledge_base(request: Request, query_data: dict) -> Di
     knowledge_bases = query_data.get("knowledge_bases")
     top_k = query_data.get("top_k", 5)
     workspace_id = query_data.get("workspace_id")
-    
     logger.info(f"Retrieving from knowledge base for workspace {workspace_id} with query: {query_text}")
     logger.info(f"Knowledge bases: {knowledge_bases}")
     
     if not query_text:
         return {"status": "error", "message": "Query text is required"}
+    filters = parse_filters(query_data.get("filters"))
     
+    admitted = await admit(retrieve_admission, workspace_id)
     try:
-        results = kb_manager.query_knowledge_base(
-            workspace_id,
-            query_text,
-            knowledge_bases,
-            top_k
-        )
+        with trace_request("retrieve", workspace_id=workspace_id):
+            results = await asyncio.to_thread(
+                kb_manager.query_knowledge_base,
+                workspace_id,
+                query_text,
+                knowledge_bases,
+                top_k,
+                filters,
+                bool(query_data.get("hierarchical"))
+            )
         
         formatted_results = []
         for result in results:
@@ -213,4 +570,54 @@ async def retrieve_from_knowledge_base(request: Request, query_data: dict) -> Di
         }
     except Exception as e:
         logger.error(f"Error retrieving from knowledge base: {str(e)}")
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
+    finally:
+        retrieve_admission.release(workspace_id, admitted)
+
+@router.post("/api/retrieve_batch")
+async def retrieve_batch_from_knowledge_base(request: Request, query_data: dict) -> Dict[str, Any]:
+    kb_manager = request.app.state.kb_manager
+    
+    queries = query_data.get("queries") or []
+    knowledge_bases = query_data.get("knowledge_bases")
+    top_k = query_data.get("top_k", 5)
+    workspace_id = query_data.get("workspace_id")
+    
+    logger.info(f"Batch retrieving {len(queries)} queries for workspace {workspace_id}")
+    
+    if not queries or not all(isinstance(query, str) and query for query in queries):
+        return {"status": "error", "message": "queries must be a non-empty list of query texts"}
+    if len(queries) > RETRIEVE_BATCH_MAX_QUERIES:
+        return {"status": "error", "message": f"At most {RETRIEVE_BATCH_MAX_QUERIES} queries per batch"}
+    filters = parse_filters(query_data.get("filters"))
+    
+    admitted = await admit(retrieve_admission, workspace_id)
+    try:
+        with trace_request("retrieve_batch", workspace_id=workspace_id, queries=len(queries)):
+            results = await asyncio.to_thread(
+                kb_manager.query_knowledge_base_batch,
+                workspace_id,
+                queries,
+                knowledge_bases,
+                top_k,
+                filters,
+                bool(query_data.get("hierarchical"))
+            )
+        
+        return {
+            "status": "success",
+            "results": [
+                {"query": query, "results": query_results}
+                for query, query_results in zip(queries, results)
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Error batch retrieving from knowledge base: {str(e)}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        retrieve_admission.release(workspace_id, admitted)
+
+@router.get("/metrics")
+async def metrics() -> Response:
+    payload, content_type = metrics_payload()
+    return Response(content=payload, media_type=content_type)
@@ -0,0 +1,183 @@
+from typing import Any, AsyncGenerator, Dict, List
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+import time
+
+from pydantic import Field
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CustomLLM, CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashEmbedding(BaseEmbedding):
+    """Deterministic bag-of-words embedding, texts sharing words score as similar
+
+    Each word is hashed into one of ``embed_dim`` buckets with a sign, and the
+    result is L2 normalized. ``latency_ms`` is slept per call to mimic a
+    remote embedding server.
+    """
+
+    embed_dim: int = Field(default=384, gt=0)
+    latency_ms: float = Field(default=0.0, ge=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.embed_dim
+        for word in _WORD_RE.findall(text.lower()):
+            h = _stable_hash(word)
+            vector[h % self.embed_dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embedding(query)
+
+    def get_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        return self._get_text_embeddings(queries)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._aget_text_embedding(query)
+
+
+class FakeStreamingLLM(CustomLLM):
+    """Completion LLM that streams ``num_tokens`` tokens, ``token_delay_ms`` apart
+
+    The answer is derived from a hash of the prompt, so identical prompts get
+    identical answers.
+    """
+
+    num_tokens: int = Field(default=64, ge=1)
+    token_delay_ms: float = Field(default=0.0, ge=0)
+    model_name: str = Field(default="fake-streaming-llm")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeStreamingLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=self.model_name, is_chat_model=False)
+
+    def _tokens(self, prompt: str) -> List[str]:
+        rng = random.Random(_stable_hash(prompt))
+        return [f"{rng.choice(VOCABULARY)} " for _ in range(self.num_tokens)]
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        if self.token_delay_ms:
+            time.sleep(self.num_tokens * self.token_delay_ms / 1000)
+        return CompletionResponse(text="".join(self._tokens(prompt)))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        def gen() -> CompletionResponseGen:
+            text = ""
+            for token in self._tokens(prompt):
+                if self.token_delay_ms:
+                    time.sleep(self.token_delay_ms / 1000)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+        return gen()
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        async def gen() -> AsyncGenerator[CompletionResponse, None]:
+            text = ""
+            for token in self._tokens(prompt):
+                if self.token_delay_ms:
+                    await asyncio.sleep(self.token_delay_ms / 1000)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+        return gen()
+
+
+VOCABULARY = (
+    "policy leave budget report quarterly revenue forecast hiring onboarding security "
+    "access password incident review deployment release backup storage network latency "
+    "customer contract invoice payment refund travel expense approval manager team "
+    "project milestone roadmap design research experiment dataset model training "
+    "evaluation metric benchmark compliance audit privacy retention archive meeting "
+    "schedule holiday office equipment laptop support ticket escalation vendor "
+    "procurement inventory warehouse shipping logistics marketing campaign launch"
+).split()
+
+
+def generate_corpus(
+    root: str,
+    num_docs: int,
+    words_per_doc: int = 400,
+    num_folders: int = 20,
+    folder_depth: int = 2,
+    seed: int = 0
+) -> List[str]:
+    """Write a synthetic text corpus under root, returns one query per topic
+
+    Every document gets a topic word repeated through its text, so querying a
+    topic should retrieve that topic's documents first.
+    """
+    rng = random.Random(seed)
+    folders = []
+    for i in range(max(1, num_folders)):
+        depth = rng.randint(1, max(1, folder_depth))
+        folders.append(os.path.join(*[f"dept{i}"] + [f"sub{rng.randint(0, 3)}" for _ in range(depth - 1)]))
+
+    topics = sorted(set(rng.sample(VOCABULARY, min(len(VOCABULARY), max(1, num_docs // 10 or 1)))))
+    for i in range(num_docs):
+        topic = topics[i % len(topics)]
+        folder = os.path.join(root, folders[i % len(folders)])
+        os.makedirs(folder, exist_ok=True)
+
+        words = [topic if rng.random() < 0.1 else rng.choice(VOCABULARY) for _ in range(words_per_doc)]
+        sentences = [" ".join(words[start:start + 12]).capitalize() + "." for start in range(0, len(words), 12)]
+        with open(os.path.join(folder, f"doc_{i:06d}.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{topic.title()} document {i}\n\n" + " ".join(sentences))
+
+    return [f"What does the {topic} policy say?" for topic in topics]
+
+
+def labeled_queries(root: str) -> List[Dict[str, Any]]:
+    """Labeled queries for a corpus written by generate_corpus
+
+    Each topic's query is labeled with the paths, relative to root, of the
+    documents written about that topic.
+    """
+    relevant: Dict[str, List[str]] = {}
+    for dirpath, _, names in os.walk(root):
+        for name in sorted(names):
+            path = os.path.join(dirpath, name)
+            with open(path, encoding="utf-8") as f:
+                topic = f.readline().split(" ", 1)[0].lower()
+            relevant.setdefault(topic, []).append(os.path.relpath(path, root))
+    return [
+        {"query": f"What does the {topic} policy say?", "relevant": sorted(paths)}
+        for topic, paths in sorted(relevant.items())
+    ]
@@ -0,0 +1,225 @@
+"""Ingest and query benchmark for KBManager against local stand-ins
+
+Runs the real ingestion, retrieval and streaming code paths with an in-memory
+(or local path) Qdrant, fakeredis, a deterministic hashing embedder and a fake
+streaming LLM, over a synthetic corpus. Requires fakeredis (pip install
+fakeredis) unless --redis-url points at a real Redis.
+
+    python benchmarks/kb_benchmark.py --docs 2000 --queries 200 --concurrency 8
+"""
+from typing import List, Optional, Sequence
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from qdrant_client import QdrantClient
+
+from benchmarks.fakes import FakeStreamingLLM, HashEmbedding, generate_corpus
+
+
+def percentiles(samples: Sequence[float], points: Sequence[int] = (50, 95, 99)) -> dict:
+    """Nearest-rank percentiles of samples in milliseconds, keyed p50, p95, ..."""
+    if not samples:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(samples)
+    return {
+        f"p{p}": round(1000 * ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))], 2)
+        for p in points
+    }
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size, None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+def make_redis_client(redis_url: Optional[str]):
+    if redis_url:
+        from redis import Redis
+        return Redis.from_url(redis_url, decode_responses=True)
+    try:
+        import fakeredis # type: ignore
+    except ImportError:
+        raise SystemExit("fakeredis is required for the in-memory benchmark: pip install fakeredis")
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+async def run_concurrently(func, items: List, concurrency: int) -> List[float]:
+    """Run func over items with bounded concurrency, returns per item latencies"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(item):
+        async with semaphore:
+            started = time.perf_counter()
+            await func(item)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*[one(item) for item in items])
+    return latencies
+
+
+async def benchmark(args) -> dict:
+    from kb_manager import KBManager
+    from schemas.document import KnowledgeBaseRegistration, QueryRequest
+
+    work_dir = tempfile.mkdtemp(prefix="kb_bench_")
+    corpus_dir = os.path.join(work_dir, "corpus")
+    # Cold caches unless asked otherwise, every run parses and embeds from scratch
+    os.environ.setdefault("KB_PARSE_CACHE_DIR", os.path.join(work_dir, "parse_cache"))
+    if not args.llm_cache:
+        os.environ["KB_LLM_CACHE_TTL"] = "0"
+
+    started = time.perf_counter()
+    queries = generate_corpus(corpus_dir, args.docs, args.doc_words, args.folders, args.folder_depth, args.seed)
+    corpus_bytes = sum(
+        os.path.getsize(os.path.join(dirpath, name))
+        for dirpath, _, names in os.walk(corpus_dir) for name in names
+    )
+    logger.info(f"Generated {args.docs} documents ({corpus_bytes / 1024 ** 2:.1f} MB) in {time.perf_counter() - started:.2f}s")
+
+    kb_manager = KBManager(
+        QdrantClient(path=args.qdrant_path) if args.qdrant_path else QdrantClient(":memory:"),
+        redis_client=make_redis_client(args.redis_url),
+        llm=FakeStreamingLLM(num_tokens=args.llm_tokens, token_delay_ms=args.token_delay_ms),
+        embed_model=HashEmbedding(embed_dim=args.dim, latency_ms=args.embed_latency_ms)
+    )
+
+    workspace_id, kb_id = "bench", f"bench-{args.seed}"
+    registration = KnowledgeBaseRegistration(
+        id=kb_id,
+        name="Benchmark",
+        workspace_id=workspace_id,
+        source="local_store",
+        url=corpus_dir,
+        embedding_engine=""
+    )
+
+    if args.trace_memory:
+        tracemalloc.start()
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    kb_manager.register_knowledge_base(registration)
+    status = "disabled"
+    while status not in ("running", "error"):
+        await asyncio.sleep(0.05)
+        status = kb_manager.get_kb_status(kb_id, workspace_id)
+    ingest_seconds = time.perf_counter() - started
+    if status == "error":
+        raise SystemExit("Ingestion failed, see the log above")
+
+    checkpoint = kb_manager._get_ingest_checkpoint(workspace_id, kb_id)
+    chunks = checkpoint.get("nodes_total", 0)
+    ingest = {
+        "documents": args.docs,
+        "chunks": chunks,
+        "seconds": round(ingest_seconds, 3),
+        "docs_per_second": round(args.docs / ingest_seconds, 1),
+        "chunks_per_second": round(chunks / ingest_seconds, 1),
+        "mb_per_second": round(corpus_bytes / 1024 ** 2 / ingest_seconds, 2),
+        "rss_delta_mb": round((rss_mb() or 0) - (rss_before or 0), 1)
+    }
+    if args.trace_memory:
+        ingest["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+        tracemalloc.stop()
+
+    query_texts = [queries[i % len(queries)] for i in range(args.queries)]
+
+    async def retrieve(query_text):
+        await asyncio.to_thread(kb_manager.query_knowledge_base, workspace_id, query_text, [kb_id], args.top_k)
+
+    started = time.perf_counter()
+    retrieval_latencies = await run_concurrently(retrieve, query_texts, args.concurrency)
+    retrieval_seconds = time.perf_counter() - started
+
+    first_token_latencies: List[float] = []
+
+    async def stream(query_text):
+        query = QueryRequest(workspace_id=workspace_id, knowledge_bases=[kb_id], query=query_text, streaming=True, top_k=args.top_k)
+        started = time.perf_counter()
+        first = None
+        async for _ in await kb_manager.stream_answer_with_context(query):
+            if first is None:
+                first = time.perf_counter() - started
+        first_token_latencies.append(first or 0.0)
+
+    started = time.perf_counter()
+    stream_latencies = await run_concurrently(stream, query_texts, args.concurrency)
+    stream_seconds = time.perf_counter() - started
+
+    return {
+        "config": vars(args),
+        "ingest": ingest,
+        "retrieval": {
+            "queries": len(retrieval_latencies),
+            "qps": round(len(retrieval_latencies) / retrieval_seconds, 1),
+            "latency_ms": percentiles(retrieval_latencies)
+        },
+        "streaming": {
+            "queries": len(stream_latencies),
+            "qps": round(len(stream_latencies) / stream_seconds, 1),
+            "first_token_ms": percentiles(first_token_latencies),
+            "total_ms": percentiles(stream_latencies)
+        },
+        "memory": {
+            "rss_mb": rss_mb(),
+            "peak_rss_mb": peak_rss_mb()
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=500, help="Documents in the synthetic corpus")
+    parser.add_argument("--doc-words", type=int, default=400, help="Words per document")
+    parser.add_argument("--folders", type=int, default=20, help="Top level folders")
+    parser.add_argument("--folder-depth", type=int, default=2, help="Max folder nesting")
+    parser.add_argument("--queries", type=int, default=100, help="Queries per query benchmark")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent queries")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated latency per embedding call")
+    parser.add_argument("--llm-tokens", type=int, default=64, help="Tokens per fake LLM answer")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="Simulated delay between streamed tokens")
+    parser.add_argument("--llm-cache", action="store_true", help="Keep the LLM answer cache enabled")
+    parser.add_argument("--qdrant-path", default=None, help="Local Qdrant storage path instead of in-memory")
+    parser.add_argument("--redis-url", default=None, help="Real Redis instead of fakeredis")
+    parser.add_argument("--trace-memory", action="store_true", help="Track Python allocations during ingest (slower)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this path")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    results = asyncio.run(benchmark(args))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
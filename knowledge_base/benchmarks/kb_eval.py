@@ -0,0 +1,286 @@
+"""Retrieval quality and latency evaluation of KB settings against local stand-ins
+
+Ingests a corpus into an in-memory (or local path) Qdrant with fakeredis, then
+runs a labeled query set through query_knowledge_base under each configuration
+and reports recall@k, MRR, latency percentiles and prompt tokens per query.
+Configurations that share ingestion settings share one ingested KB.
+
+    python benchmarks/kb_eval.py --corpus ./docs --queries queries.jsonl --configs configs.json
+
+Each query line is {"query": "...", "relevant": [...]}, where relevant entries
+are file paths relative to the corpus, file names or document ids. Each
+configuration is an object with a "name" plus any of the settings listed in
+INGEST_SETTINGS, QUERY_SETTINGS and QUERY_ARGUMENTS.
+Without --corpus a synthetic corpus and its labeled queries are generated.
+By default queries are embedded with the hashing stand-in; pass
+--embedding-engine (e.g. fastembed:BAAI/bge-small-en-v1.5) to evaluate a
+real embedding model.
+"""
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from qdrant_client import QdrantClient
+
+from benchmarks.fakes import FakeStreamingLLM, HashEmbedding, generate_corpus, labeled_queries
+from benchmarks.kb_benchmark import make_redis_client, percentiles
+
+# KBManager attributes that change what gets indexed; configurations differing
+# in any of these are ingested into separate KBs
+INGEST_SETTINGS = ("chunk_size", "chunk_overlap", "chunk_dedup_distance", "doc_summaries", "summary_min_docs", "summary_mode", "summary_max_chars")
+# KBManager attributes read at query time
+QUERY_SETTINGS = ("summary_candidates",)
+# query_knowledge_base arguments
+QUERY_ARGUMENTS = ("top_k", "hierarchical", "filters")
+
+DEFAULT_CONFIGS = [
+    {"name": "flat-top3", "top_k": 3, "hierarchical": False},
+    {"name": "flat-top5", "top_k": 5, "hierarchical": False},
+    {"name": "flat-top10", "top_k": 10, "hierarchical": False},
+    {"name": "flat-top5-chunk512", "top_k": 5, "hierarchical": False, "chunk_size": 512, "chunk_overlap": 100},
+    {"name": "two-stage-top5", "top_k": 5, "hierarchical": True, "doc_summaries": True, "summary_min_docs": 0},
+]
+
+
+def load_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def validate_config(config: Dict[str, Any]) -> None:
+    unknown = set(config) - {"name", *INGEST_SETTINGS, *QUERY_SETTINGS, *QUERY_ARGUMENTS}
+    if unknown:
+        raise SystemExit(f"Unknown settings in configuration {config.get('name')}: {sorted(unknown)}")
+
+
+def result_keys(result: dict, corpus_dir: str) -> set:
+    """Identifiers a relevance label may use for a result's document"""
+    metadata = result["metadata"]
+    keys = {metadata.get("file_name"), metadata.get("doc_id"), *(metadata.get("duplicate_doc_ids") or [])}
+    file_path = metadata.get("file_path")
+    if file_path:
+        keys.add(os.path.relpath(file_path, corpus_dir))
+    keys.discard(None)
+    return keys
+
+
+def score_results(results: List[dict], relevant: List[str], corpus_dir: str) -> Dict[str, float]:
+    """Recall of the relevant documents in the results and reciprocal rank of the first hit"""
+    labels = set(relevant)
+    found = set()
+    reciprocal_rank = 0.0
+    for rank, result in enumerate(results, 1):
+        hits = result_keys(result, corpus_dir) & labels
+        if hits and not reciprocal_rank:
+            reciprocal_rank = 1.0 / rank
+        found |= hits
+    return {
+        "recall": len(found) / len(labels) if labels else 0.0,
+        "reciprocal_rank": reciprocal_rank
+    }
+
+
+async def ingest(kb_manager, corpus_dir: str, kb_id: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    from schemas.document import KnowledgeBaseRegistration
+
+    for key, value in settings.items():
+        setattr(kb_manager, key, value)
+    started = time.perf_counter()
+    kb_manager.register_knowledge_base(KnowledgeBaseRegistration(
+        id=kb_id,
+        name=kb_id,
+        workspace_id="eval",
+        source="local_store",
+        url=corpus_dir,
+        embedding_engine=""
+    ))
+    status = "disabled"
+    while status not in ("running", "error"):
+        await asyncio.sleep(0.05)
+        status = kb_manager.get_kb_status(kb_id, "eval")
+    if status == "error":
+        raise SystemExit(f"Ingestion of {kb_id} failed, see the log above")
+    # Wait for the post-ingestion warm-up so it does not overlap the measurements
+    while kb_manager._background_tasks:
+        await asyncio.sleep(0.05)
+
+    checkpoint = kb_manager._get_ingest_checkpoint("eval", kb_id)
+    return {
+        "kb_id": kb_id,
+        "seconds": round(time.perf_counter() - started, 3),
+        "chunks": checkpoint.get("nodes_total", 0)
+    }
+
+
+def evaluate(kb_manager, kb_id: str, config: Dict[str, Any], queries: List[Dict[str, Any]], corpus_dir: str, repeat: int) -> Dict[str, Any]:
+    from llama_index.core.utils import get_tokenizer
+    from schemas.document import QueryRequest, RetrievalFilters
+
+    for key in QUERY_SETTINGS:
+        if key in config:
+            setattr(kb_manager, key, config[key])
+    top_k = config.get("top_k", 5)
+    filters = RetrievalFilters(**config["filters"]) if config.get("filters") else None
+    tokenizer = get_tokenizer()
+
+    latencies: List[float] = []
+    recalls: List[float] = []
+    reciprocal_ranks: List[float] = []
+    prompt_tokens: List[int] = []
+    for labeled in queries:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            results = kb_manager.query_knowledge_base("eval", labeled["query"], [kb_id], top_k, filters, bool(config.get("hierarchical")))
+            latencies.append(time.perf_counter() - started)
+        scores = score_results(results, labeled.get("relevant", []), corpus_dir)
+        recalls.append(scores["recall"])
+        reciprocal_ranks.append(scores["reciprocal_rank"])
+
+        query = QueryRequest(workspace_id="eval", knowledge_bases=[kb_id], query=labeled["query"], top_k=top_k)
+        prompt = kb_manager._build_prompt(query, labeled["query"], kb_manager._format_context(results))
+        prompt_tokens.append(len(tokenizer(prompt)))
+
+    return {
+        "name": config["name"],
+        "kb_id": kb_id,
+        "settings": {key: value for key, value in config.items() if key != "name"},
+        f"recall@{top_k}": round(sum(recalls) / len(recalls), 4),
+        "mrr": round(sum(reciprocal_ranks) / len(reciprocal_ranks), 4),
+        "latency_ms": percentiles(latencies),
+        "prompt_tokens": {
+            "mean": round(sum(prompt_tokens) / len(prompt_tokens), 1),
+            "max": max(prompt_tokens)
+        }
+    }
+
+
+def format_table(reports: List[Dict[str, Any]]) -> str:
+    rows = [("config", "recall", "mrr", "p50 ms", "p95 ms", "p99 ms", "prompt tokens")]
+    for report in reports:
+        recall_key = next(key for key in report if key.startswith("recall@"))
+        latency = report["latency_ms"]
+        rows.append((
+            report["name"],
+            f"{report[recall_key]:.3f} @{recall_key.split('@')[1]}",
+            f"{report['mrr']:.3f}",
+            str(latency["p50"]),
+            str(latency["p95"]),
+            str(latency["p99"]),
+            str(report["prompt_tokens"]["mean"])
+        ))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+async def run(args) -> Dict[str, Any]:
+    from kb_manager import KBManager
+    from embeddings import create_embedding, parse_embedding_engine
+
+    work_dir = tempfile.mkdtemp(prefix="kb_eval_")
+    os.environ.setdefault("KB_PARSE_CACHE_DIR", os.path.join(work_dir, "parse_cache"))
+    os.environ["KB_LLM_CACHE_TTL"] = "0"
+
+    corpus_dir = args.corpus
+    if corpus_dir:
+        queries = load_jsonl(args.queries) if args.queries else None
+        if not queries:
+            raise SystemExit("--queries is required with --corpus")
+    else:
+        corpus_dir = os.path.join(work_dir, "corpus")
+        generate_corpus(corpus_dir, args.docs, args.doc_words, args.folders, args.folder_depth, args.seed)
+        queries = load_jsonl(args.queries) if args.queries else labeled_queries(corpus_dir)
+    corpus_dir = os.path.abspath(corpus_dir)
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+    for config in configs:
+        validate_config(config)
+
+    if args.embedding_engine:
+        embed_model = create_embedding(*parse_embedding_engine(args.embedding_engine))
+    else:
+        embed_model = HashEmbedding(embed_dim=args.dim)
+    kb_manager = KBManager(
+        QdrantClient(path=args.qdrant_path) if args.qdrant_path else QdrantClient(":memory:"),
+        redis_client=make_redis_client(args.redis_url),
+        llm=FakeStreamingLLM(),
+        embed_model=embed_model
+    )
+
+    baseline = {key: getattr(kb_manager, key) for key in INGEST_SETTINGS + QUERY_SETTINGS}
+    ingested: Dict[str, Dict[str, Any]] = {}
+    reports = []
+    for config in configs:
+        settings = {key: config.get(key, baseline[key]) for key in INGEST_SETTINGS}
+        settings_key = json.dumps(settings, sort_keys=True)
+        if settings_key not in ingested:
+            ingested[settings_key] = await ingest(kb_manager, corpus_dir, f"eval-{len(ingested)}", settings)
+            ingested[settings_key]["settings"] = settings
+            logger.info(f"Ingested {ingested[settings_key]['kb_id']} in {ingested[settings_key]['seconds']}s")
+
+        # A reused KB was ingested under another config's settings, some of which
+        # (doc_summaries) also decide how it is queried
+        for key, value in ingested[settings_key]["settings"].items():
+            setattr(kb_manager, key, value)
+        for key in QUERY_SETTINGS:
+            setattr(kb_manager, key, baseline[key])
+        try:
+            report = await asyncio.to_thread(
+                evaluate, kb_manager, ingested[settings_key]["kb_id"], config, queries, corpus_dir, args.repeat
+            )
+        finally:
+            for key, value in baseline.items():
+                setattr(kb_manager, key, value)
+        report["ingest"] = {key: ingested[settings_key][key] for key in ("kb_id", "seconds", "chunks")}
+        reports.append(report)
+
+    return {
+        "corpus": corpus_dir,
+        "queries": len(queries),
+        "embedding": args.embedding_engine or f"hash:{args.dim}",
+        "ingestions": list(ingested.values()),
+        "configs": reports
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=None, help="Directory to ingest, a synthetic corpus when omitted")
+    parser.add_argument("--queries", default=None, help="Labeled queries as JSON lines")
+    parser.add_argument("--configs", default=None, help="JSON list of configurations to compare")
+    parser.add_argument("--embedding-engine", default=None, help="Embedding backend[:model] instead of the hashing stand-in")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension of the hashing embedding")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each query for the latency percentiles")
+    parser.add_argument("--docs", type=int, default=300, help="Documents in the synthetic corpus")
+    parser.add_argument("--doc-words", type=int, default=400, help="Words per synthetic document")
+    parser.add_argument("--folders", type=int, default=20, help="Top level synthetic folders")
+    parser.add_argument("--folder-depth", type=int, default=2, help="Max synthetic folder nesting")
+    parser.add_argument("--qdrant-path", default=None, help="Local Qdrant storage path instead of in-memory")
+    parser.add_argument("--redis-url", default=None, help="Real Redis instead of fakeredis")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the full report as JSON to this path")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    results = asyncio.run(run(args))
+    print(format_table(results["configs"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+from .backends import EMBEDDING_BACKENDS, create_embedding, embed_queries, parse_embedding_engine
+
+__all__ = [
+    "EMBEDDING_BACKENDS",
+    "create_embedding",
+    "embed_queries",
+    "parse_embedding_engine"
+]
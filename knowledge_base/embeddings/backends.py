@@ -0,0 +1,89 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import os
+
+from loguru import logger
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+
+def _batch_size(env_name: str, default: int) -> int:
+    return int(os.getenv(env_name, str(default)))
+
+
+def create_ollama_embedding(model_name: Optional[str] = None) -> BaseEmbedding:
+    """Embeddings served over HTTP by the Ollama container"""
+    from embeddings.ollama import PooledOllamaEmbedding
+    return PooledOllamaEmbedding(
+        model_name=model_name or os.getenv("EMBED_MODEL"),
+        base_url=os.getenv("OLLAMA_API_BASE_URL", "http://localhost:11434"),
+        request_batch_size=_batch_size("OLLAMA_EMBED_BATCH_SIZE", 32),
+        max_concurrency=int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "4")),
+        max_retries=int(os.getenv("OLLAMA_EMBED_MAX_RETRIES", "5")),
+        timeout=float(os.getenv("OLLAMA_EMBED_TIMEOUT", "120"))
+    )
+
+
+def create_fastembed_embedding(model_name: Optional[str] = None) -> BaseEmbedding:
+    """In-process ONNX embeddings on CPU, no network hop"""
+    from llama_index.embeddings.fastembed import FastEmbedEmbedding # type: ignore
+    embed_model = FastEmbedEmbedding(
+        model_name=model_name or os.getenv("FASTEMBED_MODEL", "BAAI/bge-small-en-v1.5"),
+        cache_dir=os.getenv("FASTEMBED_CACHE_DIR"),
+        threads=int(os.getenv("FASTEMBED_THREADS", "0")) or None
+    )
+    embed_model.embed_batch_size = _batch_size("FASTEMBED_EMBED_BATCH_SIZE", 64)
+    return embed_model
+
+
+def create_openai_embedding(model_name: Optional[str] = None) -> BaseEmbedding:
+    """Any OpenAI-compatible /embeddings endpoint"""
+    from llama_index.embeddings.openai_like import OpenAILikeEmbedding # type: ignore
+    return OpenAILikeEmbedding(
+        model_name=model_name or os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small"),
+        api_key=os.getenv("OPENAI_EMBED_API_KEY") or os.getenv("OPENAI_API_KEY", "fake"),
+        api_base=os.getenv("OPENAI_EMBED_API_BASE_URL", "https://api.openai.com/v1"),
+        embed_batch_size=_batch_size("OPENAI_EMBED_BATCH_SIZE", 100)
+    )
+
+
+EMBEDDING_BACKENDS: Dict[str, Callable[[Optional[str]], BaseEmbedding]] = {
+    "ollama": create_ollama_embedding,
+    "fastembed": create_fastembed_embedding,
+    "openai": create_openai_embedding,
+}
+
+
+def parse_embedding_engine(embedding_engine: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Split an embedding_engine value into (backend, model)
+
+    Accepts "backend" or "backend:model", e.g. "fastembed:BAAI/bge-small-en-v1.5"
+    or "ollama:nomic-embed-text:latest". Anything else falls back to the default
+    backend from KB_EMBED_BACKEND with its default model.
+    """
+    default_backend = os.getenv("KB_EMBED_BACKEND", "ollama")
+    if not embedding_engine:
+        return default_backend, None
+
+    backend, _, model_name = embedding_engine.partition(":")
+    backend = backend.strip().lower()
+    if backend not in EMBEDDING_BACKENDS:
+        logger.warning(f"Unknown embedding engine {embedding_engine}, using {default_backend}")
+        return default_backend, None
+    return backend, model_name.strip() or None
+
+
+def embed_queries(embed_model: BaseEmbedding, queries: List[str]) -> List[List[float]]:
+    """Query embeddings for several queries, in one batch where the model supports it
+
+    Models exposing get_query_embeddings embed the whole batch in one call,
+    others fall back to one get_query_embedding call per query.
+    """
+    batch = getattr(embed_model, "get_query_embeddings", None)
+    if batch is not None:
+        return batch(queries)
+    return [embed_model.get_query_embedding(query) for query in queries]
+
+
+def create_embedding(backend: str, model_name: Optional[str] = None) -> BaseEmbedding:
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    return EMBEDDING_BACKENDS[backend](model_name)
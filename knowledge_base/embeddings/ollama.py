@@ -0,0 +1,156 @@
+from typing import Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import random
+import time
+
+import httpx
+from loguru import logger
+from pydantic import Field, PrivateAttr
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+# Responses worth retrying; anything else is a caller error and fails fast
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class OllamaEmbeddingError(Exception):
+    """Raised when an embedding batch still fails after all retries"""
+
+
+class PooledOllamaEmbedding(BaseEmbedding):
+    """Ollama embeddings over a pooled keep-alive HTTP client
+
+    Texts are sent to /api/embed in batches of ``request_batch_size``, with at
+    most ``max_concurrency`` requests in flight. Failed batches are retried with
+    exponential backoff and jitter, so a transient 500 only delays one batch.
+    """
+
+    base_url: str = Field(default="http://localhost:11434")
+    request_batch_size: int = Field(default=32, gt=0)
+    max_concurrency: int = Field(default=4, gt=0)
+    max_retries: int = Field(default=5, ge=0)
+    backoff_base: float = Field(default=0.5, gt=0)
+    backoff_max: float = Field(default=30.0, gt=0)
+    timeout: float = Field(default=120.0, gt=0)
+    keep_alive: Optional[str] = Field(default=None)
+
+    _client: httpx.Client = PrivateAttr()
+    _async_client: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
+    _executor: ThreadPoolExecutor = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        # Callers batch by embed_batch_size; this is split further into requests
+        kwargs.setdefault("embed_batch_size", 256)
+        super().__init__(**kwargs)
+        self.base_url = self.base_url.rstrip("/")
+        self._client = httpx.Client(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=self._limits()
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="ollama-embed"
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        # Produces the same vectors as llama_index's OllamaEmbedding, so cached
+        # embeddings stay valid under the same name
+        return "OllamaEmbedding"
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency
+        )
+
+    def _payload(self, texts: List[str]) -> dict:
+        payload = {"model": self.model_name, "input": texts}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(error, httpx.TransportError)
+
+    def _embed_request(self, texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                response = self._client.post("/api/embed", json=self._payload(texts))
+                response.raise_for_status()
+                return response.json()["embeddings"]
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise OllamaEmbeddingError(f"Embedding batch of {len(texts)} failed: {str(e)}") from e
+                delay = self._backoff(attempt)
+                attempt += 1
+                logger.warning(f"Ollama embedding failed ({str(e)}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    async def _aembed_request(self, texts: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self._limits()
+            )
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    response = await self._async_client.post("/api/embed", json=self._payload(texts))
+                response.raise_for_status()
+                return response.json()["embeddings"]
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise OllamaEmbeddingError(f"Embedding batch of {len(texts)} failed: {str(e)}") from e
+                delay = self._backoff(attempt)
+                attempt += 1
+                logger.warning(f"Ollama embedding failed ({str(e)}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def _split(self, texts: List[str]) -> List[List[str]]:
+        size = self.request_batch_size
+        return [texts[start:start + size] for start in range(0, len(texts), size)]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        batches = self._split(texts)
+        if len(batches) == 1:
+            return self._embed_request(batches[0])
+        embeddings = []
+        for batch_embeddings in self._executor.map(self._embed_request, batches):
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(
+            *[self._aembed_request(batch, semaphore) for batch in self._split(texts)]
+        )
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed_request([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embedding(query)
+
+    def get_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries in batched requests, queries embed like any text"""
+        return self._get_text_embeddings(queries)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._aget_text_embedding(query)
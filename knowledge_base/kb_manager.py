@@ -1,25 +1,55 @@
-from typing import Dict, AsyncGenerator, List, Optional, Any
+from typing import Dict, AsyncGenerator, Iterable, List, Optional, Any, Tuple
 import os
 import uuid
+import shutil
 import json
+import math
 import asyncio
+import threading
 import time
 
 from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
 from loguru import logger
-from llama_index.core import VectorStoreIndex, StorageContext
-from llama_index.vector_stores.qdrant import QdrantVectorStore # type: ignore
-from llama_index.embeddings.ollama import OllamaEmbedding # type: ignore
-from llama_index.core.llms import ChatMessage
-from llama_index.llms.deepseek import DeepSeek # type: ignore
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
 from redis import RedisCluster
 
-from schemas.document import Folder, DataSource, KnowledgeBaseRegistration
-from schemas.document import QueryRequest
+from schemas.document import DataSource, KnowledgeBaseRegistration
+from schemas.document import QueryRequest, RetrievalFilters
 from readers.base_reader import BaseReader
 from readers.local_store_reader import LocalStoreReader
 from prompts.lang import lng_map, lng_prompt
+from prompts.summary import doc_summary_prompt
+from embeddings import create_embedding, embed_queries, parse_embedding_engine
+from utils.embedding_cache import CachedEmbedding, create_embedding_store
+from utils.dedup import ChunkDeduplicator
+from utils.ingestion_scheduler import IngestionScheduler, IngestionJob, IngestionCancelled, estimate_priority
+from utils.session_store import RedisSessionStore
+from utils.response_cache import ResponseCache, replay_answer
+from utils.folder_index import FolderIndex
+from utils.telemetry import span, record_span, record_startup
+from utils.kb_snapshot import dump_collection, restore_collection, pack_snapshot, unpack_snapshot, snapshot_workdir, SNAPSHOT_FORMAT_VERSION
+from utils.metadata_filters import MERGED_FILTER_KEYS, build_qdrant_filter, ensure_payload_indexes, filter_metadata, merge_filter_metadata, restrict_to_documents
+from utils.uploads import UploadError, UploadStore
+from utils.kb_parquet import export_collection_parquet
 
+# Metadata kept on chunks for filtering and bookkeeping but left out of the text
+# that gets embedded or sent to the LLM. Only file_path is embedded, matching
+# SimpleDirectoryReader's defaults, so embeddings stay stable across re-ingestion.
+NON_CONTENT_METADATA_KEYS = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+    "doc_id",
+    "duplicate_doc_ids",
+    "folder_ancestors",
+    "doc_type",
+    "tags",
+    "date_ts",
+]
 class KBManager:
     """Manages configurable data sources and communicates with qdrant"""
     sources: Dict[str, type[BaseReader]] = {
@@ -29,102 +59,404 @@ class KBManager:
 
     def __init__(
         self,
-        qdrant_client: QdrantClient
+        qdrant_client: QdrantClient,
+        redis_client: Optional[Any] = None,
+        llm: Optional[Any] = None,
+        embed_model: Optional[Any] = None
     ):
+        """Clients default to the deployment services; pass redis_client, llm or
+        embed_model to run against other instances, e.g. local stand-ins in the
+        benchmarks. An injected embed_model is used for every KB."""
+        started = time.perf_counter()
         self.qdrant_client = qdrant_client
-        self.embed_model = OllamaEmbedding(
-            model_name=os.getenv("EMBED_MODEL"),
-            base_url=os.getenv("OLLAMA_API_BASE_URL")
-        )
-        self.llm = DeepSeek(
-            model=os.getenv("OPENAI_MODEL"),
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        # Query-only replicas serve retrieval and answers but never ingest, so the
+        # ingestion stack (llama_index vector store, splitter, readers) is not loaded
+        self.query_only = os.getenv("KB_QUERY_ONLY", "0") == "1"
+        # The LLM and embedding models are created on first use, not at startup
+        self._llm = llm
+        self._load_lock = threading.Lock()
+        # Embedding models by (backend, model), shared by every KB using them
+        self._embed_models: Dict[tuple, Any] = {}
+        self._embed_model_override = embed_model
         
-        # TODO: replace with envs
-        redis_host = "redis-node-5"
-        redis_port = 6379
-        redis_password = "bitnami"
-        
-        self.redis_client = RedisCluster( # type: ignore
-            host=redis_host,
-            port=redis_port,
-            password=redis_password,
-            decode_responses=True,
-            socket_timeout=5.0,
-            socket_connect_timeout=5.0,
-            retry_on_timeout=True,
-            health_check_interval=30
-        )
+        if redis_client is None:
+            # TODO: replace with envs
+            redis_host = "redis-node-5"
+            redis_port = 6379
+            redis_password = "bitnami"
+            
+            redis_client = RedisCluster( # type: ignore
+                host=redis_host,
+                port=redis_port,
+                password=redis_password,
+                decode_responses=True,
+                socket_timeout=5.0,
+                socket_connect_timeout=5.0,
+                retry_on_timeout=True,
+                health_check_interval=30
+            )
+        self.redis_client = redis_client
         
         self.redis_client.ping()
         logger.info("Redis client connected")
         
+        self.embedding_store = create_embedding_store(self.redis_client)
+        # Opt-in LLM answer cache, KB_LLM_CACHE_TTL is how long answers are kept in
+        # seconds and 0 (the default) disables it. Workspaces can still opt out
+        self.response_cache = ResponseCache(
+            self.redis_client,
+            ttl=int(os.getenv("KB_LLM_CACHE_TTL", "0"))
+        )
+        
+        self.chunk_size = int(os.getenv("KB_CHUNK_SIZE", "1024"))
+        self.chunk_overlap = int(os.getenv("KB_CHUNK_OVERLAP", "200"))
+        # Opt-in near-duplicate chunk dropping, the max SimHash bit distance (0-3) for two
+        # chunks to count as duplicates. Off (-1) by default: small distances also match
+        # chunks differing only in numbers or dates, e.g. versions of the same policy
+        self.chunk_dedup_distance = int(os.getenv("KB_CHUNK_DEDUP_DISTANCE", "-1"))
+        # Chunks embedded and upserted per ingestion checkpoint
+        self.ingest_batch_size = int(os.getenv("KB_INGEST_BATCH_SIZE", "512"))
+        
+        # Opt-in coarse-to-fine retrieval. With KB_DOC_SUMMARIES=1, KBs of at least
+        # KB_SUMMARY_MIN_DOCS files get a document summary collection, and queries that
+        # ask for hierarchical retrieval search the summaries to pick candidate documents,
+        # then only those documents' chunks. Summaries are "extractive" or written by the "llm"
+        self.doc_summaries = os.getenv("KB_DOC_SUMMARIES", "0") == "1"
+        self.summary_min_docs = int(os.getenv("KB_SUMMARY_MIN_DOCS", "200"))
+        self.summary_mode = os.getenv("KB_SUMMARY_MODE", "extractive")
+        self.summary_max_chars = int(os.getenv("KB_SUMMARY_MAX_CHARS", "1500"))
+        self.summary_candidates = int(os.getenv("KB_SUMMARY_CANDIDATES", "20"))
+        
+        # KB snapshots are written to and imported from this directory
+        self.snapshot_dir = os.getenv("KB_SNAPSHOT_DIR", "/storage/.kb_snapshots")
+        
+        # Files uploaded into a KB are staged here until complete, then moved into
+        # the KB's directory and indexed into its existing collection
+        self.upload_store = UploadStore(
+            self.redis_client,
+            os.getenv("KB_UPLOAD_DIR", "/storage/.kb_uploads"),
+            ttl=int(os.getenv("KB_UPLOAD_TTL", "86400")),
+            max_bytes=int(os.getenv("KB_UPLOAD_MAX_BYTES", str(1024 ** 3)))
+        )
+        # Serializes incremental additions per KB, its documents are one Redis value
+        self._kb_write_locks: Dict[str, threading.Lock] = {}
+        # Strong references to fire-and-forget tasks so they are not garbage collected
+        self._background_tasks = set()
+        
+        # After indexing and at startup each running KB gets this many searches made
+        # from its own chunks, warming the embedding model and Qdrant segments before
+        # real queries arrive. Up to KB_WARMUP_CONCURRENCY KBs warm up at once
+        self.warmup_queries = int(os.getenv("KB_WARMUP_QUERIES", "8"))
+        self._warmup_semaphore = asyncio.Semaphore(int(os.getenv("KB_WARMUP_CONCURRENCY", "2")))
+        
+        # Streaming queries start generating once this fraction of knowledge bases
+        # has answered, or once the deadline (seconds) passes with at least one answer
+        self.retrieval_quorum = float(os.getenv("KB_STREAM_RETRIEVAL_QUORUM", "1.0"))
+        self.retrieval_deadline = float(os.getenv("KB_STREAM_RETRIEVAL_DEADLINE", "3.0"))
+        
         # Remove self.indices as we'll rely on Qdrant and Redis tracking
-        self._message_store = {}
+        self.session_store = RedisSessionStore(
+            self.redis_client,
+            ttl=int(os.getenv("KB_STREAM_SESSION_TTL", "1800"))
+        )
         self.readers = {}
         self.kb_names: Dict[str, str] = {}
+        # Deserialized folder indexes by (workspace, KB) with the Redis version they were
+        # read at. Redis holds the persisted copy and a token that changes on every write,
+        # so a lookup costs one small GET instead of loading the whole index
+        self._folder_indexes: Dict[Tuple[str, str], Tuple[str, FolderIndex]] = {}
+        # Cached indexes are updated in place, readers and writers take this lock
+        self._folder_index_lock = threading.Lock()
+        # Dense vector names and summary collection presence by collection name, read
+        # from Qdrant once rather than on every query. Entries are dropped wherever this
+        # instance creates or deletes the collection, and expire after KB_COLLECTION_INFO_TTL
+        # seconds so collections rebuilt by another instance are picked up
+        self._collection_info: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self.collection_info_ttl = float(os.getenv("KB_COLLECTION_INFO_TTL", "60"))
         # self.documents = {}  # We'll store documents in Redis instead
-        self._kb_queue = asyncio.Queue()
+        self.ingestion_scheduler = IngestionScheduler(
+            self._ingest_kb,
+            max_concurrency=int(os.getenv("KB_INGEST_CONCURRENCY", "2"))
+        )
+        
+        record_startup("kb_manager", time.perf_counter() - started)
+        logger.info(f"KB manager initialized in {time.perf_counter() - started:.2f}s{' (query-only)' if self.query_only else ''}")
         
-        asyncio.create_task(self._process_kb_queue())
+        asyncio.create_task(self.reconcile())
     
-    async def _process_kb_queue(self):
-        """Background task to process knowledge base registrations"""
-        # TODO: if requested registered kb is already in redis, load from redis.
-        while True:
+    def _spawn(self, coro) -> asyncio.Task:
+        """Run a coroutine in the background, keeping a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+    
+    async def warm_up(self, kbs: List[Tuple[str, str]]) -> None:
+        """Warm up (workspace_id, kb_id) pairs, at most KB_WARMUP_CONCURRENCY at a time"""
+        if self.warmup_queries <= 0 or not kbs:
+            return
+        
+        async def warm(workspace_id: str, kb_id: str):
+            async with self._warmup_semaphore:
+                try:
+                    await asyncio.to_thread(self.warm_up_kb, workspace_id, kb_id)
+                except Exception as e:
+                    logger.warning(f"Warm-up of KB {kb_id} failed: {str(e)}")
+        
+        await asyncio.gather(*(warm(workspace_id, kb_id) for workspace_id, kb_id in kbs))
+    
+    def warm_up_kb(self, workspace_id: str, kb_id: str) -> Dict[str, Any]:
+        """Search a KB the way queries do so the first real queries do not hit cold caches
+        
+        Queries are made from the beginnings of stored chunks and go through the
+        normal search path, which loads the KB's embedding model and reads the
+        collection's index and payload segments. The stored vectors of the same
+        chunks are searched too, covering more of the HNSW graph without extra
+        embedding calls.
+        """
+        collection_name = f"kb_{kb_id}"
+        if self.warmup_queries <= 0 or not self.qdrant_client.collection_exists(collection_name):
+            return {"queries": 0, "seconds": 0.0}
+        
+        started = time.monotonic()
+        with span("kb.warm_up", kb_id=kb_id):
+            vector_name = self._get_dense_vector_name(collection_name)
+            points, _ = self.qdrant_client.scroll(
+                collection_name,
+                limit=self.warmup_queries,
+                with_payload=True,
+                with_vectors=[vector_name] if vector_name else True
+            )
+            queries = []
+            for point in points:
+                text = " ".join(metadata_dict_to_node(point.payload).text.split()[:32])
+                if text:
+                    queries.append(text)
+            for query_text in queries:
+                self._search_source(workspace_id, kb_id, query_text)
+            
+            if points:
+                self.qdrant_client.query_batch_points(collection_name, requests=[
+                    qdrant_models.QueryRequest(
+                        query=point.vector[vector_name] if vector_name else point.vector,
+                        using=vector_name,
+                        limit=5
+                    )
+                    for point in points
+                ])
+        
+        seconds = time.monotonic() - started
+        logger.info(f"Warmed up KB {kb_id} with {len(queries)} queries in {seconds:.2f}s")
+        return {"queries": len(queries), "seconds": round(seconds, 3)}
+    
+    @property
+    def llm(self):
+        """The answer LLM, created on first use"""
+        if self._llm is None:
+            with self._load_lock:
+                if self._llm is None:
+                    with span("kb.load_llm"):
+                        from llama_index.llms.deepseek import DeepSeek # type: ignore
+                        self._llm = DeepSeek(
+                            model=os.getenv("OPENAI_MODEL"),
+                            api_key=os.getenv("OPENAI_API_KEY")
+                        )
+                    logger.info(f"Loaded LLM {self._llm.metadata.model_name}")
+        return self._llm
+    
+    @property
+    def embed_model(self):
+        """The default embedding model, created on first use"""
+        return self.get_embed_model(*parse_embedding_engine(None))
+    
+    async def reconcile(self):
+        """Rebuild in-memory KB state from Redis and Qdrant at startup
+        
+        KBs whose collections are intact are marked running without touching
+        their documents. Interrupted ingestions resume from their checkpoint and
+        KBs with a missing or incomplete collection are re-indexed from the
+        documents already stored in Redis.
+        """
+        started = time.monotonic()
+        outcomes: Dict[str, int] = {}
+        restored: List[Tuple[str, str]] = []
+        # Redis and Qdrant calls run in worker threads so the server keeps
+        # serving requests while many KBs are reconciled
+        keys = await asyncio.to_thread(lambda: list(self.redis_client.scan_iter(match="kb:*:*:status")))
+        for key in keys:
+            parts = key.split(":")
+            if len(parts) != 4:
+                continue
+            workspace_id, kb_id = parts[1], parts[2]
             try:
-                kb_item = await self._kb_queue.get()
-                logger.info(f"Processing KB registration: {kb_item.id}")
-                
-                self._set_kb_status(kb_item.workspace_id, kb_item.id, "initializing")
-                
-                if kb_item.source not in self.sources:
-                    logger.error(f"Unknown source type: {kb_item.source}")
-                    self._set_kb_status(kb_item.workspace_id, kb_item.id, "error")
-                    continue
-                
-                kb_config = {}
-                
-                if kb_item.source == "local_store":
-                    if not kb_item.url:
-                        logger.error(f"No path provided for local_store KB {kb_item.id}")
-                        self._set_kb_status(kb_item.workspace_id, kb_item.id, "error")
-                        continue
-                    
-                    path = os.path.normpath(kb_item.url)
-                    if not os.path.exists(path):
-                        logger.error(f"Path does not exist: {path} for KB {kb_item.id}")
-                        self._set_kb_status(kb_item.workspace_id, kb_item.id, "error")
-                        continue
-                    
-                    kb_config["path"] = path
-                else:
-                    kb_config["url"] = kb_item.url
-                
+                outcome, resubmit = await asyncio.to_thread(self._reconcile_kb, workspace_id, kb_id)
+                if resubmit is not None:
+                    await self._submit_ingestion(resubmit)
+            except Exception as e:
+                logger.error(f"Error reconciling KB {kb_id}: {str(e)}")
+                outcome = "failed"
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            if outcome == "restored":
+                restored.append((workspace_id, kb_id))
+        
+        record_startup("reconcile", time.monotonic() - started)
+        logger.info(f"Reconciled knowledge bases in {time.monotonic() - started:.2f}s: {outcomes}")
+        
+        started = time.monotonic()
+        await self.warm_up(restored)
+        record_startup("warm_up", time.monotonic() - started)
+        
+        purged = await asyncio.to_thread(self.upload_store.purge_expired)
+        if purged:
+            logger.info(f"Removed {purged} expired upload staging files")
+    
+    def _reconcile_kb(self, workspace_id: str, kb_id: str) -> Tuple[str, Optional[KnowledgeBaseRegistration]]:
+        """Restore one KB after a restart
+        
+        Returns what was done with it, and the registration to queue for
+        ingestion when it has to be resumed or re-indexed. A "restored" KB is
+        running and ready to be warmed up.
+        """
+        status = self._get_kb_status(workspace_id, kb_id)
+        kb_item = self._get_kb_registration(workspace_id, kb_id)
+        if kb_item is not None:
+            self.kb_names[kb_id] = kb_item.name or kb_id
+            if kb_item.source in self.sources and not self.query_only:
                 try:
                     reader = self.sources[kb_item.source]()
-                    print(kb_config)
-                    reader.configure(kb_config)
-                    
-                    docs = reader.load_documents()
-                    self.readers[kb_item.id] = reader
-                    # Store documents in Redis instead of self.documents
-                    self._store_kb_docs(kb_item.workspace_id, kb_item.id, docs)
-                    logger.info(f"Documents: {docs}")
-                    
-                    folder_structure = self._build_folder_structure(docs)
-                    self._set_kb_folder_structure(kb_item.workspace_id, kb_item.id, folder_structure)
-                    await asyncio.to_thread(self.create_indices, kb_item.id, kb_item.workspace_id)
-                    
-                    self._set_kb_status(kb_item.workspace_id, kb_item.id, "running")
-                    logger.info(f"KB {kb_item.id} is now running")
+                    reader.configure(self._reader_config(kb_item))
+                    self.readers[kb_id] = reader
                 except Exception as e:
-                    logger.error(f"Error processing KB {kb_item.id}: {str(e)}")
-                    self._set_kb_status(kb_item.workspace_id, kb_item.id, "error")
-            except Exception as e:
-                logger.error(f"Error in KB queue processing: {str(e)}")
-                await asyncio.sleep(5)
+                    logger.warning(f"Could not restore reader for KB {kb_id}: {str(e)}")
+        
+        checkpoint = self._get_ingest_checkpoint(workspace_id, kb_id)
+        if checkpoint.get("phase") in ("queued", "parsed", "indexing"):
+            if self.query_only:
+                # Left to a replica that ingests
+                return "pending", None
+            if kb_item is None:
+                logger.warning(f"Cannot resume ingestion of KB {kb_id}, registration not stored")
+                self._set_kb_status(workspace_id, kb_id, "error")
+                return "error", None
+            logger.info(f"Resuming interrupted ingestion of KB {kb_id} from phase {checkpoint['phase']}")
+            return "resumed", kb_item
+        
+        if status not in ("running", "disabled", "initializing"):
+            return status, None
+        
+        collection_name = f"kb_{kb_id}"
+        points = None
+        if self.qdrant_client.collection_exists(collection_name):
+            points = self.qdrant_client.count(collection_name, exact=True).count
+        expected = checkpoint.get("nodes_total")
+        
+        if points and (expected is None or points >= expected):
+            self.redis_client.set(f"kb:{kb_id}:index_created", "true")
+            if status == "disabled":
+                return "disabled", None
+            if status == "initializing":
+                self._set_kb_status(workspace_id, kb_id, "running")
+            return "restored", None
+        
+        logger.warning(f"Collection {collection_name} has {points} of {expected} expected points")
+        if self.query_only:
+            return "pending", None
+        if kb_item is not None and self.redis_client.exists(self._get_kb_docs_key(workspace_id, kb_id)):
+            # Documents are already parsed, only the vectors need rebuilding
+            self._set_ingest_checkpoint(workspace_id, kb_id, {"phase": "parsed"})
+            return "reindexing", kb_item
+        
+        self._set_kb_status(workspace_id, kb_id, "error")
+        return "error", None
+    
+    def _reader_config(self, kb_item: KnowledgeBaseRegistration) -> dict:
+        """Reader configuration for a registration"""
+        if kb_item.source == "local_store":
+            return {"path": os.path.normpath(kb_item.url)}
+        return {"url": kb_item.url}
+    
+    async def _ingest_kb(self, job: IngestionJob):
+        """Ingest one knowledge base registration, run by the ingestion scheduler"""
+        kb_item = job.kb_item
+        logger.info(f"Processing KB registration: {kb_item.id}")
+        
+        # Documents parsed before an interruption are reused rather than re-read
+        checkpoint = self._get_ingest_checkpoint(kb_item.workspace_id, kb_item.id)
+        resume = (
+            checkpoint.get("phase") in ("parsed", "indexing")
+            and self.redis_client.exists(self._get_kb_docs_key(kb_item.workspace_id, kb_item.id))
+        )
+        
+        self._set_kb_status(kb_item.workspace_id, kb_item.id, "initializing")
+        
+        if kb_item.source not in self.sources:
+            logger.error(f"Unknown source type: {kb_item.source}")
+            self._set_kb_status(kb_item.workspace_id, kb_item.id, "error")
+            return
+        
+        if kb_item.source == "local_store":
+            if not kb_item.url:
+                logger.error(f"No path provided for local_store KB {kb_item.id}")
+                self._set_kb_status(kb_item.workspace_id, kb_item.id, "error")
+                return
+            
+            path = os.path.normpath(kb_item.url)
+            if not os.path.exists(path):
+                logger.error(f"Path does not exist: {path} for KB {kb_item.id}")
+                self._set_kb_status(kb_item.workspace_id, kb_item.id, "error")
+                return
+        
+        kb_config = self._reader_config(kb_item)
+        write_lock = self._kb_write_lock(kb_item.id)
+        locked = False
+        
+        try:
+            # Uploads into the KB wait for the rebuild; polled so a cancelled job never holds the lock
+            while not write_lock.acquire(blocking=False):
+                job.raise_if_cancelled()
+                await asyncio.sleep(0.05)
+            locked = True
+            
+            reader = self.sources[kb_item.source]()
+            print(kb_config)
+            reader.configure(kb_config)
+            
+            self.readers[kb_item.id] = reader
+            
+            if not resume:
+                docs = await asyncio.to_thread(reader.load_documents)
+                job.raise_if_cancelled()
+                # Store documents in Redis instead of self.documents
+                self._store_kb_docs(kb_item.workspace_id, kb_item.id, docs)
+                logger.info(f"Documents: {docs}")
+                
+                folder_index = FolderIndex.from_documents(docs)
+                self._set_kb_folder_index(kb_item.workspace_id, kb_item.id, folder_index)
+                self._set_ingest_checkpoint(kb_item.workspace_id, kb_item.id, {"phase": "parsed"})
+            
+            # Pin the resolved model so queries keep embedding with what built the collection
+            if not resume or not self._get_kb_embedding(kb_item.workspace_id, kb_item.id):
+                backend, model_name = parse_embedding_engine(kb_item.embedding_engine)
+                embed_model = await asyncio.to_thread(self.get_embed_model, backend, model_name)
+                self._set_kb_embedding(kb_item.workspace_id, kb_item.id, {
+                    "backend": backend,
+                    "model": embed_model.model_name
+                })
+            
+            await asyncio.to_thread(self.create_indices, kb_item.id, kb_item.workspace_id, job.cancel_event, resume)
+            job.raise_if_cancelled()
+            
+            self._set_kb_status(kb_item.workspace_id, kb_item.id, "running")
+            logger.info(f"KB {kb_item.id} is now running")
+            self._spawn(self.warm_up([(kb_item.workspace_id, kb_item.id)]))
+        except IngestionCancelled:
+            logger.info(f"Ingestion of KB {kb_item.id} cancelled")
+        except Exception as e:
+            logger.error(f"Error processing KB {kb_item.id}: {str(e)}")
+            self._set_kb_status(kb_item.workspace_id, kb_item.id, "error")
+        finally:
+            if locked:
+                write_lock.release()
     
     def _get_kb_status_key(self, workspace_id: str, kb_id: str) -> str:
         """Generate Redis key for KB status"""
@@ -134,10 +466,30 @@ class KBManager:
         """Generate Redis key for KB folder structure"""
         return f"kb:{workspace_id}:{kb_id}:folder_structure"
     
+    def _get_kb_folder_version_key(self, workspace_id: str, kb_id: str) -> str:
+        """Generate Redis key for the token that changes whenever the KB folder index is stored"""
+        return f"kb:{workspace_id}:{kb_id}:folder_version"
+    
     def _get_kb_docs_key(self, workspace_id: str, kb_id: str) -> str:
         """Generate Redis key for KB documents"""
         return f"kb:{workspace_id}:{kb_id}:docs"
     
+    def _get_kb_embedding_key(self, workspace_id: str, kb_id: str) -> str:
+        """Generate Redis key for the embedding backend, model and dimension of a KB"""
+        return f"kb:{workspace_id}:{kb_id}:embedding"
+    
+    def _get_kb_ingest_checkpoint_key(self, workspace_id: str, kb_id: str) -> str:
+        """Generate Redis key for KB ingestion progress"""
+        return f"kb:{workspace_id}:{kb_id}:ingest_checkpoint"
+    
+    def _get_kb_registration_key(self, workspace_id: str, kb_id: str) -> str:
+        """Generate Redis key for the KB registration request"""
+        return f"kb:{workspace_id}:{kb_id}:registration"
+    
+    def _get_kb_embedding_stats_key(self, workspace_id: str, kb_id: str) -> str:
+        """Generate Redis key for the embedding cache stats of the last ingestion run"""
+        return f"kb:{workspace_id}:{kb_id}:embedding_stats"
+    
     def _set_kb_status(self, workspace_id: str, kb_id: str, status: str) -> None:
         """Set KB status in Redis"""
         key = self._get_kb_status_key(workspace_id, kb_id)
@@ -152,22 +504,142 @@ class KBManager:
             return "not_found"
         return status # type: ignore
     
-    def _set_kb_folder_structure(self, workspace_id: str, kb_id: str, folder_structure: list) -> None:
-        """Store KB folder structure in Redis"""
-        key = self._get_kb_folder_structure_key(workspace_id, kb_id)
-        self.redis_client.set(key, json.dumps(folder_structure))
+    def _set_kb_folder_index(self, workspace_id: str, kb_id: str, folder_index: FolderIndex) -> None:
+        """Keep a KB folder index in memory and persist it to Redis in its compact form"""
+        version = uuid.uuid4().hex
+        self.redis_client.set(self._get_kb_folder_structure_key(workspace_id, kb_id), json.dumps(folder_index.to_dict()))
+        self.redis_client.set(self._get_kb_folder_version_key(workspace_id, kb_id), version)
+        self._folder_indexes[(workspace_id, kb_id)] = (version, folder_index)
+    
+    def _get_kb_folder_index(self, workspace_id: str, kb_id: str) -> FolderIndex:
+        """Get a KB folder index, loading it from Redis only when another instance has changed it
+        
+        The nested trees stored by older versions are converted from the KB's
+        documents once and stored back in the compact form.
+        """
+        cached = self._folder_indexes.get((workspace_id, kb_id))
+        version = self.redis_client.get(self._get_kb_folder_version_key(workspace_id, kb_id))
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+        
+        folder_structure = self.redis_client.get(self._get_kb_folder_structure_key(workspace_id, kb_id))
+        if not folder_structure:
+            return FolderIndex()
+        data = json.loads(folder_structure) # type: ignore
+        if not isinstance(data, dict):
+            folder_index = FolderIndex.from_documents(self._get_kb_docs(workspace_id, kb_id))
+            self._set_kb_folder_index(workspace_id, kb_id, folder_index)
+            return folder_index
+        
+        folder_index = FolderIndex.from_dict(data)
+        if version is not None:
+            self._folder_indexes[(workspace_id, kb_id)] = (version, folder_index)
+        return folder_index
+    
+    def _set_kb_embedding(self, workspace_id: str, kb_id: str, embedding: dict) -> None:
+        """Store the embedding settings of a KB collection in Redis"""
+        key = self._get_kb_embedding_key(workspace_id, kb_id)
+        self.redis_client.set(key, json.dumps(embedding))
+    
+    def _get_kb_embedding(self, workspace_id: str, kb_id: str) -> dict:
+        """Get the embedding settings of a KB collection from Redis"""
+        key = self._get_kb_embedding_key(workspace_id, kb_id)
+        embedding = self.redis_client.get(key)
+        return json.loads(embedding) if embedding else {} # type: ignore
     
-    def _get_kb_folder_structure(self, workspace_id: str, kb_id: str) -> list:
-        """Get KB folder structure from Redis"""
-        key = self._get_kb_folder_structure_key(workspace_id, kb_id)
-        folder_structure = self.redis_client.get(key)
-        return json.loads(folder_structure) if folder_structure else [] # type: ignore
+    def get_embed_model(self, backend: str, model_name: Optional[str] = None):
+        """Return the shared embedding model for a backend and model name"""
+        if self._embed_model_override is not None:
+            return self._embed_model_override
+        key = (backend, model_name)
+        embed_model = self._embed_models.get(key)
+        if embed_model is None:
+            with self._load_lock:
+                embed_model = self._embed_models.get(key)
+                if embed_model is None:
+                    with span("kb.load_embed_model", backend=backend):
+                        embed_model = create_embedding(backend, model_name)
+                    self._embed_models[key] = embed_model
+                    self._embed_models[(backend, embed_model.model_name)] = embed_model
+                    logger.info(f"Loaded {backend} embedding model {embed_model.model_name}")
+        return embed_model
+    
+    def _get_kb_embed_model(self, workspace_id: str, kb_id: str):
+        """Return the embedding model a KB collection was built with"""
+        embedding = self._get_kb_embedding(workspace_id, kb_id)
+        if not embedding.get("backend"):
+            # KBs indexed before embedding settings were recorded use the default model
+            return self.embed_model
+        return self.get_embed_model(embedding["backend"], embedding.get("model"))
+    
+    def _get_collection_dim(self, collection_name: str) -> Optional[int]:
+        """Return the dense vector size of a Qdrant collection"""
+        vectors = self.qdrant_client.get_collection(collection_name).config.params.vectors
+        if isinstance(vectors, dict):
+            vectors = next(iter(vectors.values()), None)
+        return getattr(vectors, "size", None)
+    
+    def _cached_collection_info(self, kind: str, collection_name: str, load):
+        """Return a cached fact about a collection, calling load() when missing or expired"""
+        cached = self._collection_info.get((kind, collection_name))
+        if cached is not None and time.monotonic() - cached[0] < self.collection_info_ttl:
+            return cached[1]
+        value = load()
+        self._collection_info[(kind, collection_name)] = (time.monotonic(), value)
+        return value
+    
+    def _forget_collections(self, *collection_names: str) -> None:
+        """Drop cached facts about collections that were just created or deleted"""
+        for key in [key for key in self._collection_info if key[1] in collection_names]:
+            self._collection_info.pop(key, None)
+    
+    def _get_dense_vector_name(self, collection_name: str) -> Optional[str]:
+        """Return the dense vector name of a collection, None for the legacy unnamed vector"""
+        def load() -> Optional[str]:
+            vectors = self.qdrant_client.get_collection(collection_name).config.params.vectors
+            if isinstance(vectors, dict):
+                return next(iter(vectors), None)
+            return None
+        
+        return self._cached_collection_info("vector_name", collection_name, load)
+    
+    def _summary_collection_exists(self, kb_id: str) -> bool:
+        collection_name = self._summary_collection_name(kb_id)
+        return self._cached_collection_info(
+            "exists", collection_name, lambda: self.qdrant_client.collection_exists(collection_name)
+        )
+    
+    def _set_kb_registration(self, kb_item: KnowledgeBaseRegistration) -> None:
+        """Store the KB registration in Redis so ingestion can be resumed after a restart"""
+        key = self._get_kb_registration_key(kb_item.workspace_id, kb_item.id)
+        self.redis_client.set(key, kb_item.json())
+    
+    def _get_kb_registration(self, workspace_id: str, kb_id: str) -> Optional[KnowledgeBaseRegistration]:
+        """Get the KB registration from Redis"""
+        key = self._get_kb_registration_key(workspace_id, kb_id)
+        registration = self.redis_client.get(key)
+        return KnowledgeBaseRegistration.parse_raw(registration) if registration else None # type: ignore
+    
+    def _set_ingest_checkpoint(self, workspace_id: str, kb_id: str, checkpoint: dict) -> None:
+        """Store KB ingestion progress in Redis"""
+        key = self._get_kb_ingest_checkpoint_key(workspace_id, kb_id)
+        self.redis_client.set(key, json.dumps(checkpoint))
+    
+    def _get_ingest_checkpoint(self, workspace_id: str, kb_id: str) -> dict:
+        """Get KB ingestion progress from Redis"""
+        key = self._get_kb_ingest_checkpoint_key(workspace_id, kb_id)
+        checkpoint = self.redis_client.get(key)
+        return json.loads(checkpoint) if checkpoint else {} # type: ignore
     
     def _store_kb_docs(self, workspace_id: str, kb_id: str, docs: list) -> None:
         """Store KB documents in Redis"""
         key = self._get_kb_docs_key(workspace_id, kb_id)
-        
-        # Convert documents to serializable format
+        serializable_docs = self._serialize_docs(docs)
+        self.redis_client.set(key, json.dumps(serializable_docs))
+        logger.info(f"Stored {len(serializable_docs)} documents for KB {kb_id} in Redis")
+    
+    def _serialize_docs(self, docs: list) -> list:
+        """Convert documents to the JSON-serializable form stored in Redis"""
         serializable_docs = []
         for doc in docs:
             if hasattr(doc, 'dict'):
@@ -186,9 +658,7 @@ class KBManager:
             else:
                 # If it's already a dict
                 serializable_docs.append(doc)
-        
-        self.redis_client.set(key, json.dumps(serializable_docs))
-        logger.info(f"Stored {len(serializable_docs)} documents for KB {kb_id} in Redis")
+        return serializable_docs
     
     def _get_kb_docs(self, workspace_id: str, kb_id: str) -> list:
         """Get KB documents from Redis"""
@@ -198,25 +668,47 @@ class KBManager:
     
     def register_knowledge_base(self, kb_item: KnowledgeBaseRegistration):
         """Register a new knowledge base and queue it for processing"""
+        if self.query_only:
+            return {"status": "error", "message": "This instance is query-only, register knowledge bases on an ingesting instance"}
         self._set_kb_status(kb_item.workspace_id, kb_item.id, "disabled")
+        self._set_kb_registration(kb_item)
+        # A new registration always starts from scratch, the source may have changed
+        self._set_ingest_checkpoint(kb_item.workspace_id, kb_item.id, {"phase": "queued"})
         
         self.kb_names[kb_item.id] = kb_item.name or kb_item.id
         
-        asyncio.create_task(self._kb_queue.put(kb_item))
+        asyncio.create_task(self._submit_ingestion(kb_item))
         
         return {"status": "queued", "id": kb_item.id}
     
+    async def _submit_ingestion(self, kb_item: KnowledgeBaseRegistration):
+        """Queue a registration with an explicit priority, or one estimated from its size"""
+        priority = kb_item.priority
+        if priority is None:
+            path = os.path.normpath(kb_item.url) if kb_item.url else None
+            priority = await asyncio.to_thread(estimate_priority, path)
+        self.ingestion_scheduler.submit(kb_item, priority)
+    
     def get_kb_status(self, kb_id: str, workspace_id: str):
         """Get the status of a knowledge base"""
         return self._get_kb_status(workspace_id, kb_id)
     
-    def create_indices(self, source_name=None, workspace_id=None):
+    def create_indices(self, source_name=None, workspace_id=None, cancel_event: Optional[threading.Event] = None, resume: bool = False):
         """Create vector indices for document sources and store in Qdrant
         
         Args:
             source_name: Optional name of specific source to index
             workspace_id: Optional workspace ID for the source
+            cancel_event: Optional event that aborts indexing with IngestionCancelled once set
+            resume: Continue from the last ingestion checkpoint instead of rebuilding
         """
+        from llama_index.core import VectorStoreIndex, StorageContext
+        from llama_index.vector_stores.qdrant import QdrantVectorStore # type: ignore
+        
+        def check_cancelled(kb_id):
+            if cancel_event is not None and cancel_event.is_set():
+                raise IngestionCancelled(kb_id)
+        
         if source_name:
             sources_to_index = [source_name]
         else:
@@ -247,37 +739,41 @@ class KBManager:
             docs = self._get_kb_docs(src_workspace_id, src_name)
             logger.info(f"Creating index for {src_name} with {len(docs)} documents")
             
-            original_docs = []
-            for doc in docs:
-                if 'original_doc' in doc and doc['original_doc']:
-                    # Reconstruct a Document object from the stored data
-                    from llama_index.core import Document as LlamaDocument
-                    from llama_index.core.schema import TextNode
-                    
-                    original_doc_data = doc['original_doc']
-                    text = original_doc_data.get('text', '')
-                    metadata = original_doc_data.get('metadata', {})
-                    
-                    original_doc = LlamaDocument(
-                        text=text,
-                        metadata=metadata,
-                        id_=original_doc_data.get('id_')
-                    )
-                    original_docs.append(original_doc)
-            
+            original_docs = self._llama_documents(docs)
             if not original_docs:
                 logger.warning(f"No original documents found for {src_name}")
                 continue
             
             collection_name = f"kb_{src_name}"
+            check_cancelled(src_name)
+            
+            # Chunk ids are deterministic, so a checkpoint is only valid for the
+            # same chunking settings and upserting a batch twice is harmless
+            chunk_settings = {
+                "chunk_size": self.chunk_size,
+                "chunk_overlap": self.chunk_overlap,
+                "chunk_dedup_distance": self.chunk_dedup_distance
+            }
+            checkpoint = self._get_ingest_checkpoint(src_workspace_id, src_name) if resume else {}
+            nodes_done = 0
+            if (
+                checkpoint.get("phase") == "indexing"
+                and checkpoint.get("settings") == chunk_settings
+                and self.qdrant_client.collection_exists(collection_name)
+            ):
+                nodes_done = checkpoint.get("nodes_done", 0)
+                logger.info(f"Resuming index of {src_name} after {nodes_done} chunks")
             
             # Delete the collection if it exists
-            try:
-                if self.qdrant_client.collection_exists(collection_name):
-                    logger.info(f"Deleting existing collection {collection_name} for recreation")
-                    self.qdrant_client.delete_collection(collection_name)
-            except Exception as e:
-                logger.error(f"Error checking/deleting collection {collection_name}: {str(e)}")
+            if not nodes_done:
+                try:
+                    for name in (collection_name, self._summary_collection_name(src_name)):
+                        if self.qdrant_client.collection_exists(name):
+                            logger.info(f"Deleting existing collection {name} for recreation")
+                            self.qdrant_client.delete_collection(name)
+                            self._forget_collections(name)
+                except Exception as e:
+                    logger.error(f"Error checking/deleting collection {collection_name}: {str(e)}")
             
             vector_store = QdrantVectorStore(
                 client=self.qdrant_client,
@@ -286,218 +782,624 @@ class KBManager:
             
             storage_context = StorageContext.from_defaults(vector_store=vector_store)
             
-            # Create the index but don't store it in memory
-            VectorStoreIndex.from_documents(
-                original_docs,
+            base_embed_model = self._get_kb_embed_model(src_workspace_id, src_name)
+            
+            # A fresh wrapper per run keeps the hit-ratio stats scoped to this ingestion
+            embed_model = base_embed_model
+            if self.embedding_store is not None:
+                embed_model = CachedEmbedding(base_embed_model, self.embedding_store)
+            
+            nodes = self._split_documents(original_docs)
+            check_cancelled(src_name)
+            
+            # Create the index but don't store it in memory. Chunks are embedded and
+            # upserted batch by batch with progress checkpointed after each batch.
+            index = VectorStoreIndex(
+                [],
                 storage_context=storage_context,
-                embed_model=self.embed_model
+                embed_model=embed_model
             )
+            try:
+                for start in range(nodes_done, len(nodes), self.ingest_batch_size):
+                    check_cancelled(src_name)
+                    batch = nodes[start:start + self.ingest_batch_size]
+                    index.insert_nodes(batch)
+                    if start == nodes_done:
+                        # Index filter fields once the collection exists, before the bulk of the upload
+                        ensure_payload_indexes(self.qdrant_client, collection_name)
+                    # A cancelled run must not overwrite the checkpoint of the KB's next run
+                    check_cancelled(src_name)
+                    self._set_ingest_checkpoint(src_workspace_id, src_name, {
+                        "phase": "indexing",
+                        "settings": chunk_settings,
+                        "nodes_done": start + len(batch),
+                        "nodes_total": len(nodes),
+                        "last_point_id": batch[-1].node_id
+                    })
+                check_cancelled(src_name)
+                
+                if self._wants_summaries(original_docs):
+                    self._build_document_summaries(src_name, original_docs, embed_model, check_cancelled)
+                check_cancelled(src_name)
+            except IngestionCancelled:
+                # The KB was deleted while embedding, drop what was already written
+                self.qdrant_client.delete_collection(collection_name)
+                if self.qdrant_client.collection_exists(self._summary_collection_name(src_name)):
+                    self.qdrant_client.delete_collection(self._summary_collection_name(src_name))
+                self._forget_collections(self._summary_collection_name(src_name))
+                raise
+            finally:
+                # The chunk collection may have been created by the vector store during this run
+                self._forget_collections(collection_name)
+            
+            embedding = self._get_kb_embedding(src_workspace_id, src_name)
+            embedding.setdefault("model", base_embed_model.model_name)
+            embedding["dim"] = self._get_collection_dim(collection_name)
+            self._set_kb_embedding(src_workspace_id, src_name, embedding)
+            
+            if isinstance(embed_model, CachedEmbedding):
+                stats = embed_model.stats
+                logger.info(f"Embedding cache for {src_name}: {stats['hits']} hits, {stats['misses']} misses (hit ratio {stats['hit_ratio']})")
+                self.redis_client.set(
+                    self._get_kb_embedding_stats_key(src_workspace_id, src_name),
+                    json.dumps(stats)
+                )
             
             # Store in Redis that this index has been created
             index_key = f"kb:{src_name}:index_created"
             self.redis_client.set(index_key, "true")
+            self._set_ingest_checkpoint(src_workspace_id, src_name, {
+                "phase": "done",
+                "settings": chunk_settings,
+                "nodes_done": len(nodes),
+                "nodes_total": len(nodes)
+            })
             
             logger.info(f"Successfully created index for {src_name} in Qdrant collection '{collection_name}'")
         
         return True
 
-    def generate_context(self, workspace_id: str, query_text: str, knowledge_bases: Optional[List[str]] = None, top_k: int = 5):
-       """Generate context from knowledge base for LLM augmentation"""
-       results = self.query_knowledge_base(workspace_id, query_text, knowledge_bases, top_k)
-       
-       context = "Relevant information:\n\n"
-       logger.info(f"Results: {len(results)}")
-       for i, result in enumerate(results):
-           context += f"[Document {i+1}] {result['text']}\n\n"
-        
-       return context
+    def _llama_documents(self, docs: list, doc_ids: Optional[set] = None) -> list:
+        """Rebuild the llama_index documents to index from stored documents, optionally only doc_ids"""
+        from llama_index.core import Document as LlamaDocument
+        
+        # Identical files are only indexed once, under their first copy
+        duplicate_docs: Dict[str, List[dict]] = {}
+        for doc in docs:
+            if doc.get('duplicateOf'):
+                duplicate_docs.setdefault(doc['duplicateOf'], []).append(doc)
+        
+        original_docs = []
+        for doc in docs:
+            if doc_ids is not None and doc.get('id') not in doc_ids:
+                continue
+            if 'original_doc' in doc and doc['original_doc']:
+                # Reconstruct a Document object from the stored data
+                original_doc_data = doc['original_doc']
+                text = original_doc_data.get('text', '')
+                metadata = dict(original_doc_data.get('metadata', {}))
+                duplicates = duplicate_docs.get(doc.get('id'), [])
+                metadata['doc_id'] = doc.get('id')
+                metadata['duplicate_doc_ids'] = [duplicate['id'] for duplicate in duplicates]
+                metadata.update(filter_metadata(doc, duplicates))
+                
+                original_doc = LlamaDocument(
+                    text=text,
+                    metadata=metadata,
+                    id_=original_doc_data.get('id_'),
+                    excluded_embed_metadata_keys=list(NON_CONTENT_METADATA_KEYS),
+                    excluded_llm_metadata_keys=list(NON_CONTENT_METADATA_KEYS)
+                )
+                original_docs.append(original_doc)
+        return original_docs
 
-    def query_knowledge_base(self, workspace_id: str, query_text: str, knowledge_bases: Optional[List[str]] = None, top_k: int = 5):
-        """Query the knowledge base and return relevant documents"""
-        results = []
+    def _summary_collection_name(self, kb_id: str) -> str:
+        return f"kb_{kb_id}_summaries"
+
+    def _wants_summaries(self, documents: list) -> bool:
+        """Whether a KB of these documents gets a summary collection
         
-        if knowledge_bases and len(knowledge_bases) > 0:
-            logger.info(f"Querying knowledge bases: {knowledge_bases}")
-            sources_to_query = []
-            for kb_id in knowledge_bases:
-                status = self._get_kb_status(workspace_id, kb_id)
-                logger.info(f"Checking status of {kb_id} in {workspace_id}: {status}")
-                if status == "running":
-                    sources_to_query.append(kb_id)
+        Readers split some files into several documents, e.g. PDFs per page,
+        so the threshold counts source files.
+        """
+        if not self.doc_summaries:
+            return False
+        files = {doc.metadata.get("file_path") or doc.id_ for doc in documents}
+        return len(files) >= self.summary_min_docs
+
+    def _summarize_document(self, doc) -> str:
+        """Summary text of a document for the coarse retrieval stage"""
+        title = doc.metadata.get("file_name", "")
+        if self.summary_mode == "llm":
+            try:
+                prompt = doc_summary_prompt.format(title=title, text=doc.text[:self.summary_max_chars * 4])
+                summary = self.llm.complete(prompt).text.strip()
+                if summary:
+                    return f"{title}\n{summary}"
+            except Exception as e:
+                logger.warning(f"Falling back to an extractive summary for {title}: {str(e)}")
+        
+        folder = "/".join(doc.metadata.get("folder_ancestors", [])[-1:])
+        return f"{title}\n{folder}\n{doc.text[:self.summary_max_chars]}".strip()
+
+    def _build_document_summaries(self, src_name: str, documents: list, embed_model, check_cancelled, append: bool = False) -> None:
+        """Embed one summary per document into the KB's summary collection
+        
+        The collection is rebuilt from scratch unless append is set, which adds
+        the documents' summaries to the existing collection.
+        """
+        collection_name = self._summary_collection_name(src_name)
+        started = time.monotonic()
+        
+        summaries = []
+        for doc in documents:
+            check_cancelled(src_name)
+            summaries.append(self._summarize_document(doc))
+        
+        exists = self.qdrant_client.collection_exists(collection_name)
+        if exists and not append:
+            self.qdrant_client.delete_collection(collection_name)
+            self._forget_collections(collection_name)
+            exists = False
+        
+        for start in range(0, len(documents), self.ingest_batch_size):
+            check_cancelled(src_name)
+            batch_docs = documents[start:start + self.ingest_batch_size]
+            vectors = embed_model.get_text_embedding_batch(summaries[start:start + self.ingest_batch_size])
+            if start == 0 and not exists:
+                self.qdrant_client.create_collection(
+                    collection_name,
+                    vectors_config=qdrant_models.VectorParams(size=len(vectors[0]), distance=qdrant_models.Distance.COSINE)
+                )
+                ensure_payload_indexes(self.qdrant_client, collection_name)
+                self._forget_collections(collection_name)
+            self.qdrant_client.upsert(collection_name, points=[
+                qdrant_models.PointStruct(
+                    id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"summary:{doc.id_}")),
+                    vector=vector,
+                    payload={
+                        # Chunk payloads carry the id of the document they were split from as ref_doc_id
+                        "ref_doc_id": doc.id_,
+                        "doc_id": doc.metadata["doc_id"],
+                        "title": doc.metadata.get("file_name", ""),
+                        **{key: doc.metadata[key] for key in ("folder_ancestors", "doc_type", "tags", "date_ts") if key in doc.metadata}
+                    }
+                )
+                for doc, vector in zip(batch_docs, vectors)
+            ])
+        
+        logger.info(f"Built {len(documents)} document summaries for {src_name} in {time.monotonic() - started:.1f}s")
+
+    def _candidate_documents(self, source: str, embeddings: List[List[float]], qdrant_filter, top_k: int) -> Optional[List[List[str]]]:
+        """First retrieval stage, the ref_doc_ids of the documents whose summaries best match each query
+        
+        Returns None when document summaries are disabled or the KB has no
+        summary collection, and it must be searched flat.
+        """
+        if not self.doc_summaries or not self._summary_collection_exists(source):
+            return None
+        collection_name = self._summary_collection_name(source)
+        
+        limit = max(self.summary_candidates, top_k)
+        with span("kb.search_summaries", kb_id=source, queries=len(embeddings)):
+            responses = self.qdrant_client.query_batch_points(
+                collection_name,
+                requests=[
+                    qdrant_models.QueryRequest(query=embedding, filter=qdrant_filter, limit=limit, with_payload=["ref_doc_id"])
+                    for embedding in embeddings
+                ]
+            )
+        return [[point.payload["ref_doc_id"] for point in response.points] for response in responses]
+
+    def _split_documents(self, documents: list) -> list:
+        """Split documents into chunks, dropping near-duplicate chunks
+        
+        A dropped chunk's document id is recorded in the duplicate_doc_ids of the
+        chunk that was kept, so results can still be traced back to every copy,
+        and its folders, tags, type and date are merged into the kept chunk's so
+        filters on the dropped copy still find the content.
+        """
+        from llama_index.core.node_parser import SentenceSplitter
+        from llama_index.core.schema import MetadataMode
+        
+        splitter = SentenceSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            # Stable chunk ids make re-upserting after a resume idempotent
+            id_func=lambda i, doc: str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc.id_}:{i}"))
+        )
+        nodes = splitter.get_nodes_from_documents(documents)
+        if self.chunk_dedup_distance < 0:
+            return nodes
+        
+        deduplicator = ChunkDeduplicator(max_distance=self.chunk_dedup_distance)
+        kept = {}
+        for node in nodes:
+            canonical_id = deduplicator.add(node.node_id, node.get_content(metadata_mode=MetadataMode.NONE))
+            if canonical_id is None:
+                kept[node.node_id] = node
+                continue
             
-            not_running = [kb_id for kb_id in knowledge_bases if kb_id not in sources_to_query]
-            if not_running:
-                logger.warning(f"Some requested knowledge bases are not running: {not_running}")
-        else:
-            # Get all running knowledge bases from Redis
-            sources_to_query = []
-            for key in self.redis_client.scan_iter(match=f"kb:{workspace_id}:*:status"):
-                parts = key.split(":")
-                if len(parts) >= 4:
-                    kb_id = parts[2]
-                    status = self.redis_client.get(key)
+            canonical = kept[canonical_id]
+            doc_id = node.metadata.get("doc_id")
+            if doc_id and doc_id != canonical.metadata.get("doc_id"):
+                refs = canonical.metadata.get("duplicate_doc_ids", [])
+                if doc_id not in refs:
+                    canonical.metadata["duplicate_doc_ids"] = refs + [doc_id]
+                merge_filter_metadata(canonical.metadata, node.metadata)
+        
+        if len(kept) < len(nodes):
+            logger.info(f"Dropped {len(nodes) - len(kept)} near-duplicate chunks out of {len(nodes)}")
+        return list(kept.values())
+
+    def generate_context(self, workspace_id: str, query_text: str, knowledge_bases: Optional[List[str]] = None, top_k: int = 5, filters: Optional[RetrievalFilters] = None):
+       """Generate context from knowledge base for LLM augmentation"""
+       results = self.query_knowledge_base(workspace_id, query_text, knowledge_bases, top_k, filters)
+       return self._format_context(results)
+
+    def _format_context(self, results: list) -> str:
+        """Format retrieval results as the context section of the prompt"""
+        context = "Relevant information:\n\n"
+        logger.info(f"Results: {len(results)}")
+        for i, result in enumerate(results):
+            context += f"[Document {i+1}] {result['text']}\n\n"
+        
+        return context
+
+    def _build_prompt(self, query: QueryRequest, query_text: str, context: str) -> str:
+        prompt_template = lng_prompt[query.preferred_language]
+        return prompt_template.format(
+            preferred_language=lng_map[query.preferred_language],
+            context=context,
+            conversation_history=query.conversation_history,
+            query=query_text
+        )
+
+    def _resolve_sources(self, workspace_id: str, knowledge_bases: Optional[List[str]] = None) -> List[str]:
+        """Return the requested knowledge bases that are running, or all running ones in the workspace"""
+        with span("kb.status", workspace_id=workspace_id):
+            if knowledge_bases and len(knowledge_bases) > 0:
+                logger.info(f"Querying knowledge bases: {knowledge_bases}")
+                sources_to_query = []
+                for kb_id in knowledge_bases:
+                    status = self._get_kb_status(workspace_id, kb_id)
+                    logger.info(f"Checking status of {kb_id} in {workspace_id}: {status}")
                     if status == "running":
                         sources_to_query.append(kb_id)
-        
-        logger.info(f"Querying knowledge bases: {sources_to_query}")
-        
-        for source in sources_to_query:
-            # Check if index exists
-            index_key = f"kb:{source}:index_created"
-            if not self.redis_client.exists(index_key):
-                # Check if documents exist for this source
-                docs_key = self._get_kb_docs_key(workspace_id, source)
-                if self.redis_client.exists(docs_key):
-                    logger.info(f"Creating index for {source} on demand")
-                    self.create_indices(source, workspace_id)
-                else:
-                    logger.warning(f"No documents found for source {source}")
-                    continue
             
-            # Create a temporary query engine for this source
-            collection_name = f"kb_{source}"
-            vector_store = QdrantVectorStore(
-                client=self.qdrant_client,
-                collection_name=collection_name
-            )
-            storage_context = StorageContext.from_defaults(vector_store=vector_store)
-            index = VectorStoreIndex.from_vector_store(
-                vector_store=vector_store,
-                storage_context=storage_context,
-                embed_model=self.embed_model
+                not_running = [kb_id for kb_id in knowledge_bases if kb_id not in sources_to_query]
+                if not_running:
+                    logger.warning(f"Some requested knowledge bases are not running: {not_running}")
+            else:
+                # Get all running knowledge bases from Redis
+                sources_to_query = []
+                for key in self.redis_client.scan_iter(match=f"kb:{workspace_id}:*:status"):
+                    parts = key.split(":")
+                    if len(parts) >= 4:
+                        kb_id = parts[2]
+                        status = self.redis_client.get(key)
+                        if status == "running":
+                            sources_to_query.append(kb_id)
+        
+            logger.info(f"Querying knowledge bases: {sources_to_query}")
+            return sources_to_query
+
+    def _ensure_index(self, workspace_id: str, source: str) -> bool:
+        """Make sure a source has a collection, indexing stored documents on demand"""
+        # Check if index exists
+        index_key = f"kb:{source}:index_created"
+        if not self.redis_client.exists(index_key):
+            if self.query_only:
+                logger.warning(f"Source {source} is not indexed yet")
+                return False
+            # Check if documents exist for this source
+            docs_key = self._get_kb_docs_key(workspace_id, source)
+            if self.redis_client.exists(docs_key):
+                logger.info(f"Creating index for {source} on demand")
+                self.create_indices(source, workspace_id)
+            else:
+                logger.warning(f"No documents found for source {source}")
+                return False
+        return True
+
+    def _search_source(self, workspace_id: str, source: str, query_text: str, top_k: int = 5, filters: Optional[RetrievalFilters] = None, hierarchical: bool = False) -> list:
+        """Retrieve the top_k chunks of a single knowledge base, optionally only from documents matching filters
+        
+        With hierarchical set, KBs with a summary collection are searched in two stages.
+        """
+        if not self._ensure_index(workspace_id, source):
+            return []
+        
+        collection_name = f"kb_{source}"
+        embed_model = self._get_kb_embed_model(workspace_id, source)
+        
+        # Embed separately so embedding and Qdrant search are timed on their own
+        with span("kb.embed", kb_id=source):
+            embedding = embed_model.get_query_embedding(query_text)
+        
+        # Filters are applied by Qdrant during the search, not on the returned hits
+        qdrant_filter = build_qdrant_filter(filters)
+        if hierarchical:
+            candidates = self._candidate_documents(source, [embedding], qdrant_filter, top_k)
+            if candidates is not None:
+                if not candidates[0]:
+                    return []
+                qdrant_filter = restrict_to_documents(qdrant_filter, candidates[0])
+        # Searched directly rather than through a llama_index retriever, so queries
+        # do not need the vector store integration loaded
+        with span("kb.search", kb_id=source, top_k=top_k, filtered=qdrant_filter is not None):
+            response = self.qdrant_client.query_points(
+                collection_name,
+                query=embedding,
+                using=self._get_dense_vector_name(collection_name),
+                query_filter=qdrant_filter,
+                limit=top_k,
+                with_payload=True
             )
+        
+        results = []
+        for point in response.points:
+            node = metadata_dict_to_node(point.payload)
+            results.append({
+                "source": source,
+                "text": node.text,
+                "score": point.score,
+                "metadata": node.metadata
+            })
+        return results
+
+    def query_knowledge_base(self, workspace_id: str, query_text: str, knowledge_bases: Optional[List[str]] = None, top_k: int = 5, filters: Optional[RetrievalFilters] = None, hierarchical: bool = False):
+        """Query the knowledge base and return relevant documents"""
+        results = []
+        
+        for source in self._resolve_sources(workspace_id, knowledge_bases):
+            results.extend(self._search_source(workspace_id, source, query_text, top_k, filters, hierarchical))
+        
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results[:top_k]
+
+    def query_knowledge_base_batch(self, workspace_id: str, queries: List[str], knowledge_bases: Optional[List[str]] = None, top_k: int = 5, filters: Optional[RetrievalFilters] = None, hierarchical: bool = False) -> List[list]:
+        """Run several queries at once, returns the top_k results of each query in order
+        
+        Statuses are resolved once for the batch, the queries are embedded in one
+        batch per embedding model and each collection gets a single batch search.
+        """
+        results: List[list] = [[] for _ in queries]
+        if not queries:
+            return results
+        
+        qdrant_filter = build_qdrant_filter(filters)
+        embeddings_by_model: Dict[int, List[List[float]]] = {}
+        
+        for source in self._resolve_sources(workspace_id, knowledge_bases):
+            if not self._ensure_index(workspace_id, source):
+                continue
             
-            query_engine = index.as_query_engine(
-                similarity_top_k=top_k,
-                llm=self.llm
-            )
-            response = query_engine.query(query_text)
+            embed_model = self._get_kb_embed_model(workspace_id, source)
+            embeddings = embeddings_by_model.get(id(embed_model))
+            if embeddings is None:
+                with span("kb.embed", queries=len(queries)):
+                    embeddings = embed_queries(embed_model, queries)
+                embeddings_by_model[id(embed_model)] = embeddings
             
-            if hasattr(response, 'source_nodes'):
-                for node in response.source_nodes:
-                    results.append({
+            # Queries whose first stage found no candidate documents are not searched
+            searched = list(range(len(queries)))
+            query_filters = [qdrant_filter] * len(queries)
+            if hierarchical:
+                candidates = self._candidate_documents(source, embeddings, qdrant_filter, top_k)
+                if candidates is not None:
+                    searched = [i for i, doc_ids in enumerate(candidates) if doc_ids]
+                    query_filters = [restrict_to_documents(qdrant_filter, doc_ids) if doc_ids else None for doc_ids in candidates]
+            if not searched:
+                continue
+            
+            collection_name = f"kb_{source}"
+            vector_name = self._get_dense_vector_name(collection_name)
+            with span("kb.search", kb_id=source, top_k=top_k, queries=len(queries), filtered=qdrant_filter is not None):
+                responses = self.qdrant_client.query_batch_points(
+                    collection_name,
+                    requests=[
+                        qdrant_models.QueryRequest(
+                            query=embedding,
+                            using=vector_name,
+                            filter=query_filter,
+                            limit=top_k,
+                            with_payload=True
+                        )
+                        for embedding, query_filter in ((embeddings[i], query_filters[i]) for i in searched)
+                    ]
+                )
+            
+            for query_results, response in zip((results[i] for i in searched), responses):
+                for point in response.points:
+                    node = metadata_dict_to_node(point.payload)
+                    query_results.append({
                         "source": source,
-                        "text": node.node.text,
-                        "score": node.score,
-                        "metadata": node.node.metadata
+                        "text": node.text,
+                        "score": point.score,
+                        "metadata": node.metadata
                     })
         
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:top_k]
+        for i, query_results in enumerate(results):
+            query_results.sort(key=lambda x: x["score"], reverse=True)
+            results[i] = query_results[:top_k]
+        return results
+
+    async def iter_retrieval(self, workspace_id: str, query_text: str, knowledge_bases: Optional[List[str]] = None, top_k: int = 5, filters: Optional[RetrievalFilters] = None, hierarchical: bool = False):
+        """Yield (source, results) for each knowledge base as soon as its search completes
+        
+        Knowledge bases are searched concurrently. Iteration stops once the
+        retrieval quorum has answered, or once the deadline has passed and at
+        least one knowledge base has answered; slower searches are dropped.
+        """
+        sources = await asyncio.to_thread(self._resolve_sources, workspace_id, knowledge_bases)
+        if not sources:
+            return
+        
+        tasks = {
+            asyncio.create_task(asyncio.to_thread(self._search_source, workspace_id, source, query_text, top_k, filters, hierarchical)): source
+            for source in sources
+        }
+        pending = set(tasks)
+        quorum = max(1, math.ceil(len(sources) * self.retrieval_quorum))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.retrieval_deadline
+        completed = 0
+        
+        try:
+            while pending:
+                timeout = max(0.0, deadline - loop.time()) if completed else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    source = tasks[task]
+                    try:
+                        results = task.result()
+                    except Exception as e:
+                        logger.error(f"Error retrieving from {source}: {str(e)}")
+                        results = []
+                    completed += 1
+                    yield source, results
+                
+                if completed >= quorum or (completed and loop.time() >= deadline):
+                    break
+        finally:
+            if pending:
+                logger.warning(f"Generating without {len(pending)} knowledge bases that missed the retrieval deadline")
+                for task in pending:
+                    task.cancel()
+
+    async def stream_answer_from_results(self, query: QueryRequest, results: list):
+        """Stream an answer over already retrieved results"""
+        query_text = query.query[-1] if isinstance(query.query, list) else query.query
+        
+        with span("kb.prompt", results=len(results)):
+            results = sorted(results, key=lambda x: x["score"], reverse=True)[:query.top_k]
+            prompt = self._build_prompt(query, query_text, self._format_context(results))
+        
+        if not self.response_cache.is_enabled(query.workspace_id):
+            return await self._timed_stream(prompt)
+        
+        model = self.llm.metadata.model_name
+        cached = self.response_cache.get(model, prompt)
+        if cached is not None:
+            logger.info("Replaying cached answer")
+            return replay_answer(cached)
+        
+        return self._cache_stream(model, prompt, await self._timed_stream(prompt))
+    
+    async def _timed_stream(self, prompt: str):
+        """Start an LLM completion stream, recording time to its first and last token"""
+        started = time.perf_counter()
+        gen = await self.llm.astream_complete(prompt)
+        
+        async def timed():
+            first = True
+            async for chunk in gen:
+                if first:
+                    record_span("llm.first_token", started)
+                    first = False
+                yield chunk
+            record_span("llm.last_token", started)
+        
+        return timed()
+    
+    async def _cache_stream(self, model: str, prompt: str, gen):
+        """Pass a completion stream through, caching the answer once it finishes"""
+        parts = []
+        async for chunk in gen:
+            parts.append(getattr(chunk, "delta", None) or "")
+            yield chunk
+        self.response_cache.set(model, prompt, "".join(parts))
 
     async def stream_answer_with_context(self, query: QueryRequest):
         """Stream an answer using RAG with async support"""
         query_text = query.query[-1] if isinstance(query.query, list) else query.query
         
-        context = self.generate_context(
+        results = []
+        async for _, source_results in self.iter_retrieval(
             query.workspace_id,
             query_text,
             query.knowledge_bases,
-            query.top_k
-        )
-        
-        prompt_template = lng_prompt[query.preferred_language]
-        prompt = prompt_template.format(
-            preferred_language=lng_map[query.preferred_language],
-            context=context,
-            conversation_history=query.conversation_history,
-            query=query_text
-        )
+            query.top_k,
+            query.filters,
+            query.hierarchical
+        ):
+            results.extend(source_results)
         
-        return await self.llm.astream_complete(prompt)
+        return await self.stream_answer_from_results(query, results)
     
     def answer_with_context(self, query: QueryRequest):
         """Generate an answer using RAG with synchronous support"""
         query_text = query.query[-1] if isinstance(query.query, list) else query.query
         
-        context = self.generate_context(
+        results = self.query_knowledge_base(
             query.workspace_id,
             query_text, 
             query.knowledge_bases, 
-            query.top_k
+            query.top_k,
+            query.filters,
+            query.hierarchical
         )
         
-        prompt_template = lng_prompt[query.preferred_language]
-        prompt = prompt_template.format(
-            preferred_language=lng_map[query.preferred_language],
-            context=context,
-            conversation_history=query.conversation_history,
-            query=query_text
-        )
+        with span("kb.prompt", results=len(results)):
+            prompt = self._build_prompt(query, query_text, self._format_context(results))
         
-        response = self.llm.complete(prompt)
+        use_cache = self.response_cache.is_enabled(query.workspace_id)
+        model = self.llm.metadata.model_name
+        if use_cache:
+            cached = self.response_cache.get(model, prompt)
+            if cached is not None:
+                logger.info("Returning cached answer")
+                return cached
+        
+        with span("llm.complete"):
+            response = self.llm.complete(prompt)
+        if use_cache:
+            self.response_cache.set(model, prompt, response.text)
         return response.text
     
+    def set_response_cache_enabled(self, workspace_id: str, enabled: bool):
+        """Opt a workspace in or out of the LLM response cache"""
+        self.response_cache.set_enabled(workspace_id, enabled)
+        return {"status": "success", "workspace_id": workspace_id, "enabled": enabled}
+    
     def store_message(self, message_id: str, message_data: dict):
         """Store message data for potential resumption"""
-        self._message_store[message_id] = message_data
-        
-        asyncio.create_task(self._expire_message(message_id, 1800))
+        self.session_store.create(message_id, message_data)
     
-    async def _expire_message(self, message_id: str, delay_seconds: int):
-        """Remove message after delay"""
-        await asyncio.sleep(delay_seconds)
-        self.remove_message(message_id)
+    def get_message_by_id(self, message_id: str, offset: int = 0):
+        """Retrieve stored message data, with content from the given chunk offset"""
+        return self.session_store.get(message_id, offset)
     
-    def get_message_by_id(self, message_id: str):
-        """Retrieve stored message data"""
-        return self._message_store.get(message_id)
+    def append_message_content(self, message_id: str, content: str) -> int:
+        """Append a chunk to the content of a stored message"""
+        return self.session_store.append(message_id, content)
     
-    def update_message_content(self, message_id: str, content: str):
-        """Update the content of a stored message"""
-        if message_id in self._message_store:
-            self._message_store[message_id]["current_content"] = content
+    def complete_message(self, message_id: str):
+        """Mark a stored message as fully generated"""
+        self.session_store.complete(message_id)
     
     def remove_message(self, message_id: str):
         """Remove a message from storage"""
-        if message_id in self._message_store:
-            del self._message_store[message_id]
+        self.session_store.delete(message_id)
 
     def _build_folder_structure(self, documents):
         """Build a hierarchical folder structure from document paths"""
-        folders = {}
-        root_folders = []
-        
-        for doc in documents:
-            folder_id = doc.get("folderId", "") if isinstance(doc, dict) else doc.folderId
-            if not folder_id:
-                continue
-                
-            parts = folder_id.split('/')
-            current_path = ""
+        return FolderIndex.from_documents(documents).tree()
+    
+    def update_folder_index(self, workspace_id: str, kb_id: str, added: Iterable[Any] = (), removed: Iterable[str] = ()):
+        """Add and remove documents in a KB's folder index without rebuilding it"""
+        with self._folder_index_lock:
+            folder_index = self._get_kb_folder_index(workspace_id, kb_id)
             
-            for i, part in enumerate(parts):
-                if not part:
-                    continue
-                    
-                parent_path = current_path
-                current_path = os.path.join(current_path, part) if current_path else part
-                
-                if current_path not in folders:
-                    folder = Folder(
-                        id=current_path,
-                        name=part,
-                        folders=[],
-                        files=[],
-                        isOpen=False
-                    )
-                    folders[current_path] = folder
-                    
-                    if parent_path:
-                        if parent_path in folders:
-                            if folder not in folders[parent_path].folders:
-                                folders[parent_path].folders.append(folder)
-                    else:
-                        if folder not in root_folders:
-                            root_folders.append(folder)
-        
-        for doc in documents:
-            doc_id = doc.get("id", "") if isinstance(doc, dict) else doc.id
-            folder_id = doc.get("folderId", "") if isinstance(doc, dict) else doc.folderId
-            if folder_id in folders:
-                folders[folder_id].files.append(doc_id)
-        
-        return [folder.dict() for folder in root_folders]
+            for doc_id in removed:
+                folder_index.remove_file(doc_id)
+            for doc in added:
+                doc_id = doc.get("id", "") if isinstance(doc, dict) else doc.id
+                folder_id = doc.get("folderId", "") if isinstance(doc, dict) else doc.folderId
+                folder_index.add_file(doc_id, folder_id)
+            
+            self._set_kb_folder_index(workspace_id, kb_id, folder_index)
     
     def get_data_sources(self, workspace_id: str):
         """Return information about available data sources"""
@@ -549,14 +1451,19 @@ class KBManager:
             return source_info.dict()
         return None
 
-    def get_folder_structure(self, source_id, workspace_id):
-        """Return the folder structure for a specific source"""
+    def get_folder_structure(self, source_id, workspace_id, depth: Optional[int] = None):
+        """Return the folder structure for a specific source, optionally only depth levels below its root folders"""
         if not workspace_id:
             logger.warning(f"Workspace ID not provided for folder structure retrieval of {source_id}")
             return []
             
-        # Get folder structure from Redis
-        return self._get_kb_folder_structure(workspace_id, source_id)
+        with self._folder_index_lock:
+            return self._get_kb_folder_index(workspace_id, source_id).tree(depth)
+    
+    def get_folder_subtree(self, workspace_id: str, source_id: str, folder_id: str, depth: Optional[int] = None):
+        """Return one folder of a source with its contents, None if it does not exist"""
+        with self._folder_index_lock:
+            return self._get_kb_folder_index(workspace_id, source_id).subtree(folder_id, depth)
     
     def get_documents(self, source_id, workspace_id=None):
         """Return all documents for a specific source"""
@@ -574,6 +1481,452 @@ class KBManager:
         
         return self._get_kb_docs(workspace_id, source_id)
 
+    def _kb_write_lock(self, kb_id: str) -> threading.Lock:
+        return self._kb_write_locks.setdefault(kb_id, threading.Lock())
+    
+    def _delete_document_points(self, kb_id: str, ref_doc_ids: List[str]) -> None:
+        """Delete the chunks and summaries split from the given documents"""
+        if not ref_doc_ids:
+            return
+        selector = qdrant_models.FilterSelector(filter=restrict_to_documents(None, ref_doc_ids))
+        for collection_name in (f"kb_{kb_id}", self._summary_collection_name(kb_id)):
+            if self.qdrant_client.collection_exists(collection_name):
+                self.qdrant_client.delete(collection_name, points_selector=selector, wait=True)
+    
+    def _refresh_filter_payloads(self, kb_id: str, docs: list, doc_ids: set, removed_ids: set) -> None:
+        """Rewrite the filter fields of chunks whose duplicate copies changed
+        
+        Chunks of doc_ids are refreshed for their identical copies, and chunks
+        that absorbed near-duplicates from removed documents drop those. The
+        fields are written both at the top of the payload, where filters read
+        them, and in the node metadata in _node_content, which results show.
+        """
+        docs_by_id = {doc["id"]: doc for doc in docs}
+        copies: Dict[str, List[dict]] = {}
+        for doc in docs:
+            if doc.get("duplicateOf"):
+                copies.setdefault(doc["duplicateOf"], []).append(doc)
+        
+        ref_doc_ids = [
+            docs_by_id[doc_id]["original_doc"]["id_"] for doc_id in doc_ids
+            if doc_id in docs_by_id and docs_by_id[doc_id].get("original_doc")
+        ]
+        conditions = []
+        if ref_doc_ids:
+            conditions.append(qdrant_models.FieldCondition(key="ref_doc_id", match=qdrant_models.MatchAny(any=ref_doc_ids)))
+        if removed_ids:
+            conditions.append(qdrant_models.FieldCondition(key="duplicate_doc_ids", match=qdrant_models.MatchAny(any=list(removed_ids))))
+        if not conditions:
+            return
+        
+        collection_name = f"kb_{kb_id}"
+        stale_keys = MERGED_FILTER_KEYS + ("duplicate_doc_ids",)
+        refreshed = set()
+        offset = None
+        while True:
+            points, offset = self.qdrant_client.scroll(
+                collection_name,
+                scroll_filter=qdrant_models.Filter(should=conditions),
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+            # Each point's node content differs, so the page is rewritten in one batch of per-point operations
+            operations = []
+            for point in points:
+                node_content = json.loads(point.payload["_node_content"])
+                doc = docs_by_id.get(node_content["metadata"].get("doc_id"))
+                if doc is None:
+                    continue
+                doc_copies = copies.get(doc["id"], [])
+                # Ids that are not identical copies are documents whose near-duplicate chunks were dropped for this one
+                near_ids = [
+                    doc_id for doc_id in node_content["metadata"].get("duplicate_doc_ids", [])
+                    if doc_id in docs_by_id and doc_id not in removed_ids and not docs_by_id[doc_id].get("duplicateOf")
+                ]
+                fields = filter_metadata(doc, doc_copies)
+                for near_id in near_ids:
+                    merge_filter_metadata(fields, filter_metadata(docs_by_id[near_id], copies.get(near_id, [])))
+                fields["duplicate_doc_ids"] = [copy["id"] for copy in doc_copies] + near_ids
+                
+                metadata = {key: value for key, value in node_content["metadata"].items() if key not in stale_keys}
+                node_content["metadata"] = {**metadata, **fields}
+                payload = {key: value for key, value in point.payload.items() if key not in stale_keys}
+                operations.append(qdrant_models.OverwritePayloadOperation(overwrite_payload=qdrant_models.SetPayload(
+                    payload={**payload, **fields, "_node_content": json.dumps(node_content)},
+                    points=[point.id]
+                )))
+                refreshed.add(doc["id"])
+            if operations:
+                self.qdrant_client.batch_update_points(collection_name, update_operations=operations, wait=True)
+            if offset is None:
+                break
+        
+        summary_collection = self._summary_collection_name(kb_id)
+        if refreshed and self.qdrant_client.collection_exists(summary_collection):
+            self.qdrant_client.batch_update_points(summary_collection, update_operations=[
+                qdrant_models.SetPayloadOperation(set_payload=qdrant_models.SetPayload(
+                    payload={"folder_ancestors": filter_metadata(docs_by_id[doc_id], copies.get(doc_id, []))["folder_ancestors"]},
+                    filter=restrict_to_documents(None, [docs_by_id[doc_id]["original_doc"]["id_"]])
+                ))
+                for doc_id in refreshed
+            ], wait=True)
+    
+    def add_file(self, workspace_id: str, kb_id: str, src_path: str, relative_path: str) -> Dict[str, Any]:
+        """Move a file into an indexed KB's directory and index it without rebuilding the KB
+        
+        A file already at relative_path is replaced: its chunks are deleted once
+        the new ones are written, and copies that were indexed through it are
+        read again so they keep their content. If indexing fails the upload is
+        moved back to src_path and the KB is left as it was.
+        
+        Runs under the KB's write lock, which a full ingestion of the KB also
+        holds, so an upload waits for a re-ingestion rather than racing it.
+        """
+        from llama_index.core import VectorStoreIndex, StorageContext
+        from llama_index.vector_stores.qdrant import QdrantVectorStore # type: ignore
+        
+        kb_item = self._get_kb_registration(workspace_id, kb_id)
+        if kb_item is None or kb_item.source not in self.sources:
+            raise UploadError(404, f"Knowledge base {kb_id} not found")
+        collection_name = f"kb_{kb_id}"
+        
+        with self._kb_write_lock(kb_id):
+            # The KB may have been deleted while this upload waited for the lock
+            if self._get_kb_registration(workspace_id, kb_id) is None:
+                raise UploadError(404, f"Knowledge base {kb_id} not found")
+            checkpoint = self._get_ingest_checkpoint(workspace_id, kb_id)
+            if checkpoint.get("phase", "done") != "done" or not self.qdrant_client.collection_exists(collection_name):
+                raise UploadError(409, f"Knowledge base {kb_id} is not fully indexed yet")
+            
+            started = time.monotonic()
+            reader = self.sources[kb_item.source]()
+            reader.configure(self._reader_config(kb_item))
+            dest_path = os.path.join(reader.local_path, relative_path)
+            
+            docs = self._get_kb_docs(workspace_id, kb_id)
+            replaced = [
+                doc for doc in docs
+                if os.path.normpath((doc.get("url") or "").removeprefix("file://")) == os.path.normpath(dest_path)
+            ]
+            replaced_ids = {doc["id"] for doc in replaced}
+            orphans = [doc for doc in docs if doc.get("duplicateOf") in replaced_ids]
+            removed_ids = replaced_ids | {doc["id"] for doc in orphans}
+            kept = [doc for doc in docs if doc["id"] not in removed_ids]
+            
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            previous_path = None
+            if os.path.exists(dest_path):
+                # The replaced file is kept beside the upload until the new one is indexed
+                previous_path = f"{src_path}.previous"
+                shutil.move(dest_path, previous_path)
+            shutil.move(src_path, dest_path)
+            
+            summary_collection = self._summary_collection_name(kb_id)
+            had_summaries = self.qdrant_client.collection_exists(summary_collection)
+            new_docs: list = []
+            try:
+                # Content already indexed in the KB makes the new file a duplicate of it
+                canonical_ids: Dict[Tuple[str, int], str] = {}
+                part_counts: Dict[str, int] = {}
+                for doc in kept:
+                    if doc.get("original_doc") and doc.get("contentHash"):
+                        part_index = part_counts.get(doc["contentHash"], 0)
+                        canonical_ids[(doc["contentHash"], part_index)] = doc["id"]
+                        part_counts[doc["contentHash"]] = part_index + 1
+                
+                input_files = [dest_path]
+                for doc in orphans:
+                    orphan_path = (doc.get("url") or "").removeprefix("file://")
+                    if orphan_path not in input_files and os.path.exists(orphan_path):
+                        input_files.append(orphan_path)
+                new_docs = self._serialize_docs(reader.load_documents(input_files, canonical_ids))
+                new_ids = {doc["id"] for doc in new_docs}
+                all_docs = kept + new_docs
+                
+                base_embed_model = self._get_kb_embed_model(workspace_id, kb_id)
+                embed_model = base_embed_model
+                if self.embedding_store is not None:
+                    embed_model = CachedEmbedding(base_embed_model, self.embedding_store)
+                
+                original_docs = self._llama_documents(all_docs, new_ids)
+                nodes = self._split_documents(original_docs) if original_docs else []
+                if nodes:
+                    index = VectorStoreIndex(
+                        [],
+                        storage_context=StorageContext.from_defaults(
+                            vector_store=QdrantVectorStore(client=self.qdrant_client, collection_name=collection_name)
+                        ),
+                        embed_model=embed_model
+                    )
+                    for start in range(0, len(nodes), self.ingest_batch_size):
+                        index.insert_nodes(nodes[start:start + self.ingest_batch_size])
+                
+                if had_summaries:
+                    if original_docs:
+                        self._build_document_summaries(kb_id, original_docs, embed_model, lambda _: None, append=True)
+                elif self.doc_summaries:
+                    all_original_docs = self._llama_documents(all_docs)
+                    if self._wants_summaries(all_original_docs):
+                        self._build_document_summaries(kb_id, all_original_docs, embed_model, lambda _: None)
+            except Exception:
+                # Nothing of the KB changed yet but the new chunks and the file, undo both
+                self._delete_document_points(kb_id, [doc["original_doc"]["id_"] for doc in new_docs if doc.get("original_doc")])
+                if not had_summaries and self.qdrant_client.collection_exists(summary_collection):
+                    self.qdrant_client.delete_collection(summary_collection)
+                    self._forget_collections(summary_collection)
+                shutil.move(dest_path, src_path)
+                if previous_path:
+                    shutil.move(previous_path, dest_path)
+                raise
+            
+            self._delete_document_points(kb_id, [
+                doc["original_doc"]["id_"] for doc in docs
+                if doc["id"] in removed_ids and doc.get("original_doc")
+            ])
+            
+            # Chunks of kept documents that gained or lost identical copies match filters on the copies' folders
+            affected = {doc.get("duplicateOf") for doc in new_docs + replaced} - new_ids - {None}
+            self._refresh_filter_payloads(kb_id, all_docs, affected, removed_ids)
+            
+            self._store_kb_docs(workspace_id, kb_id, all_docs)
+            self.update_folder_index(workspace_id, kb_id, added=new_docs, removed=removed_ids)
+            points = self.qdrant_client.count(collection_name, exact=True).count
+            checkpoint.update({"phase": "done", "nodes_done": points, "nodes_total": points})
+            self._set_ingest_checkpoint(workspace_id, kb_id, checkpoint)
+            if previous_path:
+                os.remove(previous_path)
+        
+        logger.info(f"Added {relative_path} to KB {kb_id} as {len(new_docs)} documents and {len(nodes)} chunks in {time.monotonic() - started:.1f}s")
+        return {
+            "path": relative_path,
+            "documents": len(new_docs),
+            "chunks": len(nodes),
+            "replaced": len(replaced)
+        }
+    
+    def create_upload(self, workspace_id: str, kb_id: str, filename: str, folder: Optional[str] = None, size: Optional[int] = None) -> Dict[str, Any]:
+        """Start a resumable upload of one file into a KB"""
+        if self.query_only:
+            raise UploadError(503, "This instance is query-only, upload to an ingesting instance")
+        if self._get_kb_registration(workspace_id, kb_id) is None:
+            raise UploadError(404, f"Knowledge base {kb_id} not found")
+        return self.upload_store.create(workspace_id, kb_id, filename, folder, size)
+    
+    async def complete_upload(self, upload_id: str) -> Dict[str, Any]:
+        """Index a fully received upload into its KB in the background
+        
+        The upload's status moves to "done" with the indexing result, or to
+        "error" with the reason, and can be polled through the upload store.
+        """
+        upload = self.upload_store.get(upload_id)
+        if upload is None:
+            raise UploadError(404, "Upload not found")
+        if upload["status"] != "uploading":
+            raise UploadError(409, f"Upload is {upload['status']}")
+        if upload["size"] is not None and upload["offset"] != upload["size"]:
+            raise UploadError(409, f"Upload has {upload['offset']} of {upload['size']} bytes")
+        
+        self.upload_store.update(upload_id, status="ingesting", size=upload["offset"])
+        self._spawn(self._ingest_upload(upload))
+        return {**upload, "status": "ingesting", "size": upload["offset"]}
+    
+    async def _ingest_upload(self, upload: Dict[str, Any]):
+        try:
+            result = await asyncio.to_thread(
+                self.add_file,
+                upload["workspace_id"],
+                upload["kb_id"],
+                self.upload_store.staging_path(upload["id"]),
+                upload["path"]
+            )
+            self.upload_store.update(upload["id"], status="done", result=result)
+        except Exception as e:
+            logger.error(f"Error indexing upload {upload['id']} into KB {upload['kb_id']}: {str(e)}")
+            self.upload_store.update(upload["id"], status="error", error=str(e))
+
+    def _kb_snapshot_keys(self, workspace_id: str, kb_id: str) -> Dict[str, str]:
+        """Redis keys carried in a KB snapshot, by name"""
+        return {
+            "docs": self._get_kb_docs_key(workspace_id, kb_id),
+            "folder_structure": self._get_kb_folder_structure_key(workspace_id, kb_id),
+            "embedding": self._get_kb_embedding_key(workspace_id, kb_id),
+            "registration": self._get_kb_registration_key(workspace_id, kb_id),
+            "ingest_checkpoint": self._get_kb_ingest_checkpoint_key(workspace_id, kb_id),
+            "embedding_stats": self._get_kb_embedding_stats_key(workspace_id, kb_id)
+        }
+    
+    def export_knowledge_base(self, workspace_id: str, kb_id: str, path: Optional[str] = None) -> Dict[str, Any]:
+        """Export a KB as one snapshot file that imports without re-embedding
+        
+        The file holds the KB's Qdrant points with their vectors, its Redis
+        documents and metadata, and a manifest describing both.
+        """
+        status = self._get_kb_status(workspace_id, kb_id)
+        if status == "not_found":
+            return {"status": "error", "message": "Knowledge base not found"}
+        
+        collection_name = f"kb_{kb_id}"
+        checkpoint = self._get_ingest_checkpoint(workspace_id, kb_id)
+        if checkpoint.get("phase", "done") != "done" or not self.qdrant_client.collection_exists(collection_name):
+            return {"status": "error", "message": "Knowledge base is not fully indexed yet"}
+        
+        path = path or os.path.join(self.snapshot_dir, f"{workspace_id}_{kb_id}_{time.strftime('%Y%m%d%H%M%S')}.kbsnap")
+        workdir = snapshot_workdir(self.snapshot_dir)
+        started = time.monotonic()
+        try:
+            collections = {"chunks": dump_collection(self.qdrant_client, collection_name, os.path.join(workdir, "chunks"))}
+            summary_collection = self._summary_collection_name(kb_id)
+            if self.qdrant_client.collection_exists(summary_collection):
+                collections["summaries"] = dump_collection(self.qdrant_client, summary_collection, os.path.join(workdir, "summaries"))
+            
+            redis_values = {
+                name: self.redis_client.get(key)
+                for name, key in self._kb_snapshot_keys(workspace_id, kb_id).items()
+            }
+            manifest = {
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "workspace_id": workspace_id,
+                "kb_id": kb_id,
+                "name": self.kb_names.get(kb_id, kb_id),
+                "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "embedding": self._get_kb_embedding(workspace_id, kb_id),
+                "checkpoint": checkpoint,
+                "collections": collections
+            }
+            with open(os.path.join(workdir, "redis.json"), "w") as f:
+                json.dump(redis_values, f)
+            with open(os.path.join(workdir, "manifest.json"), "w") as f:
+                json.dump(manifest, f, indent=2)
+            
+            pack_snapshot(workdir, path)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        
+        logger.info(f"Exported KB {kb_id} with {collections['chunks']['points']} points to {path} in {time.monotonic() - started:.1f}s")
+        return {"status": "success", "path": path, "manifest": manifest}
+    
+    def export_knowledge_base_parquet(self, workspace_id: str, kb_id: str, path: Optional[str] = None) -> Dict[str, Any]:
+        """Export a KB's chunks, metadata and vectors as one Parquet file for offline analysis
+        
+        Unlike a snapshot the file holds only the chunk collection, as columns
+        that analytics tools read directly. It can be loaded back into a Qdrant
+        collection with utils.kb_parquet.import_collection_parquet.
+        """
+        if self._get_kb_status(workspace_id, kb_id) == "not_found":
+            return {"status": "error", "message": "Knowledge base not found"}
+        collection_name = f"kb_{kb_id}"
+        if not self.qdrant_client.collection_exists(collection_name):
+            return {"status": "error", "message": "Knowledge base is not indexed yet"}
+        
+        path = path or os.path.join(self.snapshot_dir, f"{workspace_id}_{kb_id}_{time.strftime('%Y%m%d%H%M%S')}.parquet")
+        started = time.monotonic()
+        file_metadata = export_collection_parquet(
+            self.qdrant_client,
+            collection_name,
+            path,
+            batch_size=self.ingest_batch_size,
+            extra_metadata={
+                "workspace_id": workspace_id,
+                "kb_id": kb_id,
+                "embedding": self._get_kb_embedding(workspace_id, kb_id),
+                "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            }
+        )
+        logger.info(f"Exported {file_metadata['points']} chunks of KB {kb_id} to {path} in {time.monotonic() - started:.1f}s")
+        return {"status": "success", "path": path, "metadata": file_metadata}
+    
+    def import_knowledge_base(self, path: str, workspace_id: Optional[str] = None, kb_id: Optional[str] = None, name: Optional[str] = None, url: Optional[str] = None) -> Dict[str, Any]:
+        """Create a KB from a snapshot file, by default under its original workspace and id
+        
+        KB ids are global: Qdrant collections are named by id alone, so a KB
+        imported next to its source, in any workspace, needs a new kb_id. A
+        clone under a new workspace or id also needs its own url, the source
+        directory re-ingestion and uploads use, or it would read from and write
+        into the source KB's files. Stored document paths are moved to the url.
+        """
+        workdir = snapshot_workdir(self.snapshot_dir)
+        started = time.monotonic()
+        try:
+            try:
+                manifest = unpack_snapshot(path, workdir)
+                with open(os.path.join(workdir, "redis.json")) as f:
+                    redis_values = json.load(f)
+            except (ValueError, OSError) as e:
+                return {"status": "error", "message": f"Invalid snapshot: {str(e)}"}
+            
+            cloned = (workspace_id or manifest["workspace_id"], kb_id or manifest["kb_id"]) != (manifest["workspace_id"], manifest["kb_id"])
+            workspace_id = workspace_id or manifest["workspace_id"]
+            kb_id = kb_id or manifest["kb_id"]
+            name = name or manifest.get("name") or kb_id
+            collection_names = {"chunks": f"kb_{kb_id}", "summaries": self._summary_collection_name(kb_id)}
+            
+            if self._get_kb_status(workspace_id, kb_id) != "not_found":
+                return {"status": "error", "message": f"Knowledge base {kb_id} already exists"}
+            if any(self.qdrant_client.collection_exists(collection_name) for collection_name in collection_names.values()):
+                return {"status": "error", "message": f"Knowledge base id {kb_id} is used in another workspace, KB ids are global so import under a new kb_id"}
+            
+            registration = json.loads(redis_values["registration"]) if redis_values.get("registration") else None
+            if registration and cloned and not url:
+                return {"status": "error", "message": "A cloned knowledge base needs its own url, the source KB's directory cannot be shared"}
+            
+            if registration:
+                # The clone is its own KB, point its registration at the new id and directory
+                source_url = registration.get("url")
+                registration.update({"id": kb_id, "workspace_id": workspace_id, "name": name, "url": url or source_url})
+                redis_values["registration"] = json.dumps(registration)
+                if url and source_url and redis_values.get("docs"):
+                    redis_values["docs"] = json.dumps(self._rebase_docs(json.loads(redis_values["docs"]), source_url, url))
+            
+            self._set_kb_status(workspace_id, kb_id, "initializing")
+            try:
+                for kind, entry in manifest["collections"].items():
+                    restore_collection(self.qdrant_client, collection_names[kind], os.path.join(workdir, kind), entry)
+                    ensure_payload_indexes(self.qdrant_client, collection_names[kind])
+                self._forget_collections(*collection_names.values())
+                
+                keys = self._kb_snapshot_keys(workspace_id, kb_id)
+                for key_name, value in redis_values.items():
+                    if value is not None and key_name in keys:
+                        self.redis_client.set(keys[key_name], value)
+                # Any folder index cached for an earlier KB with this id is stale
+                self.redis_client.set(self._get_kb_folder_version_key(workspace_id, kb_id), uuid.uuid4().hex)
+                
+                self.redis_client.set(f"kb:{kb_id}:index_created", "true")
+                self.kb_names[kb_id] = name
+                self._set_kb_status(workspace_id, kb_id, "running")
+            except Exception:
+                for collection_name in collection_names.values():
+                    if self.qdrant_client.collection_exists(collection_name):
+                        self.qdrant_client.delete_collection(collection_name)
+                self._forget_collections(*collection_names.values())
+                self._set_kb_status(workspace_id, kb_id, "error")
+                raise
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        
+        points = manifest["collections"]["chunks"]["points"]
+        logger.info(f"Imported KB {kb_id} into workspace {workspace_id} with {points} points in {time.monotonic() - started:.1f}s")
+        return {"status": "success", "id": kb_id, "workspace_id": workspace_id, "points": points}
+    
+    def _rebase_docs(self, docs: list, source_url: str, url: str) -> list:
+        """Move the file paths of stored documents from one KB directory to another"""
+        source_root = os.path.normpath(source_url)
+        root = os.path.normpath(url)
+        
+        def rebase(path: str) -> str:
+            relative_path = os.path.relpath(path, source_root)
+            return path if relative_path.startswith("..") else os.path.join(root, relative_path)
+        
+        for doc in docs:
+            if (doc.get("url") or "").startswith("file://"):
+                doc["url"] = f"file://{rebase(doc['url'][len('file://'):])}"
+            metadata = (doc.get("original_doc") or {}).get("metadata") or {}
+            if metadata.get("file_path"):
+                metadata["file_path"] = rebase(metadata["file_path"])
+        return docs
+    
     def update_kb_status(self, kb_id: str, enabled: bool, workspace_id: str):
         """Update the status of a knowledge base (enable/disable)"""
         current_status = self._get_kb_status(workspace_id, kb_id)
@@ -592,43 +1945,70 @@ class KBManager:
         
         return {"status": "success", "id": kb_id, "enabled": enabled}
 
-    def delete_knowledge_base(self, kb_id: str, workspace_id: str):
+    async def delete_knowledge_base(self, kb_id: str, workspace_id: str):
         """Delete a knowledge base completely"""
         current_status = self._get_kb_status(workspace_id, kb_id)
         if current_status == "not_found":
             logger.warning(f"Knowledge base {kb_id} not found")
             return {"status": "error", "message": "Knowledge base not found"}
         
-        try:
-            # Delete status key
-            status_key = self._get_kb_status_key(workspace_id, kb_id)
-            self.redis_client.delete(status_key)
-            
-            # Delete folder structure key
-            folder_structure_key = self._get_kb_folder_structure_key(workspace_id, kb_id)
-            self.redis_client.delete(folder_structure_key)
-            
-            # Delete documents key
-            docs_key = self._get_kb_docs_key(workspace_id, kb_id)
-            self.redis_client.delete(docs_key)
-            
-            # Delete index created flag
-            index_key = f"kb:{kb_id}:index_created"
-            self.redis_client.delete(index_key)
-            
-            if kb_id in self.readers:
-                del self.readers[kb_id]
-            
-            # Delete the Qdrant collection
-            collection_name = f"kb_{kb_id}"
+        # Stop any queued or running ingestion and let its worker thread return
+        # before removing its data, so nothing is written back afterwards
+        self.ingestion_scheduler.cancel(kb_id)
+        await self.ingestion_scheduler.wait(kb_id)
+        
+        # Removed under the KB's write lock in a worker thread, like add_file, so an
+        # upload being indexed finishes first and uploads waiting for it find no KB
+        return await asyncio.to_thread(self._delete_kb_data, workspace_id, kb_id)
+    
+    def _delete_kb_data(self, workspace_id: str, kb_id: str) -> Dict[str, Any]:
+        """Remove a KB's uploads, Redis keys and collections under its write lock"""
+        with self._kb_write_lock(kb_id):
             try:
-                self.qdrant_client.delete_collection(collection_name)
-                logger.info(f"Deleted Qdrant collection {collection_name}")
+                # Drop the KB's pending uploads first, none can be completed into it afterwards
+                purged = self.upload_store.delete_for_kb(workspace_id, kb_id)
+                if purged:
+                    logger.info(f"Removed {purged} uploads into KB {kb_id}")
+                
+                # Delete status key
+                status_key = self._get_kb_status_key(workspace_id, kb_id)
+                self.redis_client.delete(status_key)
+                
+                # Delete folder structure key
+                folder_structure_key = self._get_kb_folder_structure_key(workspace_id, kb_id)
+                self.redis_client.delete(folder_structure_key)
+                self.redis_client.delete(self._get_kb_folder_version_key(workspace_id, kb_id))
+                self._folder_indexes.pop((workspace_id, kb_id), None)
+                
+                # Delete documents key
+                docs_key = self._get_kb_docs_key(workspace_id, kb_id)
+                self.redis_client.delete(docs_key)
+                
+                # Delete registration, embedding settings, ingestion checkpoint and cache stats keys
+                self.redis_client.delete(self._get_kb_registration_key(workspace_id, kb_id))
+                self.redis_client.delete(self._get_kb_embedding_key(workspace_id, kb_id))
+                self.redis_client.delete(self._get_kb_ingest_checkpoint_key(workspace_id, kb_id))
+                self.redis_client.delete(self._get_kb_embedding_stats_key(workspace_id, kb_id))
+                
+                # Delete index created flag
+                index_key = f"kb:{kb_id}:index_created"
+                self.redis_client.delete(index_key)
+                
+                if kb_id in self.readers:
+                    del self.readers[kb_id]
+                
+                # Delete the Qdrant collections
+                for collection_name in (f"kb_{kb_id}", self._summary_collection_name(kb_id)):
+                    try:
+                        if self.qdrant_client.collection_exists(collection_name):
+                            self.qdrant_client.delete_collection(collection_name)
+                            logger.info(f"Deleted Qdrant collection {collection_name}")
+                    except Exception as e:
+                        logger.error(f"Error deleting Qdrant collection {collection_name}: {str(e)}")
+                self._forget_collections(f"kb_{kb_id}", self._summary_collection_name(kb_id))
+                
+                logger.info(f"Knowledge base {kb_id} deleted")
+                return {"status": "success", "message": f"Knowledge base {kb_id} deleted"}
             except Exception as e:
-                logger.error(f"Error deleting Qdrant collection {collection_name}: {str(e)}")
-            
-            logger.info(f"Knowledge base {kb_id} deleted")
-            return {"status": "success", "message": f"Knowledge base {kb_id} deleted"}
-        except Exception as e:
-            logger.error(f"Error deleting knowledge base {kb_id}: {str(e)}")
-            return {"status": "error", "message": str(e)}
+                logger.error(f"Error deleting knowledge base {kb_id}: {str(e)}")
+                return {"status": "error", "message": str(e)}
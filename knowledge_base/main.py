@@ -2,23 +2,36 @@ from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import json
 import os
+import resource
+import time
+_import_started = time.perf_counter()
 load_dotenv()
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 from qdrant_client import QdrantClient
 
 from kb_manager import KBManager
 from api.route import router
+from utils.telemetry import HTTP_REQUEST_DURATION, record_startup, setup_tracing, startup_report
+
+# LLM, embedding and ingestion modules are imported on first use, not here
+record_startup("imports", time.perf_counter() - _import_started)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting Knowledge Base")
+    started = time.perf_counter()
+    setup_tracing()
     qdrant_client = QdrantClient(host="onlysaid-qdrant", port=6333)
     kb_manager = KBManager(qdrant_client)
     app.state.kb_manager = kb_manager
+    record_startup("lifespan", time.perf_counter() - started)
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logger.info(f"Startup phases (seconds): {startup_report()}, peak RSS {peak_rss_mb:.0f} MB")
 
     yield
     
@@ -27,6 +40,19 @@ async def lifespan(app: FastAPI):
 app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not the raw path, to keep label cardinality bounded
+    route = request.scope.get("route")
+    HTTP_REQUEST_DURATION.labels(
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code
+    ).observe(time.perf_counter() - started)
+    return response
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
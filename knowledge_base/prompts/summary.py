@@ -0,0 +1,12 @@
+doc_summary_prompt = """
+    Summarize the following document in at most five sentences.
+    Mention its subject, the kind of document it is and the key facts, names and numbers it contains.
+    Write the summary in the language of the document.
+    
+    Title: {title}
+    
+    Document:
+    {text}
+    
+    Summary:
+    """
@@ -1,19 +1,23 @@
-from llama_index.core import DocumentSummaryIndex, SimpleDirectoryReader
+from typing import Dict, List, Optional, Tuple
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core import Document as LlamaDocument
 from loguru import logger
 import os
 from datetime import datetime
 import uuid
 from readers.base_reader import BaseReader
 from schemas.document import Document
+from utils.parse_cache import ParseCache, PATH_METADATA_KEYS, hash_file, get_parse_cache
 
 
 class LocalStoreReader(BaseReader):
-    def __init__(self):
+    def __init__(self, parse_cache: Optional[ParseCache] = None):
         self.local_path = None
         self.documents = None
+        self.parse_cache = parse_cache or get_parse_cache()
         
     def configure(self, config: dict):
-        path = config.get("url")
+        path = config.get("path") or config.get("url")
         if not path:
             raise ValueError("Path must be provided for LocalStoreReader")
         
@@ -28,17 +32,26 @@ class LocalStoreReader(BaseReader):
         if not os.path.isdir(self.local_path):
             raise ValueError(f"Path is not a directory: {self.local_path}")
 
-    def load_documents(self):
+    def load_documents(self, input_files: Optional[List[str]] = None, canonical_ids: Optional[Dict[Tuple[str, int], str]] = None):
+        """Load every file under the configured path, or only input_files
+        
+        canonical_ids maps (content hash, part index) to the id of a document
+        already holding that content, so files added to an existing KB are
+        recognised as duplicates of documents loaded earlier.
+        """
         logger.info(f"Loading documents from {self.local_path}")
         
         try:
-            raw_documents = SimpleDirectoryReader(input_dir=self.local_path, recursive=True).load_data()
+            raw_documents = self._load_raw_documents(input_files)
             logger.info(f"Loaded {len(raw_documents)} documents from {self.local_path}")
             
             # Transform llama_index documents into structured format for frontend
             structured_documents = []
+            # (content hash, part index) -> id of the first document seen with that content
+            canonical_ids = dict(canonical_ids or {})
+            duplicates = 0
             
-            for doc in raw_documents:
+            for content_hash, part_index, doc in raw_documents:
                 metadata = doc.metadata
                 file_path = metadata.get('file_path', '')
                 file_name = metadata.get('file_name', '')
@@ -51,6 +64,12 @@ class LocalStoreReader(BaseReader):
                 file_ext = os.path.splitext(file_name)[1].upper().lstrip('.')
                 doc_type = file_ext if file_ext else "TXT"
                 
+                # Identical files are listed in their own folders but only the first
+                # copy keeps its content for indexing; the others point at it
+                canonical_id = canonical_ids.get((content_hash, part_index))
+                if canonical_id:
+                    duplicates += 1
+                
                 # Create structured document using the schema
                 structured_doc = Document(
                     id=str(uuid.uuid4()),
@@ -62,12 +81,72 @@ class LocalStoreReader(BaseReader):
                     description=doc.text[:150] + "..." if len(doc.text) > 150 else doc.text,
                     url=f"file://{file_path}",
                     folderId=folder_path,
-                    original_doc=doc
+                    contentHash=content_hash,
+                    duplicateOf=canonical_id,
+                    original_doc=None if canonical_id else doc
                 )
                 
+                if not canonical_id:
+                    canonical_ids[(content_hash, part_index)] = structured_doc.id
                 structured_documents.append(structured_doc)
             
+            if duplicates:
+                logger.info(f"Found {duplicates} duplicate documents in {self.local_path}")
+            
             return structured_documents
         except Exception as e:
             logger.error(f"Error loading documents: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def _load_raw_documents(self, input_files: Optional[List[str]] = None):
+        """Load llama_index documents, only parsing files whose content is not cached
+        
+        Returns (content hash, part index within the file, document) tuples.
+        """
+        if input_files:
+            dir_reader = SimpleDirectoryReader(input_files=input_files)
+        else:
+            dir_reader = SimpleDirectoryReader(input_dir=self.local_path, recursive=True)
+        raw_documents = []
+        hits = 0
+
+        for input_file in dir_reader.input_files:
+            file_path = str(input_file)
+            file_metadata = dir_reader.file_metadata(file_path)
+            content_hash = hash_file(file_path)
+
+            cached = self.parse_cache.get(content_hash)
+            if cached is not None:
+                hits += 1
+                for part_index, entry in enumerate(cached):
+                    raw_documents.append((content_hash, part_index, LlamaDocument(
+                        text=entry["text"],
+                        metadata={**entry["metadata"], **file_metadata}
+                    )))
+                continue
+
+            docs = SimpleDirectoryReader.load_file(
+                input_file=input_file,
+                file_metadata=dir_reader.file_metadata,
+                file_extractor=dir_reader.file_extractor,
+                encoding=dir_reader.encoding,
+                errors=dir_reader.errors
+            )
+            # Files that failed to parse are not cached so they are retried next time
+            if docs:
+                self.parse_cache.put(content_hash, [
+                    {
+                        "text": doc.text,
+                        "metadata": {
+                            key: value for key, value in doc.metadata.items()
+                            if key not in PATH_METADATA_KEYS
+                        }
+                    }
+                    for doc in docs
+                ])
+            raw_documents.extend(
+                (content_hash, part_index, doc) for part_index, doc in enumerate(docs)
+            )
+
+        logger.info(f"Parse cache hits: {hits}/{len(dir_reader.input_files)} files in {self.local_path}")
+        return raw_documents
\ No newline at end of file
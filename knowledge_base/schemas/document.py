@@ -17,6 +17,11 @@ class Document(BaseModel):
     url: str
     folderId: str
     
+    # sha256 of the source file; duplicateOf is the id of the document holding
+    # the indexed copy when the same content appears more than once
+    contentHash: Optional[str] = None
+    duplicateOf: Optional[str] = None
+    
     # Optional field to store the original document
     original_doc: Optional[Any] = None
     
@@ -43,6 +48,16 @@ class DataSource(BaseModel):
     count: int
 
 
+class RetrievalFilters(BaseModel):
+    """Restricts retrieval to chunks of matching documents"""
+    
+    folder_prefix: Optional[str] = None  # folderId or any parent folder of it
+    doc_types: Optional[List[str]] = None  # e.g. ["XLSX", "PDF"]
+    tags: Optional[List[str]] = None  # documents with any of these tags
+    date_from: Optional[str] = None  # ISO dates, inclusive
+    date_to: Optional[str] = None
+
+
 class QueryRequest(BaseModel):
     workspace_id: str
     knowledge_bases: Optional[List[str]] = None
@@ -52,6 +67,10 @@ class QueryRequest(BaseModel):
     top_k: int = 5
     preferred_language: str = "en"
     message_id: Optional[str] = None
+    filters: Optional[RetrievalFilters] = None
+    # Search document summaries first, then chunks of the best documents. Only KBs with
+    # a summary collection (KB_DOC_SUMMARIES=1) are searched this way, others flat
+    hierarchical: bool = False
 
 class KnowledgeBaseRegistration(BaseModel):
     id: str
@@ -62,6 +81,8 @@ class KnowledgeBaseRegistration(BaseModel):
     url: str
     enabled: bool = True
     embedding_engine: str
+    # Ingestion priority, lower runs sooner. Estimated from the source size when unset
+    priority: Optional[int] = None
     
 
 class KnowledgeBaseStatus(BaseModel):
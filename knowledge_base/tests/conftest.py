@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Tests import the service modules the way main.py does, from the knowledge_base directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+        task.cancel()
+    if pending:
+        loop.run_until_complete(asyncio.wait(pending))
+    loop.close()
+
+
+@pytest.fixture
+def kb_manager(loop, tmp_path, monkeypatch):
+    """A KBManager on fakeredis, in-memory Qdrant and the benchmark's hashing embedding"""
+    fakeredis = pytest.importorskip("fakeredis")
+    from qdrant_client import QdrantClient
+    from benchmarks.fakes import FakeStreamingLLM, HashEmbedding
+
+    monkeypatch.setenv("KB_PARSE_CACHE_DIR", str(tmp_path / "parse_cache"))
+    monkeypatch.setenv("KB_UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setenv("KB_SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    monkeypatch.setenv("KB_EMBED_CACHE_PATH", str(tmp_path / "embeddings.sqlite3"))
+    monkeypatch.setenv("KB_WARMUP_QUERIES", "0")
+    monkeypatch.setenv("KB_INGEST_BATCH_SIZE", "4")
+    from kb_manager import KBManager
+
+    async def create():
+        manager = KBManager(
+            QdrantClient(":memory:"),
+            redis_client=fakeredis.FakeRedis(decode_responses=True),
+            llm=FakeStreamingLLM(num_tokens=4),
+            embed_model=HashEmbedding(embed_dim=64)
+        )
+        # Let the startup reconcile finish
+        await asyncio.sleep(0.05)
+        return manager
+
+    return loop.run_until_complete(create())
+
+
+@pytest.fixture
+def ingest(loop, kb_manager):
+    """Register a local directory as a KB and wait until it is running"""
+    from schemas.document import KnowledgeBaseRegistration
+
+    def ingest(path, kb_id: str = "kb", workspace_id: str = "ws") -> str:
+        async def run():
+            kb_manager.register_knowledge_base(KnowledgeBaseRegistration(
+                id=kb_id,
+                name=kb_id,
+                workspace_id=workspace_id,
+                source="local_store",
+                url=str(path),
+                embedding_engine=""
+            ))
+            for _ in range(500):
+                await asyncio.sleep(0.02)
+                status = kb_manager.get_kb_status(kb_id, workspace_id)
+                if status in ("running", "error"):
+                    return status
+            return status
+
+        return loop.run_until_complete(run())
+
+    return ingest
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """Write {relative path: text} into a corpus directory, returns its path"""
+    root = tmp_path / "corpus"
+
+    def write(files: dict):
+        for relative_path, text in files.items():
+            path = root / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text, encoding="utf-8")
+        return root
+
+    return write
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from utils.admission import AdmissionController, AdmissionRejected
+
+
+def test_free_slot_is_taken_without_yielding():
+    async def main():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=0)
+        other = asyncio.create_task(asyncio.sleep(0))
+        await controller.acquire("ws")
+        # The task created before acquire() has not had a chance to run
+        assert not other.done()
+        await other
+
+    asyncio.run(main())
+
+
+def test_full_queue_is_a_503():
+    async def main():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=1)
+        admitted = await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("c")
+        assert (rejected.value.status_code, rejected.value.reason) == (503, "queue_full")
+
+        # Releasing hands the slot to the waiting request
+        controller.release("a", admitted)
+        controller.release("b", await waiter)
+        assert controller._workspaces == {}
+        assert not controller._semaphore.locked()
+
+    asyncio.run(main())
+
+
+def test_workspace_over_quota_is_a_429():
+    async def main():
+        controller = AdmissionController("test", max_concurrency=4, max_queue=4, workspace_quota=2)
+        first = await controller.acquire("ws")
+        await controller.acquire("ws")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("ws")
+        assert (rejected.value.status_code, rejected.value.reason) == (429, "workspace_quota")
+
+        # Other workspaces are unaffected, and a released slot counts again
+        controller.release("other", await controller.acquire("other"))
+        controller.release("ws", first)
+        await controller.acquire("ws")
+
+    asyncio.run(main())
+
+
+def test_queue_timeout_frees_the_workspace():
+    async def main():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=1, queue_timeout=0.05, workspace_quota=1)
+        await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("b")
+        assert (rejected.value.status_code, rejected.value.reason) == (503, "queue_timeout")
+        assert controller._waiting == 0
+        assert controller._workspaces == {"a": 1}
+
+    asyncio.run(main())
+
+
+def test_retry_after_tracks_service_time_and_backlog():
+    async def main():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=2)
+        controller._service_time = 4.0
+        await controller.acquire("a")
+        waiters = [asyncio.create_task(controller.acquire(workspace)) for workspace in ("b", "c")]
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("d")
+        # Two waiting plus the running request, each holding the slot for about 4s
+        assert rejected.value.retry_after == 12
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert controller._waiting == 0
+
+    asyncio.run(main())
+
+
+def test_admit_sets_retry_after_header():
+    from api.route import admit
+
+    async def main():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=0)
+        await admit(controller, "ws")
+        with pytest.raises(HTTPException) as rejected:
+            await admit(controller, "ws")
+        return rejected.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "1"}
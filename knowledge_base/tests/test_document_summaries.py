@@ -0,0 +1,58 @@
+FILES = {
+    f"dept{i % 3}/doc{i}.txt": f"Topic{i} handbook. " + " ".join(f"topic{i} detail number {j}." for j in range(20))
+    for i in range(6)
+}
+
+
+def test_summaries_are_off_by_default(kb_manager, ingest, corpus):
+    kb_manager.summary_min_docs = 0
+    assert ingest(corpus(FILES)) == "running"
+    assert not kb_manager.qdrant_client.collection_exists("kb_kb_summaries")
+    assert kb_manager.query_knowledge_base("ws", "topic3 detail", ["kb"], 3, hierarchical=True)
+
+
+def test_two_stage_search_only_when_requested(kb_manager, ingest, corpus, monkeypatch):
+    kb_manager.doc_summaries = True
+    kb_manager.summary_min_docs = 0
+    assert ingest(corpus(FILES)) == "running"
+    assert kb_manager.qdrant_client.count("kb_kb_summaries").count == len(FILES)
+
+    searched = []
+    candidate_documents = kb_manager._candidate_documents
+    monkeypatch.setattr(kb_manager, "_candidate_documents", lambda *args: searched.append(args[0]) or candidate_documents(*args))
+
+    flat = kb_manager.query_knowledge_base("ws", "topic3 detail", ["kb"], 3)
+    assert searched == []
+    two_stage = kb_manager.query_knowledge_base("ws", "topic3 detail", ["kb"], 3, hierarchical=True)
+    assert searched == ["kb"]
+    assert two_stage[0]["metadata"]["file_name"] == flat[0]["metadata"]["file_name"] == "doc3.txt"
+
+
+def test_summary_threshold_counts_files(kb_manager, ingest, corpus):
+    kb_manager.doc_summaries = True
+    kb_manager.summary_min_docs = len(FILES) + 1
+    assert ingest(corpus(FILES)) == "running"
+    assert not kb_manager.qdrant_client.collection_exists("kb_kb_summaries")
+
+
+def test_collection_info_is_cached_until_rebuilt(kb_manager, ingest, corpus, monkeypatch):
+    kb_manager.doc_summaries = True
+    kb_manager.summary_min_docs = 0
+    root = corpus(FILES)
+    assert ingest(root) == "running"
+    kb_manager.query_knowledge_base("ws", "topic3 detail", ["kb"], 3, hierarchical=True)
+
+    calls = []
+    for name in ("get_collection", "collection_exists"):
+        method = getattr(kb_manager.qdrant_client, name)
+        monkeypatch.setattr(kb_manager.qdrant_client, name, lambda *args, method=method, name=name, **kwargs: calls.append(name) or method(*args, **kwargs))
+    for _ in range(3):
+        kb_manager.query_knowledge_base("ws", "topic3 detail", ["kb"], 3, hierarchical=True)
+        kb_manager.query_knowledge_base_batch("ws", ["topic1 detail", "topic2 detail"], ["kb"], 3, hierarchical=True)
+    assert calls == []
+
+    # Rebuilt without summaries, the KB is searched flat rather than through the deleted collection
+    kb_manager.summary_min_docs = len(FILES) + 1
+    assert ingest(root) == "running"
+    assert not kb_manager.qdrant_client.collection_exists("kb_kb_summaries")
+    assert kb_manager.query_knowledge_base("ws", "topic3 detail", ["kb"], 3, hierarchical=True)[0]["metadata"]["file_name"] == "doc3.txt"
@@ -0,0 +1,50 @@
+import pytest
+
+from benchmarks.fakes import HashEmbedding
+from utils.embedding_cache import CachedEmbedding, LocalEmbeddingStore, RedisEmbeddingStore, create_embedding_store
+
+
+def test_hits_skip_the_model(tmp_path, monkeypatch):
+    embedded = []
+    embed = HashEmbedding._get_text_embeddings
+    monkeypatch.setattr(HashEmbedding, "_get_text_embeddings", lambda self, texts: embedded.extend(texts) or embed(self, texts))
+    cached = CachedEmbedding(HashEmbedding(embed_dim=8), LocalEmbeddingStore(str(tmp_path / "cache.sqlite3")))
+
+    first = cached.get_text_embedding_batch(["alpha", "beta"])
+    second = cached.get_text_embedding_batch(["beta", "gamma", "alpha"])
+    assert embedded == ["alpha", "beta", "gamma"]
+    assert second[0] == pytest.approx(first[1]) and second[2] == pytest.approx(first[0])
+    assert cached.stats == {"hits": 2, "misses": 3, "hit_ratio": 0.4}
+
+
+def test_local_store_evicts_least_recently_used(tmp_path):
+    store = LocalEmbeddingStore(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    store.set_many({"a": [1.0]})
+    store.set_many({"b": [2.0]})
+    # Reading a refreshes it, so b is the oldest when c goes over the bound
+    assert store.get_many(["a"]) == [[1.0]]
+    store.set_many({"c": [3.0]})
+
+    assert len(store) == 2
+    assert store.get_many(["a", "b", "c"]) == [[1.0], None, [3.0]]
+
+
+def test_redis_store_always_expires(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+
+    monkeypatch.setenv("KB_EMBED_CACHE", "redis")
+    store = create_embedding_store(redis_client)
+    assert isinstance(store, RedisEmbeddingStore)
+    store.set_many({"a": [1.0, 2.0]})
+    assert store.get_many(["a", "b"]) == [[1.0, 2.0], None]
+    assert 0 < redis_client.ttl("kb:embedding_cache:a") <= 7 * 24 * 3600
+
+    monkeypatch.setenv("KB_EMBED_CACHE_TTL", "0")
+    assert create_embedding_store(redis_client) is None
+
+
+def test_local_store_is_the_default(tmp_path, monkeypatch):
+    monkeypatch.delenv("KB_EMBED_CACHE", raising=False)
+    monkeypatch.setenv("KB_EMBED_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    assert isinstance(create_embedding_store(object()), LocalEmbeddingStore)
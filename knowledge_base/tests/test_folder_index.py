@@ -0,0 +1,87 @@
+import json
+
+from utils.folder_index import FolderIndex
+
+
+def docs(*pairs):
+    return [{"id": doc_id, "folderId": folder_id} for doc_id, folder_id in pairs]
+
+
+def sample_index() -> FolderIndex:
+    return FolderIndex.from_documents(docs(
+        ("a", "Finance"),
+        ("b", "Finance/2024"),
+        ("c", "Finance/2024/Q1"),
+        ("d", "HR"),
+    ))
+
+
+def test_subtree_depth():
+    index = sample_index()
+    full = index.subtree("Finance")
+    assert full["files"] == ["a"]
+    assert full["folders"][0]["id"] == "Finance/2024"
+    assert full["folders"][0]["folders"][0]["files"] == ["c"]
+
+    # Depth 0 is the folder with its own files and no subfolders
+    top = index.subtree("Finance", depth=0)
+    assert top["files"] == ["a"]
+    assert top["folders"] == []
+
+    one = index.subtree("Finance/", depth=1)
+    assert one["folders"][0]["files"] == ["b"]
+    assert one["folders"][0]["folders"] == []
+
+    assert index.subtree("Missing") is None
+
+
+def test_incremental_updates_prune_empty_folders():
+    index = sample_index()
+    index.add_file("e", "Finance/2024/Q2")
+    assert [folder["id"] for folder in index.subtree("Finance/2024")["folders"]] == ["Finance/2024/Q1", "Finance/2024/Q2"]
+
+    assert index.remove_file("c")
+    assert not index.remove_file("c")
+    assert index.subtree("Finance/2024/Q1") is None
+    assert [folder["id"] for folder in index.subtree("Finance/2024")["folders"]] == ["Finance/2024/Q2"]
+
+    # Re-adding a document moves it
+    index.add_file("d", "Legal")
+    assert index.subtree("HR") is None
+    assert index.subtree("Legal")["files"] == ["d"]
+    assert [folder["id"] for folder in index.tree()] == ["Finance", "Legal"]
+
+
+def test_round_trip_skips_pruned_folders():
+    index = sample_index()
+    index.remove_file("d")
+    index.add_file("f", "Ops/Infra")
+
+    restored = FolderIndex.from_dict(index.to_dict())
+    assert restored.tree() == index.tree()
+    assert len(restored) == len(index) == 5
+    assert len(restored.paths) == 5
+
+    restored.remove_file("f")
+    assert [folder["id"] for folder in restored.tree()] == ["Finance"]
+
+
+def test_kb_manager_keeps_index_in_memory(kb_manager, monkeypatch):
+    kb_manager._set_kb_folder_index("ws", "kb", sample_index())
+    key = kb_manager._get_kb_folder_structure_key("ws", "kb")
+
+    reads = []
+    get = kb_manager.redis_client.get
+    monkeypatch.setattr(kb_manager.redis_client, "get", lambda name: reads.append(name) or get(name))
+
+    assert kb_manager.get_folder_subtree("ws", "kb", "Finance", depth=0)["files"] == ["a"]
+    kb_manager.update_folder_index("ws", "kb", added=docs(("g", "Finance")), removed=["a"])
+    assert kb_manager.get_folder_subtree("ws", "kb", "Finance", depth=0)["files"] == ["g"]
+    assert key not in reads
+
+    # Another instance's write changes the version and the index is read again
+    other = FolderIndex.from_documents(docs(("z", "Other")))
+    kb_manager.redis_client.set(key, json.dumps(other.to_dict()))
+    kb_manager.redis_client.set(kb_manager._get_kb_folder_version_key("ws", "kb"), "changed")
+    assert [folder["id"] for folder in kb_manager.get_folder_structure("kb", "ws")] == ["Other"]
+    assert key in reads
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from utils.ingestion_scheduler import IngestionScheduler, IngestionJob
+
+
+def kb(kb_id: str, workspace_id: str = "ws"):
+    return SimpleNamespace(id=kb_id, workspace_id=workspace_id)
+
+
+class Recorder:
+    """Ingestion stand-in whose worker thread lingers after it sees the cancel event"""
+
+    def __init__(self, linger: float = 0.2):
+        self.linger = linger
+        self.events = []
+        self.active_threads = 0
+        self.max_active_threads = 0
+        self.started = {}
+        self._lock = threading.Lock()
+
+    def _work(self, job: IngestionJob):
+        with self._lock:
+            self.active_threads += 1
+            self.max_active_threads = max(self.max_active_threads, self.active_threads)
+        self.events.append(("start", job.kb_id, job.seq))
+        try:
+            deadline = time.monotonic() + 5
+            while not job.cancel_event.is_set() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            # Still writing the batch it was in the middle of
+            time.sleep(self.linger)
+        finally:
+            self.events.append(("end", job.kb_id, job.seq))
+            with self._lock:
+                self.active_threads -= 1
+
+    async def __call__(self, job: IngestionJob):
+        self.started.setdefault(job.kb_id, asyncio.Event()).set()
+        await asyncio.to_thread(self._work, job)
+        job.raise_if_cancelled()
+
+    async def wait_started(self, kb_id: str):
+        await asyncio.wait_for(self.started.setdefault(kb_id, asyncio.Event()).wait(), 5)
+
+
+async def wait_idle(scheduler: IngestionScheduler):
+    for _ in range(500):
+        if not scheduler.status()["running"] and not scheduler.status()["pending"]:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Scheduler did not drain: {scheduler.status()}")
+
+
+def test_resubmit_waits_for_cancelled_run():
+    async def main():
+        recorder = Recorder()
+        scheduler = IngestionScheduler(recorder, max_concurrency=2)
+        first = scheduler.submit(kb("a"))
+        await recorder.wait_started("a")
+        recorder.started["a"].clear()
+
+        second = scheduler.submit(kb("a"))
+        assert first.cancelled
+        assert scheduler.status()["running"] == ["a"]
+        assert scheduler.status()["pending"] == 1
+
+        await recorder.wait_started("a")
+        second.cancel_event.set()
+        await wait_idle(scheduler)
+        return recorder.events, first, second
+
+    events, first, second = asyncio.run(main())
+    # The second run starts only once the first run's thread has returned
+    assert events == [
+        ("start", "a", first.seq),
+        ("end", "a", first.seq),
+        ("start", "a", second.seq),
+        ("end", "a", second.seq),
+    ]
+
+
+def test_cancelled_run_keeps_its_slot():
+    async def main():
+        recorder = Recorder()
+        scheduler = IngestionScheduler(recorder, max_concurrency=1)
+        scheduler.submit(kb("a"))
+        await recorder.wait_started("a")
+
+        scheduler.cancel("a")
+        scheduler.submit(kb("b"))
+        await asyncio.sleep(0.05)
+        assert scheduler.status()["running"] == ["a"]
+
+        await recorder.wait_started("b")
+        scheduler.cancel("b")
+        await wait_idle(scheduler)
+        return recorder
+
+    recorder = asyncio.run(main())
+    assert recorder.max_active_threads == 1
+    assert [event[:2] for event in recorder.events] == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b")]
+
+
+def test_wait_returns_after_worker_thread():
+    async def main():
+        recorder = Recorder()
+        scheduler = IngestionScheduler(recorder)
+        scheduler.submit(kb("a"))
+        await recorder.wait_started("a")
+        assert scheduler.cancel("a")
+        await scheduler.wait("a")
+        return recorder.events
+
+    events = asyncio.run(main())
+    assert [event[0] for event in events] == ["start", "end"]
+
+
+def test_cancel_drops_deferred_resubmission():
+    async def main():
+        recorder = Recorder(linger=0.1)
+        scheduler = IngestionScheduler(recorder)
+        scheduler.submit(kb("a"))
+        await recorder.wait_started("a")
+        scheduler.submit(kb("a"))
+        scheduler.cancel("a")
+        await wait_idle(scheduler)
+        return recorder.events
+
+    assert len(asyncio.run(main())) == 2
+
+
+def test_fewest_running_workspace_goes_first():
+    async def main():
+        recorder = Recorder(linger=0)
+        scheduler = IngestionScheduler(recorder, max_concurrency=2)
+        scheduler.submit(kb("a", "ws1"))
+        scheduler.submit(kb("b", "ws1"))
+        scheduler.submit(kb("c", "ws1"), priority=0)
+        scheduler.submit(kb("d", "ws2"), priority=5)
+        await recorder.wait_started("b")
+
+        # The freed slot goes to ws2 despite its lower priority
+        scheduler.cancel("a")
+        await recorder.wait_started("d")
+        running = scheduler.status()["running"]
+        for kb_id in ("b", "c", "d"):
+            scheduler.cancel(kb_id)
+        await wait_idle(scheduler)
+        return running
+
+    assert asyncio.run(main()) == ["b", "d"]
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from utils.kb_parquet import import_collection_parquet, read_parquet_metadata
+
+SHARED = " ".join(
+    f"Section {i} of the quarterly report covers revenue, hiring and open risks for the region."
+    for i in range(30)
+)
+
+
+def test_export_includes_merged_near_duplicate_chunks(kb_manager, ingest, corpus):
+    pq = pytest.importorskip("pyarrow.parquet")
+    kb_manager.chunk_dedup_distance = 3
+    kb_manager.chunk_size = 64
+    kb_manager.chunk_overlap = 0
+    root = corpus({
+        "A/report.txt": SHARED + " Prepared by the A team.",
+        "B/report.md": SHARED + " Prepared by the B team.",
+    })
+    # An older copy, so the kept chunks also carry two dates
+    os.utime(root / "A/report.txt", (1_600_000_000, 1_600_000_000))
+    assert ingest(root) == "running"
+
+    result = kb_manager.export_knowledge_base_parquet("ws", "kb")
+    assert result["status"] == "success"
+    rows = pq.read_table(result["path"]).to_pylist()
+    assert len(rows) == result["metadata"]["points"] == kb_manager.qdrant_client.count("kb_kb", exact=True).count
+
+    merged = [row for row in rows if len(row["doc_type"]) == 2]
+    assert merged
+    assert all(sorted(row["doc_type"]) == ["MD", "TXT"] and len(row["date_ts"]) == 2 for row in merged)
+    assert all(len(row["doc_type"]) == 1 and len(row["date_ts"]) == 1 for row in rows if row not in merged)
+
+    # The raw payloads restore into Qdrant unchanged
+    assert read_parquet_metadata(result["path"])["kb_id"] == "kb"
+    assert import_collection_parquet(kb_manager.qdrant_client, "restored", result["path"]) == len(rows)
+    restored, _ = kb_manager.qdrant_client.scroll("restored", limit=len(rows), with_payload=True)
+    assert sum(isinstance(point.payload["doc_type"], list) for point in restored) == len(merged)
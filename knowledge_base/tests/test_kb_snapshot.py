@@ -0,0 +1,42 @@
+FILES = {
+    "Finance/budget.txt": "The travel budget for 2024 is twelve thousand euros.",
+    "HR/leave.txt": "Staff get twenty five days of annual leave.",
+}
+
+
+def export(kb_manager):
+    result = kb_manager.export_knowledge_base("ws", "kb")
+    assert result["status"] == "success"
+    return result["path"]
+
+
+def test_clone_gets_its_own_directory(kb_manager, ingest, corpus, tmp_path):
+    root = corpus(FILES)
+    assert ingest(root) == "running"
+    path = export(kb_manager)
+
+    clone_root = tmp_path / "clone"
+    result = kb_manager.import_knowledge_base(path, "ws", "copy", url=str(clone_root))
+    assert result["status"] == "success"
+    assert kb_manager.get_kb_status("copy", "ws") == "running"
+    assert kb_manager._get_kb_registration("ws", "copy").url == str(clone_root)
+
+    for doc in kb_manager._get_kb_docs("ws", "copy"):
+        assert doc["url"].startswith(f"file://{clone_root}/")
+        assert doc["original_doc"]["metadata"]["file_path"].startswith(f"{clone_root}/")
+    # The source KB's documents are untouched
+    assert all(doc["url"].startswith(f"file://{root}/") for doc in kb_manager._get_kb_docs("ws", "kb"))
+
+    results = kb_manager.query_knowledge_base("ws", "annual leave days", ["copy"], 1)
+    assert results[0]["metadata"]["file_name"] == "leave.txt"
+
+
+def test_clone_requires_url_and_new_id(kb_manager, ingest, corpus):
+    assert ingest(corpus(FILES)) == "running"
+    path = export(kb_manager)
+
+    assert "url" in kb_manager.import_knowledge_base(path, "ws", "copy")["message"]
+    # KB ids are global, the same id in another workspace collides with the source collections
+    assert "new kb_id" in kb_manager.import_knowledge_base(path, "other", url="/tmp/other")["message"]
+    assert "already exists" in kb_manager.import_knowledge_base(path)["message"]
+    assert kb_manager.get_kb_status("copy", "ws") == "not_found"
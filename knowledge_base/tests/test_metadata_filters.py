@@ -0,0 +1,97 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from schemas.document import RetrievalFilters
+from utils.metadata_filters import build_qdrant_filter, filter_metadata, folder_ancestors, merge_filter_metadata
+
+SHARED = " ".join(
+    f"Section {i} of the travel policy explains approvals, expense limits and refunds for staff trips."
+    for i in range(30)
+)
+
+
+def test_folder_ancestors():
+    assert folder_ancestors("Finance/2024/Q1") == ["Finance", "Finance/2024", "Finance/2024/Q1"]
+    assert folder_ancestors("/a//b/") == ["a", "a/b"]
+    assert folder_ancestors(None) == []
+
+
+def test_merge_filter_metadata():
+    shared_tags = ["policy"]
+    metadata = {"folder_ancestors": ["Finance"], "doc_type": "PDF", "tags": shared_tags, "date_ts": 1}
+    merge_filter_metadata(metadata, {"folder_ancestors": ["HR", "HR/Policies"], "doc_type": "DOCX", "tags": ["policy", "hr"], "date_ts": 2})
+    assert metadata == {
+        "folder_ancestors": ["Finance", "HR", "HR/Policies"],
+        "doc_type": ["PDF", "DOCX"],
+        "tags": ["policy", "hr"],
+        "date_ts": [1, 2],
+    }
+    # Lists shared with sibling chunks are not modified
+    assert shared_tags == ["policy"]
+
+    merge_filter_metadata(metadata, {"doc_type": "PDF", "date_ts": 1})
+    assert metadata["doc_type"] == ["PDF", "DOCX"]
+    assert metadata["date_ts"] == [1, 2]
+
+
+def test_unparseable_dates_are_rejected():
+    assert build_qdrant_filter(RetrievalFilters(date_from="2024-01-01", date_to="2024-12-31")) is not None
+    with pytest.raises(ValueError):
+        build_qdrant_filter(RetrievalFilters(date_from="last tuesday"))
+    with pytest.raises(ValueError):
+        build_qdrant_filter(RetrievalFilters(date_to="2024-13-45"))
+
+
+def test_filter_metadata_includes_duplicate_folders():
+    metadata = filter_metadata({"folderId": "Finance", "type": "pdf", "date": "2024-05-01"}, [{"folderId": "HR/Copies"}])
+    assert metadata["folder_ancestors"] == ["Finance", "HR", "HR/Copies"]
+    assert metadata["doc_type"] == "PDF"
+    assert metadata["date_ts"] == 1714521600
+
+
+def test_near_duplicate_chunks_match_both_folders(kb_manager, ingest, corpus):
+    kb_manager.chunk_dedup_distance = 3
+    kb_manager.chunk_size = 64
+    kb_manager.chunk_overlap = 0
+    root = corpus({
+        "Finance/travel.txt": SHARED + " Finance keeps the receipts.",
+        "HR/travel_copy.txt": SHARED + " HR answers questions about it.",
+    })
+    assert ingest(root) == "running"
+
+    def search(folder):
+        return kb_manager.query_knowledge_base("ws", "travel policy expense limits", ["kb"], 100, RetrievalFilters(folder_prefix=folder))
+
+    finance, hr = search("Finance"), search("HR")
+    dropped = [result for result in hr if "Finance" in result["metadata"]["folder_ancestors"]]
+    # The shared chunks were stored once, under the Finance copy, and still match HR
+    assert dropped
+    assert all("HR" in result["metadata"]["folder_ancestors"] for result in dropped)
+    assert len(hr) > len(dropped)
+    assert len(finance) == len(hr)
+
+
+def test_invalid_date_filter_is_a_400(loop, kb_manager):
+    from api.route import router
+
+    app = FastAPI()
+    app.include_router(router)
+    app.state.kb_manager = kb_manager
+
+    async def post(path, body):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post(path, json=body)
+
+    bad = {"date_from": "soon"}
+    for path, body in (
+        ("/api/retrieve", {"workspace_id": "ws", "query": "q", "filters": bad}),
+        ("/api/retrieve_batch", {"workspace_id": "ws", "queries": ["q"], "filters": bad}),
+        ("/api/query", {"workspace_id": "ws", "query": "q", "filters": bad}),
+    ):
+        response = loop.run_until_complete(post(path, body))
+        assert response.status_code == 400, path
+        assert "date_from" in response.json()["detail"]
+
+    response = loop.run_until_complete(post("/api/retrieve", {"workspace_id": "ws", "query": "q", "filters": {"date_from": "2024-01-01"}}))
+    assert response.status_code == 200
@@ -0,0 +1,52 @@
+from schemas.document import QueryRequest
+
+FILES = {
+    "HR/leave.txt": "Staff get twenty five days of annual leave.",
+    "Finance/budget.txt": "The travel budget for 2024 is twelve thousand euros.",
+}
+
+
+def count_completions(kb_manager, monkeypatch):
+    prompts = []
+    llm_class = type(kb_manager.llm)
+    complete = llm_class.complete
+    monkeypatch.setattr(llm_class, "complete", lambda self, prompt, **kwargs: prompts.append(prompt) or complete(self, prompt, **kwargs))
+    return prompts
+
+
+def test_cache_is_off_by_default(kb_manager, ingest, corpus, monkeypatch):
+    assert ingest(corpus(FILES)) == "running"
+    prompts = count_completions(kb_manager, monkeypatch)
+    query = QueryRequest(workspace_id="ws", query="How many days of annual leave?", top_k=1)
+
+    assert not kb_manager.response_cache.is_enabled("ws")
+    kb_manager.answer_with_context(query)
+    kb_manager.answer_with_context(query)
+    assert len(prompts) == 2
+
+
+def test_cache_hit_needs_the_same_context(loop, kb_manager, ingest, corpus, monkeypatch, tmp_path):
+    kb_manager.response_cache.ttl = 3600
+    assert ingest(corpus(FILES)) == "running"
+    prompts = count_completions(kb_manager, monkeypatch)
+    query = QueryRequest(workspace_id="ws", query="How many days of annual leave?", top_k=1)
+
+    answer = kb_manager.answer_with_context(query)
+    assert kb_manager.answer_with_context(query) == answer
+    assert len(prompts) == 1
+
+    # The same question over changed documents retrieves other context and is answered again
+    staged = tmp_path / "upload.part"
+    staged.write_text("Staff get thirty days of annual leave from 2025.", encoding="utf-8")
+    kb_manager.add_file("ws", "kb", str(staged), "HR/leave.txt")
+    kb_manager.answer_with_context(query)
+    assert len(prompts) == 2
+    assert "thirty days" in prompts[1] and "thirty days" not in prompts[0]
+
+    # Streaming answers share the cache
+    async def stream():
+        gen = await kb_manager.stream_answer_with_context(query.model_copy(update={"streaming": True}))
+        return "".join([getattr(chunk, "delta", chunk) async for chunk in gen])
+
+    assert loop.run_until_complete(stream()) == kb_manager.answer_with_context(query)
+    assert len(prompts) == 2
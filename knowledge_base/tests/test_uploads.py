@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+
+from schemas.document import KnowledgeBaseRegistration, RetrievalFilters
+from utils.uploads import UploadError, UploadStore, safe_relative_path
+
+FILES = {
+    "Finance/budget.txt": "The travel budget for 2024 is twelve thousand euros.",
+    "HR/leave.txt": "Staff get twenty five days of annual leave.",
+}
+
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_safe_relative_path():
+    assert safe_relative_path("/HR//Policies/", "leave.txt") == "HR/Policies/leave.txt"
+    assert safe_relative_path(None, "../../etc/passwd") == "passwd"
+    with pytest.raises(UploadError):
+        safe_relative_path("HR/../..", "leave.txt")
+    with pytest.raises(UploadError):
+        safe_relative_path("HR", "..")
+
+
+def test_upload_resumes_at_committed_offset(tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    store = UploadStore(fakeredis.FakeRedis(decode_responses=True), str(tmp_path))
+
+    async def main():
+        upload = store.create("ws", "kb", "notes.txt", "HR", size=10)
+        assert await store.append(upload["id"], 0, body(b"abcd")) == 4
+
+        # A retried chunk that was already written is refused with the offset to resume from
+        with pytest.raises(UploadError) as rejected:
+            await store.append(upload["id"], 0, body(b"abcd"))
+        assert rejected.value.status_code == 409
+        assert store.get(upload["id"])["offset"] == 4
+
+        with pytest.raises(UploadError) as rejected:
+            await store.append(upload["id"], 4, body(b"efgh", b"ijkl"))
+        assert rejected.value.status_code == 413
+        # The part within the size is kept
+        assert store.get(upload["id"])["offset"] == 8
+        assert await store.append(upload["id"], 8, body(b"ij")) == 10
+        return upload
+
+    upload = asyncio.run(main())
+    assert open(store.staging_path(upload["id"]), "rb").read() == b"abcdefghij"
+
+
+def stage(tmp_path, text, name="upload.part"):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def search(kb_manager, text, folder=None):
+    filters = RetrievalFilters(folder_prefix=folder) if folder else None
+    return kb_manager.query_knowledge_base("ws", text, ["kb"], 5, filters)
+
+
+def test_add_file_indexes_and_replaces(kb_manager, ingest, corpus, tmp_path):
+    root = corpus(FILES)
+    assert ingest(root) == "running"
+
+    result = kb_manager.add_file("ws", "kb", stage(tmp_path, "Parking permits are issued by the facilities team."), "Ops/parking.txt")
+    assert (result["documents"], result["replaced"]) == (1, 0)
+    assert search(kb_manager, "parking permits facilities")[0]["metadata"]["file_name"] == "parking.txt"
+
+    result = kb_manager.add_file("ws", "kb", stage(tmp_path, "Bicycle storage is in the basement."), "Ops/parking.txt")
+    assert result["replaced"] == 1
+    texts = [hit["text"] for hit in search(kb_manager, "parking permits facilities")]
+    assert not any("permits" in text for text in texts)
+    assert (root / "Ops/parking.txt").read_text() == "Bicycle storage is in the basement."
+
+
+def test_identical_copy_updates_stored_node_metadata(kb_manager, ingest, corpus, tmp_path, monkeypatch):
+    kb_manager.chunk_size = 32
+    kb_manager.chunk_overlap = 0
+    files = {**FILES, "HR/leave.txt": " ".join(f"Rule {i}: staff get twenty five days of annual leave." for i in range(20))}
+    assert ingest(corpus(files)) == "running"
+
+    batches = []
+    batch_update_points = kb_manager.qdrant_client.batch_update_points
+    monkeypatch.setattr(kb_manager.qdrant_client, "batch_update_points", lambda name, **kwargs: batches.append(name) or batch_update_points(name, **kwargs))
+    kb_manager.add_file("ws", "kb", stage(tmp_path, files["HR/leave.txt"]), "Legal/leave_copy.txt")
+    # Every chunk of the HR file is rewritten in a single request
+    assert batches == ["kb_kb"]
+
+    # The HR chunk is found under the copy's folder and reports it in its metadata
+    hits = search(kb_manager, "annual leave days", folder="Legal")
+    assert len(hits) == 5 and all(hit["metadata"]["file_name"] == "leave.txt" for hit in hits)
+    assert "Legal" in hits[0]["metadata"]["folder_ancestors"]
+    copy_id = next(doc["id"] for doc in kb_manager._get_kb_docs("ws", "kb") if doc.get("duplicateOf"))
+    assert hits[0]["metadata"]["duplicate_doc_ids"] == [copy_id]
+
+    # Replacing the copy with other content takes its folder off the HR chunk again
+    kb_manager.add_file("ws", "kb", stage(tmp_path, "Contracts are reviewed by counsel."), "Legal/leave_copy.txt")
+    hit = search(kb_manager, "annual leave days")[0]
+    assert hit["metadata"]["file_name"] == "leave.txt"
+    assert "Legal" not in hit["metadata"]["folder_ancestors"]
+    assert hit["metadata"]["duplicate_doc_ids"] == []
+
+
+def test_failed_add_file_leaves_kb_unchanged(kb_manager, ingest, corpus, tmp_path, monkeypatch):
+    root = corpus(FILES)
+    assert ingest(root) == "running"
+    docs = kb_manager._get_kb_docs("ws", "kb")
+    points = kb_manager.qdrant_client.count("kb_kb", exact=True).count
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("summary model unavailable")
+
+    kb_manager.doc_summaries = True
+    kb_manager.summary_min_docs = 0
+    monkeypatch.setattr(kb_manager, "_build_document_summaries", fail)
+    staged = stage(tmp_path, "Staff get thirty days of annual leave from 2025.")
+    with pytest.raises(RuntimeError):
+        kb_manager.add_file("ws", "kb", staged, "HR/leave.txt")
+
+    # The upload is back in staging, the replaced file and its chunks are untouched
+    assert open(staged).read().startswith("Staff get thirty days")
+    assert (root / "HR/leave.txt").read_text() == FILES["HR/leave.txt"]
+    assert kb_manager._get_kb_docs("ws", "kb") == docs
+    assert kb_manager.qdrant_client.count("kb_kb", exact=True).count == points
+    assert not kb_manager.qdrant_client.collection_exists("kb_kb_summaries")
+
+
+def test_full_ingestion_waits_for_an_upload(loop, kb_manager, ingest, corpus):
+    root = corpus(FILES)
+    assert ingest(root) == "running"
+
+    async def main():
+        # Held by add_file while an upload is indexed
+        with kb_manager._kb_write_lock("kb"):
+            kb_manager.register_knowledge_base(KnowledgeBaseRegistration(
+                id="kb", name="kb", workspace_id="ws", source="local_store", url=str(root), embedding_engine=""
+            ))
+            await asyncio.sleep(0.3)
+            assert kb_manager._get_ingest_checkpoint("ws", "kb")["phase"] == "queued"
+        for _ in range(500):
+            await asyncio.sleep(0.02)
+            if kb_manager.get_kb_status("kb", "ws") == "running":
+                return
+        raise AssertionError("Ingestion did not finish")
+
+    loop.run_until_complete(main())
+
+
+def test_delete_waits_for_uploads_and_removes_them(loop, kb_manager, ingest, corpus, tmp_path):
+    assert ingest(corpus(FILES)) == "running"
+    pending = kb_manager.create_upload("ws", "kb", "notes.txt", "HR")
+    staged = stage(tmp_path, "Parking permits are issued by the facilities team.")
+
+    async def main():
+        lock = kb_manager._kb_write_lock("kb")
+        # Held by add_file while an upload is indexed
+        lock.acquire()
+        deleting = asyncio.create_task(kb_manager.delete_knowledge_base("kb", "ws"))
+        await asyncio.sleep(0.2)
+        assert not deleting.done()
+        assert kb_manager.get_kb_status("kb", "ws") == "running"
+        lock.release()
+        return await deleting
+
+    assert loop.run_until_complete(main())["status"] == "success"
+    assert kb_manager.upload_store.get(pending["id"]) is None
+    assert not (tmp_path / "uploads" / f"{pending['id']}.part").exists()
+
+    # An upload that was waiting for the lock finds the KB gone and writes nothing back
+    with pytest.raises(UploadError) as rejected:
+        kb_manager.add_file("ws", "kb", staged, "Ops/parking.txt")
+    assert rejected.value.status_code == 404
+    assert not kb_manager.qdrant_client.collection_exists("kb_kb")
+    assert not kb_manager.redis_client.keys("kb:ws:kb:*")
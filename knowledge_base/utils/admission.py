@@ -0,0 +1,129 @@
+from typing import Dict, Optional
+import asyncio
+import math
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "kb_admission_in_flight",
+    "Requests currently being served",
+    ["endpoint"]
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "kb_admission_queue_depth",
+    "Requests waiting for a slot",
+    ["endpoint"]
+)
+ADMISSION_REJECTED = Counter(
+    "kb_admission_rejected_total",
+    "Requests rejected by admission control",
+    ["endpoint", "reason"]
+)
+ADMISSION_WAIT = Histogram(
+    "kb_admission_wait_seconds",
+    "Time admitted requests waited for a slot",
+    ["endpoint"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of queued"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded wait queue and per-workspace quotas
+
+    At most ``max_concurrency`` requests run at once and at most ``max_queue``
+    wait for a slot, each for up to ``queue_timeout`` seconds. A workspace may
+    hold at most ``workspace_quota`` running or waiting requests. Requests over
+    a limit are rejected immediately: 429 for a workspace over its quota, 503
+    when the service as a whole is saturated. Retry-After is estimated from
+    the recent average service time.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float = 10.0,
+        workspace_quota: Optional[int] = None
+    ):
+        self.endpoint = endpoint
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.workspace_quota = workspace_quota
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._workspaces: Dict[str, int] = {}
+        # Exponentially weighted average of how long a slot is held
+        self._service_time = 1.0
+
+    def _retry_after(self) -> int:
+        backlog = (self._waiting + self.max_concurrency) / self.max_concurrency
+        return max(1, math.ceil(backlog * self._service_time))
+
+    def _reject(self, status_code: int, reason: str) -> AdmissionRejected:
+        ADMISSION_REJECTED.labels(endpoint=self.endpoint, reason=reason).inc()
+        return AdmissionRejected(status_code, reason, self._retry_after())
+
+    async def acquire(self, workspace_id: Optional[str] = None) -> float:
+        """Wait for a slot, returns the admission time to pass to release()"""
+        workspace = workspace_id or ""
+        if self.workspace_quota and self._workspaces.get(workspace, 0) >= self.workspace_quota:
+            raise self._reject(429, "workspace_quota")
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            raise self._reject(503, "queue_full")
+
+        self._workspaces[workspace] = self._workspaces.get(workspace, 0) + 1
+        started = time.monotonic()
+        if not self._semaphore.locked():
+            # A free slot is taken without yielding to the event loop
+            await self._semaphore.acquire()
+            return self._admit(started)
+
+        self._waiting += 1
+        ADMISSION_QUEUE_DEPTH.labels(endpoint=self.endpoint).set(self._waiting)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._release_workspace(workspace)
+            raise self._reject(503, "queue_timeout")
+        except BaseException:
+            self._release_workspace(workspace)
+            raise
+        finally:
+            self._waiting -= 1
+            ADMISSION_QUEUE_DEPTH.labels(endpoint=self.endpoint).set(self._waiting)
+
+        return self._admit(started)
+
+    def _admit(self, started: float) -> float:
+        admitted = time.monotonic()
+        ADMISSION_WAIT.labels(endpoint=self.endpoint).observe(admitted - started)
+        ADMISSION_IN_FLIGHT.labels(endpoint=self.endpoint).inc()
+        return admitted
+
+    def release(self, workspace_id: Optional[str], admitted: float) -> None:
+        """Free a slot taken by acquire()"""
+        self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - admitted)
+        self._release_workspace(workspace_id or "")
+        self._semaphore.release()
+        ADMISSION_IN_FLIGHT.labels(endpoint=self.endpoint).dec()
+
+    def _release_workspace(self, workspace: str) -> None:
+        count = self._workspaces.get(workspace, 0) - 1
+        if count > 0:
+            self._workspaces[workspace] = count
+        else:
+            self._workspaces.pop(workspace, None)
+
@@ -0,0 +1,80 @@
+from typing import Dict, List, Optional
+import re
+import hashlib
+
+SIMHASH_BITS = 64
+# The 64-bit fingerprint is split into this many bands. Two fingerprints within
+# BANDS - 1 bits of each other always agree on at least one whole band, so
+# candidates can be found by exact band lookups instead of pairwise comparison.
+SIMHASH_BANDS = 4
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """Compute a 64-bit SimHash fingerprint from word shingles of the text"""
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return 0
+    if len(tokens) < shingle_size:
+        features = [" ".join(tokens)]
+    else:
+        features = [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        h = _feature_hash(feature)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class ChunkDeduplicator:
+    """Detects near-duplicate chunks using SimHash fingerprints.
+
+    ``add`` returns the key of a previously added chunk whose fingerprint is
+    within ``max_distance`` bits, or registers the chunk as canonical and
+    returns None.
+    """
+
+    def __init__(self, max_distance: int = 3):
+        if max_distance >= SIMHASH_BANDS:
+            raise ValueError(f"max_distance must be lower than {SIMHASH_BANDS}")
+        self.max_distance = max_distance
+        self._band_bits = SIMHASH_BITS // SIMHASH_BANDS
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(SIMHASH_BANDS)]
+        self._keys: List[str] = []
+        self._fingerprints: List[int] = []
+
+    def _bands(self, fingerprint: int) -> List[int]:
+        mask = (1 << self._band_bits) - 1
+        return [fingerprint >> (band * self._band_bits) & mask for band in range(SIMHASH_BANDS)]
+
+    def add(self, key: str, text: str) -> Optional[str]:
+        fingerprint = simhash(text)
+        bands = self._bands(fingerprint)
+
+        for band, value in enumerate(bands):
+            for candidate in self._buckets[band].get(value, []):
+                if hamming_distance(fingerprint, self._fingerprints[candidate]) <= self.max_distance:
+                    return self._keys[candidate]
+
+        index = len(self._keys)
+        self._keys.append(key)
+        self._fingerprints.append(fingerprint)
+        for band, value in enumerate(bands):
+            self._buckets[band].setdefault(value, []).append(index)
+        return None
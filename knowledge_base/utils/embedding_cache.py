@@ -0,0 +1,223 @@
+from typing import List, Optional, Dict, Any
+from array import array
+import os
+import base64
+import hashlib
+import sqlite3
+import threading
+import time
+
+from loguru import logger
+from pydantic import PrivateAttr
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+
+def embedding_cache_key(model_name: str, text: str) -> str:
+    """Content address of a chunk embedding"""
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+def encode_vector(vector: List[float]) -> str:
+    return base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+
+
+def decode_vector(value: str) -> List[float]:
+    return array("f", base64.b64decode(value)).tolist()
+
+
+class RedisEmbeddingStore:
+    """Embedding store shared by every KB service instance through Redis
+
+    Every cached vector expires ``ttl`` seconds after it was last written, a
+    hit does not extend it, so Redis only holds the chunks of recent ingestions.
+    """
+
+    def __init__(self, redis_client, ttl: int):
+        self.redis_client = redis_client
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"kb:embedding_cache:{key}"
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        redis_keys = [self._key(key) for key in keys]
+        if hasattr(self.redis_client, "mget_nonatomic"):
+            values = self.redis_client.mget_nonatomic(redis_keys)
+        else:
+            values = self.redis_client.mget(redis_keys)
+        return [decode_vector(value) if value else None for value in values]
+
+    def set_many(self, items: Dict[str, List[float]]) -> None:
+        pipe = self.redis_client.pipeline()
+        for key, vector in items.items():
+            pipe.set(self._key(key), encode_vector(vector), ex=self.ttl)
+        pipe.execute()
+
+
+class LocalEmbeddingStore:
+    """Embedding store kept in a local SQLite file
+
+    At most ``max_entries`` vectors are kept, the least recently used ones are
+    evicted once a write goes over the bound.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        # Caches created before eviction have no access time, they are evicted first
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")]
+        if "used_at" not in columns:
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_used_at ON embeddings (used_at)")
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET used_at = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+        return [found.get(key) for key in keys]
+
+    def set_many(self, items: Dict[str, List[float]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, used_at) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY used_at LIMIT ?)",
+                    (excess,)
+                )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def create_embedding_store(redis_client=None):
+    """Build the embedding store selected by KB_EMBED_CACHE (local, redis or none)
+
+    The default is a bounded local SQLite file, KB_EMBED_CACHE_MAX_ENTRIES
+    vectors. The Redis store is shared between instances but every vector in
+    it expires after KB_EMBED_CACHE_TTL seconds, it must not hold a second
+    copy of every collection.
+    """
+    backend = os.getenv("KB_EMBED_CACHE", "local").lower()
+    if backend == "redis" and redis_client is not None:
+        ttl = int(os.getenv("KB_EMBED_CACHE_TTL", str(7 * 24 * 3600)))
+        if ttl > 0:
+            return RedisEmbeddingStore(redis_client, ttl=ttl)
+        logger.warning("Redis embedding cache disabled, KB_EMBED_CACHE_TTL must be positive")
+    if backend == "local":
+        path = os.getenv("KB_EMBED_CACHE_PATH", "/storage/.kb_cache/embeddings.sqlite3")
+        try:
+            return LocalEmbeddingStore(path, max_entries=int(os.getenv("KB_EMBED_CACHE_MAX_ENTRIES", "1000000")))
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Embedding cache disabled, cannot open {path}: {str(e)}")
+    return None
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Wraps an embedding model with a content-addressed cache of text embeddings.
+
+    Only document (text) embeddings are cached; query embeddings always go to the
+    wrapped model. Create one instance per ingestion run to get per-run hit stats.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _store: Any = PrivateAttr()
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+    _stats_lock: Any = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, store, **kwargs: Any):
+        super().__init__(
+            model_name=f"{embed_model.class_name()}:{embed_model.model_name}",
+            embed_batch_size=kwargs.pop("embed_batch_size", 256),
+            **kwargs
+        )
+        self._embed_model = embed_model
+        self._store = store
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        total = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / total, 4) if total else 0.0
+        }
+
+    def _lookup(self, texts: List[str]):
+        keys = [embedding_cache_key(self.model_name, text) for text in texts]
+        try:
+            cached = self._store.get_many(keys)
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed: {str(e)}")
+            cached = [None] * len(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        with self._stats_lock:
+            self._hits += len(texts) - len(missing)
+            self._misses += len(missing)
+        return keys, cached, missing
+
+    def _save(self, keys: List[str], missing: List[int], vectors: List[List[float]]) -> None:
+        try:
+            self._store.set_many({keys[i]: vector for i, vector in zip(missing, vectors)})
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {str(e)}")
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._lookup(texts)
+        if missing:
+            vectors = self._embed_model.get_text_embedding_batch([texts[i] for i in missing])
+            self._save(keys, missing, vectors)
+            for i, vector in zip(missing, vectors):
+                cached[i] = vector
+        return cached
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._lookup(texts)
+        if missing:
+            vectors = await self._embed_model.aget_text_embedding_batch([texts[i] for i in missing])
+            self._save(keys, missing, vectors)
+            for i, vector in zip(missing, vectors):
+                cached[i] = vector
+        return cached
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._embed_model.aget_query_embedding(query)
@@ -0,0 +1,169 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def _split_path(folder_id: str) -> List[str]:
+    return [part for part in (folder_id or "").split("/") if part]
+
+
+class FolderIndex:
+    """Flat, array-backed index of a knowledge base's folder tree
+
+    Folders are rows in parallel lists (path, name, parent id), with a path to
+    row map so any folder is found in O(1). Children and files are kept per
+    row, and serialized as offset arrays over one flat list each, so the
+    stored form has no nesting. Files can be added and removed one at a time;
+    folders that become empty are pruned and dropped on the next serialization.
+    """
+
+    def __init__(self):
+        self.paths: List[str] = []
+        self.names: List[str] = []
+        self.parents: List[int] = []
+        self.children: List[List[int]] = []
+        self.files: List[Dict[str, None]] = []
+        self.roots: List[int] = []
+        self._ids: Dict[str, int] = {}
+        self._file_folders: Dict[str, int] = {}
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Any]) -> "FolderIndex":
+        index = cls()
+        for doc in documents:
+            doc_id = doc.get("id", "") if isinstance(doc, dict) else doc.id
+            folder_id = doc.get("folderId", "") if isinstance(doc, dict) else doc.folderId
+            index.add_file(doc_id, folder_id)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _ensure_folder(self, parts: List[str]) -> int:
+        parent = -1
+        path = ""
+        for part in parts:
+            path = f"{path}/{part}" if path else part
+            row = self._ids.get(path)
+            if row is None:
+                row = len(self.paths)
+                self.paths.append(path)
+                self.names.append(part)
+                self.parents.append(parent)
+                self.children.append([])
+                self.files.append({})
+                self._ids[path] = row
+                if parent < 0:
+                    self.roots.append(row)
+                else:
+                    self.children[parent].append(row)
+            parent = row
+        return parent
+
+    def add_file(self, doc_id: str, folder_id: str) -> None:
+        """Add a document to its folder, creating missing folders on the way"""
+        parts = _split_path(folder_id)
+        if not parts or not doc_id:
+            return
+        if doc_id in self._file_folders:
+            self.remove_file(doc_id)
+        row = self._ensure_folder(parts)
+        self.files[row][doc_id] = None
+        self._file_folders[doc_id] = row
+
+    def remove_file(self, doc_id: str) -> bool:
+        """Remove a document, pruning folders left without files or subfolders"""
+        row = self._file_folders.pop(doc_id, None)
+        if row is None:
+            return False
+        self.files[row].pop(doc_id, None)
+
+        while row >= 0 and not self.files[row] and not self.children[row]:
+            parent = self.parents[row]
+            siblings = self.roots if parent < 0 else self.children[parent]
+            siblings.remove(row)
+            del self._ids[self.paths[row]]
+            self.parents[row] = -2
+            row = parent
+        return True
+
+    def subtree(self, folder_id: str, depth: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Return one folder in the Folder schema shape, None if it does not exist
+
+        ``depth`` limits how many levels of subfolders are listed. Every listed
+        folder has its files, folders at the limit are returned with empty
+        ``folders``; depth 0 is the folder and its own files.
+        """
+        row = self._ids.get("/".join(_split_path(folder_id)))
+        if row is None:
+            return None
+        return self._render(row, depth)
+
+    def tree(self, depth: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the root folders in the Folder schema shape"""
+        return [self._render(row, depth) for row in self.roots]
+
+    def _render(self, row: int, depth: Optional[int]) -> Dict[str, Any]:
+        expand = depth is None or depth > 0
+        next_depth = None if depth is None else depth - 1
+        return {
+            "id": self.paths[row],
+            "name": self.names[row],
+            "folders": [self._render(child, next_depth) for child in self.children[row]] if expand else [],
+            "files": list(self.files[row]),
+            "isOpen": False
+        }
+
+    def to_dict(self) -> Dict[str, List]:
+        """Compact form with offset arrays, rows renumbered to skip pruned folders"""
+        order = self._preorder()
+        new_ids = {row: new for new, row in enumerate(order)}
+
+        child_offsets, child_rows = [0], []
+        file_offsets, file_ids = [0], []
+        for row in order:
+            child_rows.extend(new_ids[child] for child in self.children[row])
+            child_offsets.append(len(child_rows))
+            file_ids.extend(self.files[row])
+            file_offsets.append(len(file_ids))
+
+        return {
+            "names": [self.names[row] for row in order],
+            "parents": [new_ids.get(self.parents[row], -1) for row in order],
+            "child_offsets": child_offsets,
+            "children": child_rows,
+            "file_offsets": file_offsets,
+            "files": file_ids
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, List]) -> "FolderIndex":
+        index = cls()
+        names = data.get("names", [])
+        parents = data.get("parents", [])
+        child_offsets = data.get("child_offsets", [0])
+        file_offsets = data.get("file_offsets", [0])
+        children = data.get("children", [])
+        files = data.get("files", [])
+
+        index.names = list(names)
+        index.parents = list(parents)
+        for row, parent in enumerate(parents):
+            # Rows are stored in pre-order, so a parent's path is always known
+            path = names[row] if parent < 0 else f"{index.paths[parent]}/{names[row]}"
+            index.paths.append(path)
+            index._ids[path] = row
+            index.children.append(children[child_offsets[row]:child_offsets[row + 1]])
+            index.files.append(dict.fromkeys(files[file_offsets[row]:file_offsets[row + 1]]))
+            for doc_id in index.files[row]:
+                index._file_folders[doc_id] = row
+            if parent < 0:
+                index.roots.append(row)
+        return index
+
+    def _preorder(self) -> List[int]:
+        order = []
+        stack = list(reversed(self.roots))
+        while stack:
+            row = stack.pop()
+            order.append(row)
+            stack.extend(reversed(self.children[row]))
+        return order
@@ -0,0 +1,188 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+
+from loguru import logger
+
+
+class IngestionCancelled(Exception):
+    """Raised inside an ingestion run once its KB has been cancelled"""
+
+
+class IngestionJob:
+    """A queued or running ingestion of one knowledge base"""
+
+    def __init__(self, kb_item: Any, priority: int, seq: int):
+        self.kb_item = kb_item
+        self.priority = priority
+        self.seq = seq
+        # Checked by ingestion code running in worker threads, where task
+        # cancellation cannot reach. A cancelled job keeps its slot until its
+        # worker thread has returned
+        self.cancel_event = threading.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def kb_id(self) -> str:
+        return self.kb_item.id
+
+    @property
+    def workspace_id(self) -> str:
+        return self.kb_item.workspace_id
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancel_event.is_set():
+            raise IngestionCancelled(self.kb_id)
+
+
+def estimate_priority(path: Optional[str], max_entries: int = 10000) -> int:
+    """Priority tier from the size of a source directory, smaller runs first
+
+    Tiers are log2 of the total size in MiB so KBs of similar size stay FIFO.
+    The walk stops after max_entries files; anything that large goes last.
+    """
+    if not path or not os.path.isdir(path):
+        return 0
+
+    total_bytes = 0
+    entries = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            entries += 1
+            if entries > max_entries:
+                return 32
+            try:
+                total_bytes += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+
+    return max(0, math.ceil(math.log2(total_bytes / (1024 * 1024) + 1)))
+
+
+class IngestionScheduler:
+    """Runs KB ingestions in a bounded number of concurrent slots
+
+    The next job goes to the workspace with the fewest running ingestions,
+    then the lowest priority value, then the earliest submission. A huge KB
+    therefore cannot hold every slot while other workspaces wait.
+
+    Cancelling a running job only signals it to stop. The job holds its slot
+    and its KB until it returns, and a resubmission of the KB is queued only
+    after that, so two runs of one KB never overlap.
+    """
+
+    def __init__(self, run_job: Callable[[IngestionJob], Awaitable[None]], max_concurrency: int = 2):
+        self.run_job = run_job
+        self.max_concurrency = max(1, max_concurrency)
+        self._seq = itertools.count()
+        self._pending: Dict[str, List[tuple]] = {}
+        self._running: Dict[str, IngestionJob] = {}
+        self._running_per_workspace: Dict[str, int] = {}
+        # Resubmissions waiting for the cancelled run of their KB to return
+        self._deferred: Dict[str, IngestionJob] = {}
+
+    def submit(self, kb_item: Any, priority: int = 0) -> IngestionJob:
+        """Queue a KB for ingestion, replacing any queued or running run for the same KB"""
+        self.cancel(kb_item.id)
+
+        job = IngestionJob(kb_item, priority, next(self._seq))
+        if job.kb_id in self._running:
+            self._deferred[job.kb_id] = job
+            logger.info(f"Queued ingestion of KB {job.kb_id} once its cancelled run stops")
+            return job
+        self._enqueue(job)
+        logger.info(f"Queued ingestion of KB {job.kb_id} with priority {priority}")
+        self._dispatch()
+        return job
+
+    def _enqueue(self, job: IngestionJob) -> None:
+        heapq.heappush(self._pending.setdefault(job.workspace_id, []), (job.priority, job.seq, job))
+
+    def cancel(self, kb_id: str) -> bool:
+        """Cancel a queued or running ingestion, returns whether one was found
+
+        A running job is signalled and stops at its next cancellation check,
+        await wait() to know it has stopped.
+        """
+        found = self._deferred.pop(kb_id, None) is not None
+        for workspace_id, heap in list(self._pending.items()):
+            remaining = [entry for entry in heap if entry[2].kb_id != kb_id]
+            if len(remaining) != len(heap):
+                found = True
+                heapq.heapify(remaining)
+                if remaining:
+                    self._pending[workspace_id] = remaining
+                else:
+                    del self._pending[workspace_id]
+
+        job = self._running.get(kb_id)
+        if job:
+            found = True
+            job.cancel_event.set()
+
+        if found:
+            logger.info(f"Cancelled ingestion of KB {kb_id}")
+        return found
+
+    async def wait(self, kb_id: str) -> None:
+        """Wait until the running ingestion of a KB, if any, has returned"""
+        job = self._running.get(kb_id)
+        if job and job.task:
+            await asyncio.shield(job.task)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": sorted(self._running),
+            "pending": sum(len(heap) for heap in self._pending.values()) + len(self._deferred),
+            "max_concurrency": self.max_concurrency
+        }
+
+    def _next_job(self) -> Optional[IngestionJob]:
+        if not self._pending:
+            return None
+        workspace_id = min(
+            self._pending,
+            key=lambda ws: (self._running_per_workspace.get(ws, 0),) + self._pending[ws][0][:2]
+        )
+        heap = self._pending[workspace_id]
+        _, _, job = heapq.heappop(heap)
+        if not heap:
+            del self._pending[workspace_id]
+        return job
+
+    def _dispatch(self) -> None:
+        while len(self._running) < self.max_concurrency:
+            job = self._next_job()
+            if job is None:
+                return
+            self._running[job.kb_id] = job
+            self._running_per_workspace[job.workspace_id] = self._running_per_workspace.get(job.workspace_id, 0) + 1
+            job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: IngestionJob) -> None:
+        try:
+            await self.run_job(job)
+        except asyncio.CancelledError:
+            logger.info(f"Ingestion task for KB {job.kb_id} cancelled")
+        except Exception as e:
+            logger.error(f"Error in KB ingestion of {job.kb_id}: {str(e)}")
+        finally:
+            if self._running.get(job.kb_id) is job:
+                del self._running[job.kb_id]
+            remaining = self._running_per_workspace.get(job.workspace_id, 1) - 1
+            if remaining:
+                self._running_per_workspace[job.workspace_id] = remaining
+            else:
+                self._running_per_workspace.pop(job.workspace_id, None)
+            deferred = self._deferred.pop(job.kb_id, None)
+            if deferred:
+                self._enqueue(deferred)
+            self._dispatch()
@@ -0,0 +1,162 @@
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import os
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as rest
+
+from utils.kb_snapshot import collection_vector_params
+
+# Version 2 made doc_type and date_ts lists, the points themselves are unchanged
+PARQUET_FORMAT_VERSION = 2
+READABLE_FORMAT_VERSIONS = (1, 2)
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa # type: ignore
+        import pyarrow.parquet as pq # type: ignore
+    except ImportError:
+        raise RuntimeError("pyarrow is required for Parquet exports: pip install pyarrow")
+    return pa, pq
+
+
+def _schema(pa, dim: int):
+    # Columns decoded from the payload are for analysis, payload keeps the raw
+    # payload so a file restores into Qdrant exactly as it was exported. A chunk
+    # kept for near-duplicates of other types or dates holds several of each
+    return pa.schema([
+        ("id", pa.string()),
+        ("ref_doc_id", pa.string()),
+        ("doc_id", pa.string()),
+        ("file_name", pa.string()),
+        ("file_path", pa.string()),
+        ("folder_ancestors", pa.list_(pa.string())),
+        ("doc_type", pa.list_(pa.string())),
+        ("tags", pa.list_(pa.string())),
+        ("date_ts", pa.list_(pa.int64())),
+        ("duplicate_doc_ids", pa.list_(pa.string())),
+        ("text", pa.string()),
+        ("text_chars", pa.int32()),
+        ("metadata", pa.string()),
+        ("payload", pa.string()),
+        ("vector", pa.list_(pa.float32(), dim)),
+    ])
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value in (None, ""):
+        return []
+    return list(value) if isinstance(value, list) else [value]
+
+
+def _row(point, vector_name: Optional[str]) -> Dict[str, Any]:
+    from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+    node = metadata_dict_to_node(point.payload)
+    metadata = node.metadata
+    return {
+        "id": str(point.id),
+        "ref_doc_id": point.payload.get("ref_doc_id"),
+        "doc_id": metadata.get("doc_id"),
+        "file_name": metadata.get("file_name"),
+        "file_path": metadata.get("file_path"),
+        "folder_ancestors": list(metadata.get("folder_ancestors") or []),
+        "doc_type": _as_list(metadata.get("doc_type")),
+        "tags": list(metadata.get("tags") or []),
+        "date_ts": _as_list(metadata.get("date_ts")),
+        "duplicate_doc_ids": list(metadata.get("duplicate_doc_ids") or []),
+        "text": node.text,
+        "text_chars": len(node.text),
+        "metadata": json.dumps(metadata, ensure_ascii=False, default=str),
+        "payload": json.dumps(point.payload, ensure_ascii=False),
+        "vector": point.vector[vector_name] if vector_name else point.vector
+    }
+
+
+def export_collection_parquet(client: QdrantClient, collection_name: str, path: str, batch_size: int = 1024, extra_metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Stream every chunk of a collection into one Parquet file, returns its file metadata
+
+    Each scroll batch becomes one row group, so memory stays bounded by the
+    batch size whatever the collection size. Rows carry the chunk text, the
+    filterable metadata as columns, the raw payload and the vector as a
+    fixed size float32 list. The file is written atomically.
+    """
+    pa, pq = _pyarrow()
+    vector_name, params = collection_vector_params(client, collection_name)
+    file_metadata = {
+        "format_version": PARQUET_FORMAT_VERSION,
+        "collection": collection_name,
+        "vector_name": vector_name,
+        "size": params.size,
+        "distance": params.distance.value if hasattr(params.distance, "value") else str(params.distance),
+        **(extra_metadata or {})
+    }
+    schema = _schema(pa, params.size).with_metadata({"kb_export": json.dumps(file_metadata)})
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    rows = 0
+    offset = None
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        while True:
+            points, offset = client.scroll(
+                collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=[vector_name] if vector_name else True
+            )
+            if points:
+                batch = [_row(point, vector_name) for point in points]
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                rows += len(batch)
+            if offset is None:
+                break
+    os.replace(tmp_path, path)
+    return {**file_metadata, "points": rows}
+
+
+def read_parquet_metadata(path: str) -> Dict[str, Any]:
+    """The export metadata stored in a Parquet file's schema"""
+    _, pq = _pyarrow()
+    metadata = pq.read_schema(path).metadata or {}
+    if b"kb_export" not in metadata:
+        raise ValueError(f"{path} is not a KB Parquet export")
+    file_metadata = json.loads(metadata[b"kb_export"])
+    if file_metadata.get("format_version") not in READABLE_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported Parquet export version {file_metadata.get('format_version')}")
+    return file_metadata
+
+
+def iter_parquet_points(path: str, batch_size: int = 1024) -> Iterator[List[rest.PointStruct]]:
+    """Batches of Qdrant points stored in a Parquet export"""
+    _, pq = _pyarrow()
+    file_metadata = read_parquet_metadata(path)
+    vector_name = file_metadata.get("vector_name")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=["id", "payload", "vector"]):
+        vectors = batch.column("vector").flatten().to_numpy(zero_copy_only=False).astype(np.float32)
+        vectors = vectors.reshape(len(batch), file_metadata["size"])
+        yield [
+            rest.PointStruct(
+                id=int(point_id) if point_id.isdigit() else point_id,
+                payload=json.loads(payload),
+                vector={vector_name: vector.tolist()} if vector_name else vector.tolist()
+            )
+            for point_id, payload, vector in zip(batch.column("id").to_pylist(), batch.column("payload").to_pylist(), vectors)
+        ]
+
+
+def import_collection_parquet(client: QdrantClient, collection_name: str, path: str, batch_size: int = 1024) -> int:
+    """Create collection_name from a Parquet export and upload its points, returns the point count"""
+    file_metadata = read_parquet_metadata(path)
+    params = rest.VectorParams(size=file_metadata["size"], distance=rest.Distance(file_metadata["distance"]))
+    vector_name = file_metadata.get("vector_name")
+    client.create_collection(collection_name, vectors_config={vector_name: params} if vector_name else params)
+
+    count = 0
+    for points in iter_parquet_points(path, batch_size):
+        client.upsert(collection_name, points=points, wait=True)
+        count += len(points)
+    return count
@@ -0,0 +1,138 @@
+from typing import Any, Dict, Iterator, Optional
+import gzip
+import json
+import os
+import tarfile
+import tempfile
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as rest
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+_POINTS_FILE = "points.jsonl.gz"
+_VECTORS_FILE = "vectors.f32"
+
+
+def collection_vector_params(client: QdrantClient, collection_name: str):
+    """Return (vector name, VectorParams) of a single dense vector collection"""
+    vectors = client.get_collection(collection_name).config.params.vectors
+    if isinstance(vectors, dict):
+        if len(vectors) != 1:
+            raise ValueError(f"Collection {collection_name} has {len(vectors)} dense vectors, expected one")
+        return next(iter(vectors.items()))
+    return None, vectors
+
+
+def dump_collection(client: QdrantClient, collection_name: str, out_dir: str, batch_size: int = 1024) -> Dict[str, Any]:
+    """Write every point of a collection to out_dir, returns the collection's manifest entry
+
+    Payloads go to a gzipped JSON lines file and vectors to one raw float32
+    file in the same order, so restoring is a sequential read with no
+    re-embedding.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    vector_name, params = collection_vector_params(client, collection_name)
+    count = 0
+    offset = None
+
+    with gzip.open(os.path.join(out_dir, _POINTS_FILE), "wt", encoding="utf-8") as points_file, \
+            open(os.path.join(out_dir, _VECTORS_FILE), "wb") as vectors_file:
+        while True:
+            points, offset = client.scroll(
+                collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=[vector_name] if vector_name else True
+            )
+            for point in points:
+                vector = point.vector[vector_name] if vector_name else point.vector
+                points_file.write(json.dumps({"id": point.id, "payload": point.payload}, ensure_ascii=False) + "\n")
+                vectors_file.write(np.asarray(vector, dtype="<f4").tobytes())
+            count += len(points)
+            if offset is None:
+                break
+
+    return {
+        "vector_name": vector_name,
+        "size": params.size,
+        "distance": params.distance.value if hasattr(params.distance, "value") else str(params.distance),
+        "points": count
+    }
+
+
+def _iter_points(in_dir: str, size: int) -> Iterator[tuple]:
+    row_bytes = size * 4
+    with gzip.open(os.path.join(in_dir, _POINTS_FILE), "rt", encoding="utf-8") as points_file, \
+            open(os.path.join(in_dir, _VECTORS_FILE), "rb") as vectors_file:
+        for line in points_file:
+            point = json.loads(line)
+            vector = np.frombuffer(vectors_file.read(row_bytes), dtype="<f4")
+            if len(vector) != size:
+                raise ValueError(f"Snapshot vectors in {in_dir} are truncated")
+            yield point["id"], point["payload"], vector.tolist()
+
+
+def restore_collection(client: QdrantClient, collection_name: str, in_dir: str, entry: Dict[str, Any], batch_size: int = 1024) -> int:
+    """Create collection_name from a dumped collection and upload its points, returns the point count"""
+    params = rest.VectorParams(size=entry["size"], distance=rest.Distance(entry["distance"]))
+    vector_name = entry.get("vector_name")
+    client.create_collection(collection_name, vectors_config={vector_name: params} if vector_name else params)
+
+    count = 0
+    batch = []
+    for point_id, payload, vector in _iter_points(in_dir, entry["size"]):
+        batch.append(rest.PointStruct(
+            id=point_id,
+            payload=payload,
+            vector={vector_name: vector} if vector_name else vector
+        ))
+        if len(batch) >= batch_size:
+            client.upsert(collection_name, points=batch, wait=False)
+            count += len(batch)
+            batch = []
+    if batch:
+        client.upsert(collection_name, points=batch, wait=True)
+        count += len(batch)
+    return count
+
+
+def pack_snapshot(src_dir: str, path: str) -> None:
+    """Pack a snapshot directory into one tar file, written atomically"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with tarfile.open(tmp_path, "w") as tar:
+        for name in sorted(os.listdir(src_dir)):
+            tar.add(os.path.join(src_dir, name), arcname=name)
+    os.replace(tmp_path, path)
+
+
+def unpack_snapshot(path: str, dest_dir: str) -> Dict[str, Any]:
+    """Extract a snapshot tar into dest_dir, returns its validated manifest"""
+    try:
+        with tarfile.open(path, "r") as tar:
+            for member in tar.getmembers():
+                # Snapshots only ever contain plain files and directories under their root
+                if not (member.isfile() or member.isdir()) or member.name.startswith(("/", "..")) or ".." in member.name.split("/"):
+                    raise ValueError(f"Unexpected entry {member.name} in snapshot")
+            tar.extractall(dest_dir)
+    except tarfile.TarError as e:
+        raise ValueError(f"Not a snapshot file: {str(e)}") from e
+
+    manifest_path = os.path.join(dest_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        raise ValueError("Snapshot has no manifest")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version {manifest.get('format_version')}")
+    return manifest
+
+
+def snapshot_workdir(base_dir: Optional[str] = None) -> str:
+    """Scratch directory for building or extracting a snapshot"""
+    if base_dir:
+        os.makedirs(base_dir, exist_ok=True)
+    return tempfile.mkdtemp(prefix="kb_snapshot_", dir=base_dir)
@@ -0,0 +1,141 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as rest
+
+# Payload fields written on every chunk for filtering, with their Qdrant index type
+FILTER_PAYLOAD_INDEXES = {
+    "ref_doc_id": rest.PayloadSchemaType.KEYWORD,
+    "folder_ancestors": rest.PayloadSchemaType.KEYWORD,
+    "doc_type": rest.PayloadSchemaType.KEYWORD,
+    "tags": rest.PayloadSchemaType.KEYWORD,
+    "date_ts": rest.PayloadSchemaType.INTEGER,
+}
+
+# Filter fields a chunk kept in place of its near-duplicates takes over from them
+MERGED_FILTER_KEYS = ("folder_ancestors", "doc_type", "tags", "date_ts")
+
+
+def folder_ancestors(folder_id: Optional[str]) -> List[str]:
+    """Every prefix of a folder path, so a prefix filter is one exact keyword match
+
+    "Finance/2024/Q1" gives ["Finance", "Finance/2024", "Finance/2024/Q1"].
+    """
+    parts = [part for part in (folder_id or "").replace("\\", "/").split("/") if part and part != "."]
+    return ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def date_timestamp(date: Optional[str]) -> Optional[int]:
+    """Epoch seconds of an ISO date or datetime string, None when unparseable"""
+    if not date:
+        return None
+    try:
+        parsed = datetime.fromisoformat(date.strip().replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            parsed = datetime.strptime(date.strip()[:10], "%Y-%m-%d")
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def filter_metadata(doc: Dict[str, Any], duplicates: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    """Filterable payload for a stored document
+
+    Identical files are indexed once, so the chunks also carry the folders of
+    every duplicate copy and match a folder filter on any of them.
+    """
+    ancestors = folder_ancestors(doc.get("folderId"))
+    for duplicate in duplicates:
+        ancestors.extend(a for a in folder_ancestors(duplicate.get("folderId")) if a not in ancestors)
+
+    metadata: Dict[str, Any] = {
+        "folder_ancestors": ancestors,
+        "doc_type": (doc.get("type") or "").upper(),
+        "tags": list(doc.get("tags") or []),
+    }
+    timestamp = date_timestamp(doc.get("date"))
+    if timestamp is not None:
+        metadata["date_ts"] = timestamp
+    return metadata
+
+
+def merge_filter_metadata(metadata: Dict[str, Any], other: Dict[str, Any]) -> None:
+    """Add another chunk's filter fields to a chunk's metadata
+
+    Keyword and integer conditions match a payload array when any element
+    matches, so the merged chunk is found by the filters of either chunk.
+    Values are replaced rather than extended in place, sibling chunks of a
+    document share them.
+    """
+    for key in MERGED_FILTER_KEYS:
+        if other.get(key) in (None, "", []):
+            continue
+        current = metadata.get(key)
+        values = list(current) if isinstance(current, list) else ([] if current in (None, "") else [current])
+        added = other[key] if isinstance(other[key], list) else [other[key]]
+        merged = values + [value for value in dict.fromkeys(added) if value not in values]
+        if len(merged) == len(values):
+            continue
+        metadata[key] = merged if isinstance(current, list) or len(merged) > 1 else merged[0]
+
+
+def _filter_date(name: str, date: Optional[str]) -> Optional[int]:
+    if not date:
+        return None
+    timestamp = date_timestamp(date)
+    if timestamp is None:
+        raise ValueError(f"{name} {date!r} is not an ISO date")
+    return timestamp
+
+
+def build_qdrant_filter(filters) -> Optional[rest.Filter]:
+    """Translate RetrievalFilters into a Qdrant payload filter, None when empty
+
+    Raises ValueError for dates that cannot be parsed rather than ignoring them.
+    """
+    if filters is None:
+        return None
+
+    must: List[Any] = []
+    if filters.folder_prefix:
+        ancestors = folder_ancestors(filters.folder_prefix)
+        if ancestors:
+            must.append(rest.FieldCondition(key="folder_ancestors", match=rest.MatchValue(value=ancestors[-1])))
+    if filters.doc_types:
+        must.append(rest.FieldCondition(
+            key="doc_type",
+            match=rest.MatchAny(any=[doc_type.upper().lstrip(".") for doc_type in filters.doc_types])
+        ))
+    if filters.tags:
+        must.append(rest.FieldCondition(key="tags", match=rest.MatchAny(any=list(filters.tags))))
+    if filters.date_from or filters.date_to:
+        date_from = _filter_date("date_from", filters.date_from)
+        date_to = _filter_date("date_to", filters.date_to)
+        if date_to is not None and len(filters.date_to.strip()) == 10:
+            # A plain date includes the whole day
+            date_to += 24 * 3600 - 1
+        must.append(rest.FieldCondition(key="date_ts", range=rest.Range(
+            gte=date_from,
+            lte=date_to
+        )))
+    return rest.Filter(must=must) if must else None
+
+
+def restrict_to_documents(qdrant_filter: Optional[rest.Filter], ref_doc_ids: List[str]) -> rest.Filter:
+    """Add a condition keeping only chunks split from the given documents to a filter"""
+    condition = rest.FieldCondition(key="ref_doc_id", match=rest.MatchAny(any=list(ref_doc_ids)))
+    if qdrant_filter is None:
+        return rest.Filter(must=[condition])
+    return qdrant_filter.model_copy(update={"must": list(qdrant_filter.must or []) + [condition]})
+
+
+def ensure_payload_indexes(client: QdrantClient, collection_name: str) -> None:
+    """Create the payload indexes filtered retrieval relies on, existing ones are kept"""
+    existing = client.get_collection(collection_name).payload_schema or {}
+    for field_name, schema in FILTER_PAYLOAD_INDEXES.items():
+        if field_name not in existing:
+            client.create_payload_index(collection_name, field_name=field_name, field_schema=schema)
@@ -0,0 +1,158 @@
+from typing import List, Optional, Dict, Any
+import os
+import json
+import gzip
+import hashlib
+import threading
+
+from loguru import logger
+
+# Bump when the cached payload layout or the parsers change in a way that
+# invalidates previously extracted text.
+PARSE_CACHE_VERSION = 1
+
+# Metadata that depends on where a file lives rather than what it contains.
+# These are refreshed from the filesystem on every cache hit.
+PATH_METADATA_KEYS = (
+    "file_path",
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+)
+
+
+def hash_file(path: str, block_size: int = 1024 * 1024) -> str:
+    """Return the sha256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """On-disk cache of parsed file contents keyed by content hash.
+
+    Each entry holds the extracted text and content metadata of every document
+    produced for one file, stored as gzip-compressed JSON. Entries are evicted
+    least-recently-used first once the cache grows beyond ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        base_dir = cache_dir or os.getenv("KB_PARSE_CACHE_DIR", "/storage/.kb_cache/parse")
+        self.cache_dir = os.path.join(base_dir, f"v{PARSE_CACHE_VERSION}")
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv("KB_PARSE_CACHE_MAX_BYTES", str(2 * 1024 ** 3))
+        )
+        self.enabled = self.max_bytes > 0
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+
+        if self.enabled:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._total_bytes = sum(size for _, size, _ in self._iter_entries())
+            except OSError as e:
+                logger.warning(f"Parse cache disabled, cannot use {self.cache_dir}: {str(e)}")
+                self.enabled = False
+
+    def _entry_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, content_hash[:2], f"{content_hash}.json.gz")
+
+    def _iter_entries(self):
+        """Yield (path, size, last_used) for every cache entry"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def get(self, content_hash: str) -> Optional[List[Dict[str, Any]]]:
+        """Return cached documents for a content hash, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(content_hash)
+        try:
+            with open(path, "rb") as f:
+                entries = json.loads(gzip.decompress(f.read()).decode("utf-8"))
+            # Touch the entry so eviction treats it as recently used
+            os.utime(path, None)
+            return entries
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable parse cache entry {path}: {str(e)}")
+            self._remove(path)
+            return None
+
+    def put(self, content_hash: str, entries: List[Dict[str, Any]]) -> None:
+        """Store parsed documents for a content hash"""
+        if not self.enabled:
+            return
+
+        payload = gzip.compress(json.dumps(entries).encode("utf-8"))
+        if len(payload) > self.max_bytes:
+            return
+
+        path = self._entry_path(content_hash)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write parse cache entry {path}: {str(e)}")
+            self._remove(tmp_path)
+            return
+
+        with self._lock:
+            self._total_bytes += len(payload) - previous_size
+            over_limit = self._total_bytes > self.max_bytes
+
+        if over_limit:
+            self._evict()
+
+    def _remove(self, path: str) -> int:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except OSError:
+            return 0
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache is back under 90% of its limit"""
+        with self._lock:
+            entries = sorted(self._iter_entries(), key=lambda entry: entry[2])
+            self._total_bytes = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * 0.9)
+            removed = 0
+            for path, _, _ in entries:
+                if self._total_bytes <= target:
+                    break
+                freed = self._remove(path)
+                self._total_bytes -= freed
+                removed += 1
+        logger.info(f"Parse cache evicted {removed} entries, {self._total_bytes} bytes in use")
+
+
+_default_cache: Optional[ParseCache] = None
+
+
+def get_parse_cache() -> ParseCache:
+    """Return the process-wide parse cache"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ParseCache()
+    return _default_cache
@@ -0,0 +1,47 @@
+from typing import AsyncGenerator, Optional
+import hashlib
+
+
+class ResponseCache:
+    """Caches LLM answers in Redis keyed by model and a hash of the full prompt
+
+    The prompt already contains the retrieved context, conversation history,
+    query and language, so identical keys mean the LLM would get byte-identical
+    input. The cache is off unless a ttl is set, workspaces can then opt out.
+    """
+
+    def __init__(self, redis_client, ttl: int = 0):
+        self.redis_client = redis_client
+        self.ttl = ttl
+
+    def _key(self, model: str, prompt: str) -> str:
+        digest = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+        return f"kb:llm_cache:{digest}"
+
+    def _workspace_key(self, workspace_id: str) -> str:
+        return f"kb:{workspace_id}:llm_cache"
+
+    def is_enabled(self, workspace_id: str) -> bool:
+        if self.ttl <= 0:
+            return False
+        return self.redis_client.get(self._workspace_key(workspace_id)) != "disabled"
+
+    def set_enabled(self, workspace_id: str, enabled: bool) -> None:
+        key = self._workspace_key(workspace_id)
+        if enabled:
+            self.redis_client.delete(key)
+        else:
+            self.redis_client.set(key, "disabled")
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        return self.redis_client.get(self._key(model, prompt))
+
+    def set(self, model: str, prompt: str, answer: str) -> None:
+        if self.ttl > 0 and answer:
+            self.redis_client.set(self._key(model, prompt), answer, ex=self.ttl)
+
+
+async def replay_answer(answer: str, chunk_chars: int = 16) -> AsyncGenerator[str, None]:
+    """Yield a cached answer in small pieces so it can be sent like a live stream"""
+    for start in range(0, len(answer), chunk_chars):
+        yield answer[start:start + chunk_chars]
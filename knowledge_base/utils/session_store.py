@@ -0,0 +1,70 @@
+from typing import Any, Dict, Optional
+import json
+
+
+class RedisSessionStore:
+    """Streaming answer sessions kept in Redis so any worker can resume them
+
+    A session is a hash with the request and completion flag plus a list of
+    content chunks, so appending is a single RPUSH. Both keys share a hash tag
+    to live in the same cluster slot and expire after ``ttl`` seconds without
+    writes.
+    """
+
+    def __init__(self, redis_client, ttl: int = 1800):
+        self.redis_client = redis_client
+        self.ttl = ttl
+
+    def _meta_key(self, message_id: str) -> str:
+        return f"kb:stream:{{{message_id}}}:meta"
+
+    def _chunks_key(self, message_id: str) -> str:
+        return f"kb:stream:{{{message_id}}}:chunks"
+
+    def create(self, message_id: str, message_data: Dict[str, Any]) -> None:
+        meta_key = self._meta_key(message_id)
+        chunks_key = self._chunks_key(message_id)
+
+        pipe = self.redis_client.pipeline()
+        pipe.delete(meta_key, chunks_key)
+        pipe.hset(meta_key, mapping={
+            "query": json.dumps(message_data.get("query", {}), default=str),
+            "is_complete": int(bool(message_data.get("is_complete", False)))
+        })
+        initial_content = message_data.get("current_content")
+        if initial_content:
+            pipe.rpush(chunks_key, initial_content)
+            pipe.expire(chunks_key, self.ttl)
+        pipe.expire(meta_key, self.ttl)
+        pipe.execute()
+
+    def append(self, message_id: str, content: str) -> int:
+        """Append a content chunk, returns the number of chunks stored"""
+        chunks_key = self._chunks_key(message_id)
+        pipe = self.redis_client.pipeline()
+        pipe.rpush(chunks_key, content)
+        pipe.expire(chunks_key, self.ttl)
+        pipe.expire(self._meta_key(message_id), self.ttl)
+        return pipe.execute()[0]
+
+    def complete(self, message_id: str) -> None:
+        meta_key = self._meta_key(message_id)
+        if self.redis_client.exists(meta_key):
+            self.redis_client.hset(meta_key, "is_complete", 1)
+
+    def get(self, message_id: str, offset: int = 0) -> Optional[Dict[str, Any]]:
+        """Return the session with the content of chunks from offset onwards"""
+        meta = self.redis_client.hgetall(self._meta_key(message_id))
+        if not meta:
+            return None
+
+        chunks = self.redis_client.lrange(self._chunks_key(message_id), offset, -1)
+        return {
+            "query": json.loads(meta.get("query") or "{}"),
+            "current_content": "".join(chunks),
+            "chunk_count": offset + len(chunks),
+            "is_complete": meta.get("is_complete") == "1"
+        }
+
+    def delete(self, message_id: str) -> None:
+        self.redis_client.delete(self._meta_key(message_id), self._chunks_key(message_id))
@@ -0,0 +1,47 @@
+from typing import List, Optional
+import time
+
+
+class TokenCoalescer:
+    """Accumulates streamed tokens into frames bounded by size and time
+
+    Tokens are kept in a list and only joined when a frame is flushed, which
+    happens once ``max_chars`` characters are buffered or ``max_delay`` seconds
+    have passed since the first buffered token.
+    """
+
+    def __init__(self, max_chars: int = 32, max_delay: float = 0.05):
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self._parts: List[str] = []
+        self._size = 0
+        self._first_at: Optional[float] = None
+
+    def add(self, token: str) -> Optional[str]:
+        """Buffer a token, returns a frame if the window is full"""
+        if not token:
+            return None
+        if self._first_at is None:
+            self._first_at = time.monotonic()
+        self._parts.append(token)
+        self._size += len(token)
+
+        if self._size >= self.max_chars or self.time_left() == 0:
+            return self.flush()
+        return None
+
+    def time_left(self) -> Optional[float]:
+        """Seconds until the buffered frame is due, None when nothing is buffered"""
+        if self._first_at is None:
+            return None
+        return max(0.0, self.max_delay - (time.monotonic() - self._first_at))
+
+    def flush(self) -> Optional[str]:
+        """Return the buffered tokens as one frame and reset the buffer"""
+        if not self._parts:
+            return None
+        frame = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        self._first_at = None
+        return frame
@@ -0,0 +1,167 @@
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import time
+
+from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+try:
+    from opentelemetry import trace as otel_trace # type: ignore
+except ImportError:
+    otel_trace = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+SPAN_DURATION = Histogram(
+    "kb_span_duration_seconds",
+    "Duration of traced knowledge base operations",
+    ["span"],
+    buckets=LATENCY_BUCKETS
+)
+SPAN_ERRORS = Counter(
+    "kb_span_errors_total",
+    "Traced knowledge base operations that raised",
+    ["span"]
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "kb_http_request_duration_seconds",
+    "HTTP request latency until the response starts",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+STARTUP_DURATION = Gauge(
+    "kb_startup_seconds",
+    "Time spent in each startup phase",
+    ["phase"]
+)
+
+# Requests slower than this (milliseconds) log their span breakdown at INFO, others at DEBUG
+TRACE_SLOW_MS = float(os.getenv("KB_TRACE_SLOW_MS", "1000"))
+
+# Spans finished within the current request, as (name, seconds, attributes)
+_request_spans: ContextVar[Optional[List[Tuple[str, float, Dict[str, Any]]]]] = ContextVar("kb_request_spans", default=None)
+_tracer = otel_trace.get_tracer("knowledge_base") if otel_trace else None
+
+
+def setup_tracing() -> None:
+    """Export OpenTelemetry spans when the SDK is installed and an exporter is configured
+
+    OTEL_EXPORTER_OTLP_ENDPOINT sends spans to a collector over OTLP and
+    KB_TRACE_CONSOLE=1 prints them. Without either, spans only feed the
+    Prometheus histograms and the per-request log line.
+    """
+    if otel_trace is None:
+        return
+    endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    console = os.getenv("KB_TRACE_CONSOLE", "0") == "1"
+    if not endpoint and not console:
+        return
+
+    try:
+        from opentelemetry.sdk.resources import Resource # type: ignore
+        from opentelemetry.sdk.trace import TracerProvider # type: ignore
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter # type: ignore
+    except ImportError:
+        logger.warning("opentelemetry-sdk is not installed, spans will not be exported")
+        return
+
+    provider = TracerProvider(resource=Resource.create({
+        "service.name": os.getenv("OTEL_SERVICE_NAME", "knowledge-base")
+    }))
+    if endpoint:
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter # type: ignore
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        except ImportError:
+            logger.warning("opentelemetry-exporter-otlp is not installed, not exporting to the collector")
+    if console:
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    otel_trace.set_tracer_provider(provider)
+    logger.info(f"Exporting traces{' to ' + endpoint if endpoint else ''}{' and to the console' if console else ''}")
+
+
+def _otel_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        f"kb.{key}": value if isinstance(value, (str, bool, int, float)) else str(value)
+        for key, value in attributes.items() if value is not None
+    }
+
+
+def _finish(name: str, seconds: float, attributes: Dict[str, Any]) -> None:
+    SPAN_DURATION.labels(span=name).observe(seconds)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, seconds, attributes))
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a span of the current request"""
+    started = time.perf_counter()
+    otel_span = _tracer.start_as_current_span(name, attributes=_otel_attributes(attributes)) if _tracer else nullcontext()
+    with otel_span:
+        try:
+            yield
+        except BaseException:
+            SPAN_ERRORS.labels(span=name).inc()
+            raise
+        finally:
+            _finish(name, time.perf_counter() - started, attributes)
+
+
+def record_span(name: str, started: float, **attributes) -> None:
+    """Record a span measured by hand from a time.perf_counter() start
+
+    For timings that cross yields of an async generator, where a context
+    manager would be entered and exited in different contexts.
+    """
+    seconds = time.perf_counter() - started
+    if _tracer:
+        end_ns = time.time_ns()
+        otel_span = _tracer.start_span(
+            name,
+            start_time=end_ns - int(seconds * 1e9),
+            attributes=_otel_attributes(attributes)
+        )
+        otel_span.end(end_time=end_ns)
+    _finish(name, seconds, attributes)
+
+
+@contextmanager
+def trace_request(name: str, **attributes):
+    """Root span of a request, logs how long each of its spans took when it ends"""
+    spans: List[Tuple[str, float, Dict[str, Any]]] = []
+    token = _request_spans.set(spans)
+    started = time.perf_counter()
+    try:
+        with span(name, **attributes):
+            yield
+    finally:
+        _request_spans.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+        breakdown = ", ".join(
+            f"{span_name}{'[' + str(span_attrs['kb_id']) + ']' if 'kb_id' in span_attrs else ''}={seconds * 1000:.1f}ms"
+            for span_name, seconds, span_attrs in spans if span_name != name
+        )
+        level = "INFO" if total_ms >= TRACE_SLOW_MS else "DEBUG"
+        logger.log(level, f"Trace {name} took {total_ms:.1f}ms: {breakdown}")
+
+
+def record_startup(phase: str, seconds: float) -> None:
+    """Record how long a startup phase took"""
+    STARTUP_DURATION.labels(phase=phase).set(seconds)
+
+
+def startup_report() -> Dict[str, float]:
+    """Seconds spent in each recorded startup phase"""
+    return {
+        sample.labels["phase"]: round(sample.value, 3)
+        for metric in STARTUP_DURATION.collect() for sample in metric.samples
+    }
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """Prometheus exposition of all registered metrics and its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,156 @@
+from typing import Any, AsyncIterator, Dict, Optional
+import asyncio
+import json
+import os
+import time
+import uuid
+
+
+class UploadError(Exception):
+    """Raised for an upload request that cannot be applied, with the HTTP status to report"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def safe_relative_path(folder: Optional[str], filename: str) -> str:
+    """Join a folder and file name into a path that cannot leave the KB directory"""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise UploadError(400, f"Invalid file name {filename!r}")
+    parts = [part for part in (folder or "").replace("\\", "/").split("/") if part and part != "."]
+    if ".." in parts:
+        raise UploadError(400, f"Invalid folder {folder!r}")
+    return "/".join(parts + [name])
+
+
+class UploadStore:
+    """Resumable uploads spooled to disk chunk by chunk
+
+    The upload's metadata lives in Redis and expires ``ttl`` seconds after the
+    last write, the bytes are appended to a staging file so an upload never
+    has to fit in memory. The staging file's size is the committed offset:
+    a chunk cut off by a dropped connection is kept up to where it stopped
+    and the client resumes from the offset reported by get().
+    """
+
+    def __init__(self, redis_client, upload_dir: str, ttl: int = 86400, max_bytes: int = 1024 ** 3):
+        self.redis_client = redis_client
+        self.upload_dir = upload_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # Uploads with a chunk being written by this worker
+        self._writing = set()
+
+    def _key(self, upload_id: str) -> str:
+        return f"kb:upload:{{{upload_id}}}"
+
+    def _kb_key(self, workspace_id: str, kb_id: str) -> str:
+        """Set of the ids of a KB's uploads, so they can be removed with the KB"""
+        return f"kb:{workspace_id}:{kb_id}:uploads"
+
+    def staging_path(self, upload_id: str) -> str:
+        return os.path.join(self.upload_dir, f"{upload_id}.part")
+
+    def _save(self, upload: Dict[str, Any]) -> None:
+        self.redis_client.set(self._key(upload["id"]), json.dumps(upload), ex=self.ttl)
+
+    def create(self, workspace_id: str, kb_id: str, filename: str, folder: Optional[str] = None, size: Optional[int] = None) -> Dict[str, Any]:
+        relative_path = safe_relative_path(folder, filename)
+        if size is not None and (size < 0 or size > self.max_bytes):
+            raise UploadError(413, f"Uploads are limited to {self.max_bytes} bytes")
+
+        os.makedirs(self.upload_dir, exist_ok=True)
+        upload = {
+            "id": uuid.uuid4().hex,
+            "workspace_id": workspace_id,
+            "kb_id": kb_id,
+            "path": relative_path,
+            "size": size,
+            "status": "uploading",
+            "created_at": time.time()
+        }
+        open(self.staging_path(upload["id"]), "wb").close()
+        self._save(upload)
+        kb_key = self._kb_key(workspace_id, kb_id)
+        self.redis_client.sadd(kb_key, upload["id"])
+        self.redis_client.expire(kb_key, self.ttl)
+        return {**upload, "offset": 0}
+
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        upload = self.redis_client.get(self._key(upload_id))
+        if not upload:
+            return None
+        upload = json.loads(upload)
+        path = self.staging_path(upload_id)
+        # Once complete the staging file is moved into the KB and the size is final
+        upload["offset"] = os.path.getsize(path) if os.path.exists(path) else upload["size"] or 0
+        return upload
+
+    def update(self, upload_id: str, **fields) -> None:
+        upload = self.get(upload_id)
+        if upload is not None:
+            upload.pop("offset", None)
+            upload.update(fields)
+            self._save(upload)
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """Append a streamed body at offset, returns the new offset"""
+        upload = self.get(upload_id)
+        if upload is None:
+            raise UploadError(404, "Upload not found")
+        if upload["status"] != "uploading":
+            raise UploadError(409, f"Upload is {upload['status']}")
+        if upload_id in self._writing:
+            raise UploadError(409, "Another chunk of this upload is being written")
+        if offset != upload["offset"]:
+            raise UploadError(409, f"Upload is at offset {upload['offset']}, not {offset}")
+
+        limit = upload["size"] if upload["size"] is not None else self.max_bytes
+        self._writing.add(upload_id)
+        try:
+            with open(self.staging_path(upload_id), "ab") as f:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if offset + len(chunk) > limit:
+                        raise UploadError(413, f"Upload exceeds its size of {limit} bytes")
+                    await asyncio.to_thread(f.write, chunk)
+                    offset += len(chunk)
+        finally:
+            self._writing.discard(upload_id)
+            # Any write refreshes the expiry
+            self.redis_client.expire(self._key(upload_id), self.ttl)
+        return offset
+
+    def delete(self, upload_id: str) -> None:
+        upload = self.get(upload_id)
+        if upload is not None:
+            self.redis_client.srem(self._kb_key(upload["workspace_id"], upload["kb_id"]), upload_id)
+        self.redis_client.delete(self._key(upload_id))
+        try:
+            os.remove(self.staging_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def delete_for_kb(self, workspace_id: str, kb_id: str) -> int:
+        """Remove every upload into a KB with its staging file, returns how many there were"""
+        kb_key = self._kb_key(workspace_id, kb_id)
+        upload_ids = list(self.redis_client.smembers(kb_key))
+        for upload_id in upload_ids:
+            self.delete(upload_id)
+        self.redis_client.delete(kb_key)
+        return len(upload_ids)
+
+    def purge_expired(self) -> int:
+        """Remove staging files whose upload has expired, returns how many were removed"""
+        if not os.path.isdir(self.upload_dir):
+            return 0
+        removed = 0
+        for name in os.listdir(self.upload_dir):
+            if name.endswith(".part") and not self.redis_client.exists(self._key(name[:-len(".part")])):
+                os.remove(os.path.join(self.upload_dir, name))
+                removed += 1
+        return removed